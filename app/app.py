@@ -2,18 +2,12 @@
 import sys
 import os
 import re
-import time
-import subprocess
 from pathlib import Path
 
 import streamlit as st
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
 
 # =========================================================
 # パス解決（このファイルの位置を基点に、プロジェクトルート＆scripts を解決）
@@ -22,26 +16,24 @@ APP_DIR = Path(__file__).resolve().parent                # .../project/app
 PROJECT_ROOT = APP_DIR.parent                            # .../project
 SCRIPTS_DIR = (PROJECT_ROOT / "scripts").resolve()       # .../project/scripts
 OUT_DIR = (PROJECT_ROOT / "out").resolve()               # 出力はプロジェクト直下 out/
+TRACE_DIR = OUT_DIR / "traces"                           # 操作ごとの所要時間（Chrome trace 形式）
 
 def py(script_name: str) -> list[str]:
     """実行中の Python で scripts/<script_name> を呼ぶ引数リストを返す"""
     return [sys.executable, str(SCRIPTS_DIR / script_name)]
 
 # =========================================================
-# Selenium driver 共通
+# Selenium driver 共通（scripts/kaggle_browser.py の軽量プロファイルを共用）
 # =========================================================
-def build_driver(headless: bool = True):
-    opt = webdriver.ChromeOptions()
-    if headless:
-        opt.add_argument("--headless=new")
-    opt.add_argument("--no-sandbox")
-    opt.add_argument("--disable-dev-shm-usage")
-    opt.add_argument("--window-size=1920,1080")
-    opt.add_argument(
-        "--user-agent=Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
-        "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-    )
-    return webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=opt)
+if str(SCRIPTS_DIR) not in sys.path:
+    sys.path.insert(0, str(SCRIPTS_DIR))
+from kaggle_browser import build_driver, open_page, scroll_until_stable  # noqa: E402
+from discussion_scraper import parse_discussion_list  # noqa: E402
+from artifact_index import get_index  # noqa: E402
+from search_index import get_search_index  # noqa: E402
+from tracing import list_runs, load_run, span, summarize, trace_run  # noqa: E402
+from job_coordinator import Busy, get_coordinator  # noqa: E402
+import blob_store  # noqa: E402
 
 def normalize_comp_url(inp: str) -> str:
     url = inp.strip().rstrip("/")
@@ -64,42 +56,46 @@ def normalize_kernel_slug(url: str) -> str:
 # =========================================================
 # Discussion 一覧取得（一覧URLは /competitions/<slug>/discussion に正規化して使う）
 # =========================================================
+def run_job(key: str, kind: str, fn, status=None, weight: int = 1, still_needed=None):
+    """
+    重い処理は job_coordinator 経由で実行（全セッション共通）。
+    同じ処理が他セッションで実行中なら相乗りし、上限を超える分は空きを待つ。混雑時は None
+    """
+    try:
+        result, shared = get_coordinator().run(key, kind, fn, weight=weight, still_needed=still_needed)
+    except Busy as e:
+        st.warning(f"混雑しているため実行できませんでした（{e}）。しばらくしてからもう一度お試しください。")
+        return None
+    if shared and status is not None:
+        status.write("他のセッションで実行中だった同じ処理の完了を待ち、その結果を使いました。")
+    return result
+
 def fetch_discussion_list(comp_base_url: str, page: int = 1, max_items: int = 30):
+    return run_job(f"list:{comp_base_url}:{page}:{max_items}", "browser",
+                   lambda: _fetch_discussion_list(comp_base_url, page, max_items)) or []
+
+def _fetch_discussion_list(comp_base_url: str, page: int, max_items: int):
     list_url = f"{comp_base_url}/discussion"
     if page > 1:
         list_url += f"?page={page}"
 
-    d = build_driver(headless=True)
-    threads = []
-    try:
-        d.get(list_url)
-        WebDriverWait(d, 15).until(
-            EC.presence_of_all_elements_located((By.CSS_SELECTOR, "a[href*='/discussion/']"))
-        )
-        # 軽くスクロール
-        for _ in range(3):
-            d.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(0.3)
-
-        soup = BeautifulSoup(d.page_source, "html.parser")
-        seen = set()
-        for a in soup.select("a[href*='/discussion/']"):
-            href = a.get("href", "")
-            if not re.search(r"/discussion/\d+/?$", href):
-                continue
-            full = "https://www.kaggle.com" + href if href.startswith("/") else href
-            if full in seen:
-                continue
-            title = a.get_text(strip=True) or full.rsplit("/", 1)[-1]
-            if re.fullmatch(r"comments?", title, flags=re.IGNORECASE):
-                continue
-            threads.append({"title": title, "url": full})
-            seen.add(full)
-            if len(threads) >= max_items:
-                break
-    finally:
-        d.quit()
-    return threads
+    with trace_run(f"discussion list p{page}", TRACE_DIR):
+        d = build_driver(headless=True)
+        try:
+            open_page(d, list_url, css="a[href*='/discussion/']", timeout=15)
+            with span("WebDriverWait", "browser"):
+                WebDriverWait(d, 1).until(
+                    EC.presence_of_all_elements_located((By.CSS_SELECTOR, "a[href*='/discussion/']"))
+                )
+            # 軽くスクロール（DOM が落ち着いたら次へ）
+            scroll_until_stable(d, tries=3)
+
+            html = d.page_source
+        finally:
+            with span("driver.quit", "browser"):
+                d.quit()
+    # 一覧の解析は scraper と共通（votes / comments / last_activity も付く）
+    return parse_discussion_list(html, max_items=max_items)
 
 def discussion_id_from_url(url: str) -> str:
     """.../discussion/<id> -> <id>"""
@@ -124,28 +120,31 @@ url_in = st.text_input(
     help="overview / data / rules / discussion どれでもOK（自動でベースURLに正規化）"
 )
 comp_base = normalize_comp_url(url_in)
+# コンペごとに out/<slug>/ へ保存（別セッションが別のコンペを取得しても overview.md などがぶつからない）
+comp_dir = OUT_DIR / normalize_slug(comp_base)
 
 # ===== タブ構成 =====
 tabs = st.tabs([
     "Overview", "Data", "Rules",
     "Discussion",
     "Notebook/Course (iframe)",
-    "My Notebook (API)"
+    "My Notebook (API)",
+    "Search",
 ])
 
 # ---------- Overview / Data / Rules ----------
 def show_md_pair(basename: str, tab):
-    en = OUT_DIR / f"{basename}.md"
-    ja = OUT_DIR / f"{basename}.ja.md"
+    en = comp_dir / f"{basename}.md"
+    ja = comp_dir / f"{basename}.ja.md"
     with tab:
         col1, col2 = st.columns(2)
         with col1:
             st.subheader(f"{basename}.md (EN)")
-            if en.exists(): st.markdown(en.read_text(encoding="utf-8"))
+            if blob_store.exists(en): st.markdown(blob_store.read_text(en))
             else: st.info("まだ生成されていません。")
         with col2:
             st.subheader(f"{basename}.ja.md (JA)")
-            if ja.exists(): st.markdown(ja.read_text(encoding="utf-8"))
+            if blob_store.exists(ja): st.markdown(blob_store.read_text(ja))
             else: st.info("まだ翻訳されていません。")
 
 with st.sidebar:
@@ -154,15 +153,39 @@ with st.sidebar:
     os.environ.setdefault("GOOGLE_API_KEY", "")
     st.checkbox("API Key 設定済み", value=bool(os.getenv("GOOGLE_API_KEY")), disabled=True)
 
+    # 全セッション共通の実行状況（job_coordinator）
+    slots = get_coordinator().status()["slots"]
+    st.caption("実行中: " + " / ".join(f"{k} {v['in_use']}/{v['capacity']}" + (f"（待ち {v['waiting']}）" if v["waiting"] else "")
+                                     for k, v in slots.items()))
+
+    # 直近の操作の所要時間（out/traces/*.json を集計。JSON は https://ui.perfetto.dev で開ける）
+    with st.expander("⏱ 直近の実行時間", expanded=False):
+        runs = list_runs(TRACE_DIR)[:5]
+        if not runs:
+            st.caption("まだ記録がありません。")
+        for i, tp in enumerate(runs):
+            doc = load_run(tp)
+            summ = summarize(doc)
+            st.markdown(f"**{doc.get('metadata', {}).get('label') or tp.stem}** — {summ['wall_ms'] / 1000:.1f}s")
+            st.dataframe(
+                [{"span": r["name"], "n": r["count"], "total ms": r["total_ms"], "max ms": r["max_ms"]}
+                 for r in summ["rows"] if r["cat"] != "process"][:8],
+                hide_index=True, use_container_width=True,
+            )
+            st.download_button("trace JSON", tp.read_bytes(), file_name=tp.name, mime="application/json",
+                               key=f"trace_dl_{i}")
+
 if run_tabs:
     if not os.getenv("GOOGLE_API_KEY"):
         st.error("環境変数 GOOGLE_API_KEY が未設定です。`export GOOGLE_API_KEY=...` を実行してください。")
     else:
-        with st.status("Fetching English Markdown ...", expanded=True) as s:
-            s.write("saving overview/data/rules ...")
-            subprocess.run(py("save_kaggle_comp_markdown.py") + ["--url", comp_base, "--out", str(OUT_DIR)], check=True)
-            s.update(label="Translating with Gemini ...")
-            subprocess.run(py("translate_markdown_with_gemini.py") + ["--in", str(OUT_DIR), "--glob", "*.md"], check=True)
+        with st.status("Fetching & translating ...", expanded=True) as s, trace_run("competition tabs", TRACE_DIR) as tr:
+            # 保存できたタブから順に翻訳（この実行で取得した overview/data/rules だけを訳す）
+            s.write("saving overview/data/rules → translating each as soon as it is saved ...")
+            # pipeline.py は既定で最大 3 ブラウザを使うので 3 枠ぶん確保
+            run_job(f"pipeline:{comp_base}", "browser",
+                    lambda: tr.run(py("pipeline.py") + ["--url", comp_base, "--out", str(comp_dir)], check=True),
+                    status=s, weight=3)
             s.update(label="Done!")
 
 # EN/JA 表示（コンペ）
@@ -170,6 +193,33 @@ show_md_pair("overview", tabs[0])
 show_md_pair("data", tabs[1])
 show_md_pair("rules", tabs[2])
 
+# ---------- Search（out/ 以下の英日 .md を全文検索） ----------
+# Discussion タブは一覧が空だと st.stop() するので、その前に描画しておく
+with tabs[6]:
+    st.subheader("Search — 取得・翻訳済みの文書を全文検索")
+    sidx = get_search_index()
+    # 外で書き換えられたファイルはセッション開始時に 1 回だけ拾う（以降は取得・翻訳時に自動反映）
+    if "search_synced" not in st.session_state or st.button("索引を更新"):
+        st.session_state.search_synced = sidx.sync(OUT_DIR)
+    col_q, col_lang = st.columns([4, 1])
+    with col_q:
+        query = st.text_input("検索語", "", placeholder="例: 欠損値 / leakage")
+    with col_lang:
+        lang_opt = st.selectbox("言語", ["all", "ja", "en"], index=0)
+    st.caption(f"{sidx.count()} 件を索引済み")
+    if query.strip():
+        hits = sidx.search(query, limit=30, lang=None if lang_opt == "all" else lang_opt)
+        if not hits:
+            st.info("見つかりませんでした。")
+        for h in hits:
+            rel = Path(h["path"]).relative_to(OUT_DIR) if Path(h["path"]).is_relative_to(OUT_DIR) else h["path"]
+            st.markdown(f"**{h['title']}**  `{rel}` ({h['lang']})")
+            st.markdown(h["snippet"], unsafe_allow_html=True)
+            with st.expander("本文を表示"):
+                doc = Path(h["path"])
+                if blob_store.exists(doc): st.markdown(blob_store.read_text(doc))
+                else: st.info("ファイルが見つかりません（索引を更新してください）。")
+
 # ---------- Discussion（左：スレ一覧／右：選択スレの日本語訳を自動表示） ----------
 with tabs[3]:
     st.subheader("Discussion — スレ選択で右に日本語訳を表示")
@@ -205,9 +255,12 @@ with tabs[3]:
             st.info("スレッドが見つかりませんでした。")
             st.stop()
 
-        # ラベル（タイトル）と値（URL）の radio
-        labels = [f"{i+1}. {t['title']}" for i, t in enumerate(threads)]
+        # ラベル（タイトル）と値（URL）の radio。翻訳済み（原文から変わっていない）スレには ✅
         urls = [t["url"] for t in threads]
+        en_paths = [out_discussion / f"discussion_{discussion_id_from_url(u)}.md" for u in urls]
+        translated = get_index().translated_paths(en_paths)
+        labels = [f"{'✅ ' if translated.get(str(p.resolve())) else ''}{i+1}. {t['title']}"
+                  for i, (t, p) in enumerate(zip(threads, en_paths))]
 
         # 現在の選択を維持
         default_index = 0
@@ -237,20 +290,23 @@ with tabs[3]:
         en_md = out_discussion / f"discussion_{disc_id}.md"
         ja_md = out_discussion / f"discussion_{disc_id}.ja.md"
 
-        need_scrape = not en_md.exists()
-        need_translate = force_retranslate or (not ja_md.exists())
+        # 要否は索引で判定（翻訳は原文が変わっていれば古いとみなす）
+        idx = get_index()
+        need_scrape = not idx.has(en_md)
+        need_translate = force_retranslate or need_scrape or idx.translation_stale(en_md)
 
         # 2) 取得＆翻訳（必要に応じて）
-        with st.status("Loading selected discussion ...", expanded=False) as s:
+        with st.status("Loading selected discussion ...", expanded=False) as s, \
+                trace_run(f"discussion {disc_id}", TRACE_DIR) as tr:
             if need_scrape:
                 s.write("Fetching English markdown ...")
-                subprocess.run(
+                run_job(f"scrape:{selected_url}", "browser", lambda: tr.run(
                     py("discussion_scraper.py") + [
                         "--thread", selected_url,
                         "--out", str(out_discussion)
                     ],
                     check=True
-                )
+                ), status=s, still_needed=lambda: not idx.has(en_md))
 
             if not os.getenv("GOOGLE_API_KEY"):
                 if need_translate:
@@ -258,21 +314,22 @@ with tabs[3]:
             else:
                 if need_translate:
                     s.write("Translating to Japanese with Gemini ...")
-                    subprocess.run(
+                    # 同じスレッドの翻訳は 1 回だけ（他セッション / 他プロセスが訳し終えていれば呼ばない）
+                    run_job(f"translate:{en_md}", "translate", lambda: tr.run(
                         py("translate_markdown_with_gemini.py") + [
                             "--in", str(out_discussion),
                             "--glob", f"discussion_{disc_id}.md"
-                        ],
+                        ] + (["--force"] if force_retranslate else []),
                         check=True
-                    )
+                    ), status=s, still_needed=lambda: force_retranslate or idx.translation_stale(en_md))
             s.update(label="Done!")
 
         # 3) 表示（優先：日本語、なければ英語）
-        if ja_md.exists():
-            st.markdown(ja_md.read_text(encoding="utf-8"))
-        elif en_md.exists():
+        if blob_store.exists(ja_md):
+            st.markdown(blob_store.read_text(ja_md))
+        elif blob_store.exists(en_md):
             st.info("日本語訳が無いため英語を表示しています。")
-            st.markdown(en_md.read_text(encoding="utf-8"))
+            st.markdown(blob_store.read_text(en_md))
         else:
             st.error("本文の取得に失敗しました。")
 
@@ -284,11 +341,11 @@ def show_course_md_pair(slug: str, tab):
         col1, col2 = st.columns(2)
         with col1:
             st.subheader(f"{slug}.md (EN)")
-            if en.exists(): st.markdown(en.read_text(encoding="utf-8"))
+            if blob_store.exists(en): st.markdown(blob_store.read_text(en))
             else: st.info("まだ生成されていません。")
         with col2:
             st.subheader(f"{slug}.ja.md (JA)")
-            if ja.exists(): st.markdown(ja.read_text(encoding="utf-8"))
+            if blob_store.exists(ja): st.markdown(blob_store.read_text(ja))
             else: st.info("まだ翻訳されていません。")
 
 with tabs[4]:
@@ -309,23 +366,23 @@ with tabs[4]:
         st.write(f"保存先: `out/course/{nb_slug}.md` / `out/course/{nb_slug}.ja.md`")
 
     if fetch_nb:
-        with st.status("Fetching notebook markdown ...", expanded=True) as s:
+        with st.status("Fetching notebook markdown ...", expanded=True) as s, trace_run("course fetch", TRACE_DIR) as tr:
             s.write("Saving EN markdown ...")
-            subprocess.run(
+            run_job(f"course:{nb_url}", "browser", lambda: tr.run(
                 py("save_kaggle_course_markdown.py") + ["--url", nb_url, "--out", str(out_course)],
                 check=True
-            )
+            ), status=s)
             s.update(label="Done!")
 
     if translate_nb:
         if not os.getenv("GOOGLE_API_KEY"):
             st.error("環境変数 GOOGLE_API_KEY が未設定です。`export GOOGLE_API_KEY=...` を実行してください。")
         else:
-            with st.status("Translating with Gemini ...", expanded=True) as s:
-                subprocess.run(
+            with st.status("Translating with Gemini ...", expanded=True) as s, trace_run("course translate", TRACE_DIR) as tr:
+                run_job(f"translate:{out_course / nb_slug}", "translate", lambda: tr.run(
                     py("translate_markdown_with_gemini.py") + ["--in", str(out_course), "--glob", f"{nb_slug}.md"],
                     check=True
-                )
+                ), status=s)
                 s.update(label="Done!")
 
     show_course_md_pair(nb_slug, tabs[4])
@@ -338,11 +395,11 @@ def show_kernel_md_pair(slug: str, tab):
         col1, col2 = st.columns(2)
         with col1:
             st.subheader(f"{slug}.md (EN)")
-            if en.exists(): st.markdown(en.read_text(encoding="utf-8"))
+            if blob_store.exists(en): st.markdown(blob_store.read_text(en))
             else: st.info("まだ生成されていません。")
         with col2:
             st.subheader(f"{slug}.ja.md (JA)")
-            if ja.exists(): st.markdown(ja.read_text(encoding="utf-8"))
+            if blob_store.exists(ja): st.markdown(blob_store.read_text(ja))
             else: st.info("まだ翻訳されていません。")
 
 with tabs[5]:
@@ -378,23 +435,27 @@ with tabs[5]:
 
     if fetch_kernel:
         out_kernel.mkdir(parents=True, exist_ok=True)
-        with st.status("Pulling kernel via Kaggle API ...", expanded=True) as s:
+        with st.status("Pulling kernel via Kaggle API ...", expanded=True) as s, trace_run("kernel pull", TRACE_DIR) as tr:
             cmd = py("pull_kernel_to_markdown.py") + ["--url", api_url, "--out", str(out_kernel)]
             if include_outputs:
                 cmd.append("--include-outputs")
             s.write("Running: " + " ".join(cmd))
-            subprocess.run(cmd, check=True)
+            run_job(f"kernel:{api_url}:{include_outputs}", "api", lambda: tr.run(cmd, check=True), status=s)
             s.update(label="Done!")
 
     if translate_kernel:
         if not os.getenv("GOOGLE_API_KEY"):
             st.error("環境変数 GOOGLE_API_KEY が未設定です。`export GOOGLE_API_KEY=...` を実行してください。")
         else:
-            with st.status("Translating with Gemini ...", expanded=True) as s:
-                subprocess.run(
-                    py("translate_markdown_with_gemini.py") + ["--in", str(out_kernel), "--glob", f"{api_slug}.md"],
-                    check=True
-                )
+            with st.status("Translating with Gemini ...", expanded=True) as s, trace_run("kernel translate", TRACE_DIR) as tr:
+                if blob_store.exists(out_kernel / f"{api_slug}.ipynb"):
+                    # Markdown セルだけを訳す（セル単位キャッシュで変更分のみ再翻訳）
+                    cmd = py("translate_notebook_with_gemini.py") + ["--in", str(out_kernel), "--glob", f"{api_slug}.ipynb"]
+                    if include_outputs:
+                        cmd.append("--include-outputs")
+                else:
+                    cmd = py("translate_markdown_with_gemini.py") + ["--in", str(out_kernel), "--glob", f"{api_slug}.md"]
+                run_job(f"translate:{out_kernel / api_slug}", "translate", lambda: tr.run(cmd, check=True), status=s)
                 s.update(label="Done!")
 
     show_kernel_md_pair(api_slug, tabs[5])
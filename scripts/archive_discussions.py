@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Kaggle Discussion 全件アーカイブ（差分更新）
+- 一覧ページを最後まで巡回し、スレッドのメタデータ（id/title/votes/comments/last_activity）を記録
+- 新規スレッド、または comments / last_activity が前回から変わったスレッドだけ本文を再取得
+- 本文取得は DriverPool の複数セッションで並列。--tabs N なら Chrome 1 つのタブ N 個で並列（cdp_tabs）
+Usage:
+  python3 archive_discussions.py --comp titanic --out out/discussion
+  python3 archive_discussions.py --comp https://www.kaggle.com/competitions/titanic --workers 3 --max-pages 50
+  python3 archive_discussions.py --comp titanic --tabs 8          # 大きな掲示板向け（メモリが少なくて済む）
+Outputs:
+  <out>/discussion_<id>.md（app の Discussion タブと同じ配置）, <out>/archive_index.json
+"""
+
+import argparse, asyncio, json, re, sys, time, pathlib
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+import blob_store
+from discussion_scraper import EmptyListPage, list_discussions, save_thread_md
+from fileio import write_text_atomic
+from kaggle_browser import DriverPool, log_timing, set_host_politeness
+
+INDEX_NAME = "archive_index.json"
+# 変化を検知するフィールド（一覧ページから取れるもの）
+CHANGE_FIELDS = ("comments", "last_activity")
+
+
+def comp_base_url(comp: str) -> str:
+    m = re.match(r"^(https?://www\.kaggle\.com/competitions/[^/?#]+)", comp.strip())
+    return m.group(1) if m else f"https://www.kaggle.com/competitions/{comp.strip().strip('/')}"
+
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+
+
+# ---------- index ----------
+def load_index(path: pathlib.Path) -> Dict:
+    if path.exists():
+        return json.loads(path.read_text(encoding="utf-8"))
+    return {"threads": {}}
+
+
+def save_index(path: pathlib.Path, index: Dict) -> None:
+    """途中で落ちても壊れないよう一時ファイル経由で置き換える"""
+    index["updated_at"] = now_iso()
+    write_text_atomic(path, json.dumps(index, ensure_ascii=False, indent=2))
+
+
+def needs_scrape(old: Optional[Dict], new: Dict, md_path: pathlib.Path) -> bool:
+    if old is None or not blob_store.exists(md_path):
+        return True
+    # 一覧から値が取れなかったフィールドは比較しない
+    return any(new.get(k) is not None and new.get(k) != old.get(k) for k in CHANGE_FIELDS)
+
+
+# ---------- crawl ----------
+def _add_page(threads: Dict[str, Dict], items: List[Dict], page: int) -> bool:
+    """一覧 1 ページ分を加え、新しいスレッドがあったかを返す"""
+    new = [it for it in items if it["id"] not in threads]
+    for it in new:
+        threads[it["id"]] = it
+    print(f"page {page}: {len(items)} threads ({len(new)} new)")
+    return bool(new)
+
+
+def list_all_threads(pool: DriverPool, list_url: str, max_pages: int = 200) -> List[Dict]:
+    """
+    1 ページ目から順に巡回し、空ページ or 既出スレッドのみのページで止める
+    読み込みの失敗（タイムアウト・429・WebDriver の異常）は空ページ扱いせず例外のまま上げる
+    （途中で打ち切った一覧を「全件」として扱わない）
+    """
+    threads: Dict[str, Dict] = {}
+    with pool.acquire() as d:
+        for page in range(1, max_pages + 1):
+            try:
+                items = list_discussions(list_url, max_items=1000, page=page, driver=d)
+            except EmptyListPage:
+                items = []  # スレッドリンクが 1 件も無いページ（最終ページの先）
+            if not _add_page(threads, items, page):
+                break
+    return list(threads.values())
+
+
+async def list_all_threads_tabs(pool, list_url: str, max_pages: int = 200) -> List[Dict]:
+    """list_all_threads のタブ版（cdp_tabs.TabPool）"""
+    from cdp_tabs import list_discussions_async
+
+    threads: Dict[str, Dict] = {}
+    for page in range(1, max_pages + 1):
+        try:
+            items = await list_discussions_async(pool, list_url, max_items=1000, page=page)
+        except EmptyListPage:
+            items = []
+        if not _add_page(threads, items, page):
+            break
+    return list(threads.values())
+
+
+def select_todo(listed: List[Dict], known: Dict[str, Dict], out_dir: pathlib.Path, force: bool) -> List[Dict]:
+    todo = [it for it in listed
+            if force or needs_scrape(known.get(it["id"]), it, out_dir / f"discussion_{it['id']}.md")]
+    print(f"{len(todo)} / {len(listed)} threads to (re)scrape")
+
+    # 変化なしのスレッドはメタデータ（タイトル/votes など）だけ更新
+    todo_ids = {it["id"] for it in todo}
+    for it in listed:
+        if it["id"] not in todo_ids and it["id"] in known:
+            known[it["id"]].update(it)
+    return todo
+
+
+async def _archive_with_tabs(list_url: str, out_dir: pathlib.Path, known: Dict[str, Dict], tabs: int,
+                             max_pages: int, headless: bool, force: bool, on_done) -> None:
+    # cdp_tabs は websockets が要るので、タブで取得するときだけ読む
+    from cdp_tabs import save_thread_md_async, tab_browser
+
+    async with tab_browser(tabs=tabs, headless=headless) as pool:
+        t0 = time.perf_counter()
+        listed = await list_all_threads_tabs(pool, list_url, max_pages=max_pages)
+        log_timing(f"list {len(listed)} threads", time.perf_counter() - t0)
+        todo = select_todo(listed, known, out_dir, force)
+
+        async def fetch(it: Dict) -> None:
+            try:
+                path = await save_thread_md_async(pool, it["url"], out_dir=str(out_dir))
+            except Exception as e:
+                on_done(it, None, e)
+                return
+            on_done(it, path, None)
+
+        t1 = time.perf_counter()
+        await asyncio.gather(*(fetch(it) for it in todo))
+        log_timing(f"scrape {len(todo)} threads ({tabs} tabs, {pool.opened} opened)", time.perf_counter() - t1)
+
+
+def archive(comp: str, out_dir: pathlib.Path, workers: int = 3, max_pages: int = 200,
+            headless: bool = True, force: bool = False, pool: Optional[DriverPool] = None,
+            tabs: int = 0) -> int:
+    """
+    差分アーカイブを実行し、取得に失敗したスレッド数を返す（pool を渡せばそのセッションを使う）
+    tabs > 0 なら DriverPool の代わりに Chrome 1 つのタブ tabs 個で取得する
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    index_path = out_dir / INDEX_NAME
+    index = load_index(index_path)
+    known: Dict[str, Dict] = index.setdefault("threads", {})
+    base = comp_base_url(comp)
+    index["competition"] = base.rsplit("/", 1)[-1]
+
+    t0 = time.perf_counter()
+    failed = 0
+
+    def on_done(it: Dict, path: Optional[pathlib.Path], err: Optional[BaseException]) -> None:
+        nonlocal failed
+        if err is not None:
+            # 失敗したスレッドは前回の記録を残す（次回また差分として拾われる）
+            failed += 1
+            print(f"❌ {it['url']}: {err!r}", file=sys.stderr)
+            return
+        known[it["id"]] = {**it, "path": path.name, "scraped_at": now_iso()}
+        print(f"✅ {path.name}  {it['title']}")
+
+    if tabs > 0:
+        try:
+            asyncio.run(_archive_with_tabs(f"{base}/discussion", out_dir, known, tabs, max_pages,
+                                           headless, force, on_done))
+        finally:
+            save_index(index_path, index)
+        log_timing("archive total", time.perf_counter() - t0)
+        return failed
+
+    own_pool = pool is None
+    pool = pool or DriverPool(size=workers, headless=headless)
+    try:
+        listed = list_all_threads(pool, f"{base}/discussion", max_pages=max_pages)
+        log_timing(f"list {len(listed)} threads", time.perf_counter() - t0)
+        todo = select_todo(listed, known, out_dir, force)
+
+        def fetch(it: Dict) -> pathlib.Path:
+            with pool.acquire() as d:
+                return save_thread_md(it["url"], out_dir=str(out_dir), driver=d)
+
+        t1 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+            futs = {ex.submit(fetch, it): it for it in todo}
+            try:
+                for fut in as_completed(futs):
+                    err = fut.exception()
+                    on_done(futs[fut], None if err else fut.result(), err)
+            finally:
+                save_index(index_path, index)
+        log_timing(f"scrape {len(todo)} threads", time.perf_counter() - t1)
+    finally:
+        if own_pool:
+            pool.close()
+
+    log_timing("archive total", time.perf_counter() - t0)
+    return failed
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--comp", required=True, help="コンペ slug または URL（例: titanic）")
+    ap.add_argument("--out", default="out/discussion", help="保存先ディレクトリ")
+    ap.add_argument("--workers", type=int, default=3, help="本文取得の並列数（Chrome セッション数）")
+    ap.add_argument("--tabs", type=int, default=0,
+                    help="Chrome 1 つのタブで並列取得する（タブ数）。0 なら --workers 個の Chrome を使う")
+    ap.add_argument("--max-pages", type=int, default=200, help="巡回する一覧ページ数の上限")
+    ap.add_argument("--min-interval", type=float, default=1.0, help="同一ホストへのページ読み込み間隔（秒）")
+    ap.add_argument("--force", action="store_true", help="変化の有無に関係なく全スレッドを再取得")
+    ap.add_argument("--no-headless", action="store_true")
+    args = ap.parse_args()
+
+    set_host_politeness(min_interval=args.min_interval, max_concurrent=args.tabs or args.workers)
+    failed = archive(args.comp, pathlib.Path(args.out), workers=args.workers, max_pages=args.max_pages,
+                     headless=not args.no_headless, force=args.force, tabs=args.tabs)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
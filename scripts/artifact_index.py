@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+生成物（.md / .ja.md / .ipynb）のメタデータ索引（SQLite）
+- 取得系スクリプトは保存のたびに record_fetch()、翻訳は record_translation() で記録する
+- 取得元 URL / 取得時刻 / 内容ハッシュ / 翻訳元ハッシュ / モデル / 状態を 1 行 1 ファイルで保持
+- app や CLI は「ファイルがあるか」ではなく索引を引いて、取得・翻訳の要否や一覧表示を決める
+- 索引に無い既存ファイル（索引導入前の生成物）は、初回参照時にファイルから取り込む
+- 記録した .md は全文検索（search_index.py）にも反映する
+環境変数:
+  KAGGLE_ARTIFACT_DB  DB ファイル（既定: <project>/out/artifacts.sqlite）
+Usage:
+  python3 artifact_index.py --list [--kind discussion]
+  python3 artifact_index.py --stale          # 翻訳が古い / 未翻訳の .md を表示
+  python3 artifact_index.py --scan out       # 既存ファイルを索引に取り込む
+"""
+
+import os, sys, json, time, sqlite3, hashlib, pathlib, threading
+from typing import Dict, Iterable, List, Optional
+
+import blob_store
+
+DEFAULT_DB = pathlib.Path(__file__).resolve().parent.parent / "out" / "artifacts.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    path          TEXT PRIMARY KEY,   -- 絶対パス
+    kind          TEXT,               -- overview / data / rules / discussion / course / kernel / notebook
+    lang          TEXT,               -- en / ja
+    source_url    TEXT,
+    source_path   TEXT,               -- 翻訳の場合: 原文ファイル
+    content_hash  TEXT,               -- このファイルの sha256
+    source_hash   TEXT,               -- 翻訳の場合: 翻訳した時点の原文の sha256
+    model         TEXT,
+    status        TEXT,               -- ok / failed
+    error         TEXT,
+    size          INTEGER,
+    fetched_at    REAL,               -- 取得 or 翻訳した時刻
+    extra         TEXT                -- JSON（kernel の版など）
+);
+CREATE INDEX IF NOT EXISTS idx_artifacts_url ON artifacts(source_url, lang);
+CREATE INDEX IF NOT EXISTS idx_artifacts_source ON artifacts(source_path);
+CREATE INDEX IF NOT EXISTS idx_artifacts_hash ON artifacts(content_hash);
+"""
+
+COLUMNS = ("path", "kind", "lang", "source_url", "source_path", "content_hash", "source_hash",
+           "model", "status", "error", "size", "fetched_at", "extra")
+
+
+def text_hash(data) -> str:
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def _key(path) -> str:
+    return str(pathlib.Path(path).resolve())
+
+
+def translation_path(src) -> pathlib.Path:
+    """x.md / x.ipynb → x.ja.md"""
+    p = pathlib.Path(src)
+    return p.with_name(p.name.rsplit(".", 1)[0] + ".ja.md")
+
+
+class ArtifactIndex:
+    def __init__(self, db_path=None):
+        self.db_path = pathlib.Path(db_path or os.getenv("KAGGLE_ARTIFACT_DB") or DEFAULT_DB)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._conn() as c:
+            c.executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        """スレッドごとに接続を持つ（取得系は ThreadPoolExecutor から呼ばれる）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")  # app の読み取りと CLI の書き込みを並行させる
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # ---------- write ----------
+    def upsert(self, path, **fields) -> None:
+        row = {k: fields.get(k) for k in COLUMNS if k != "path"}
+        if isinstance(row["extra"], dict):
+            row["extra"] = json.dumps(row["extra"], ensure_ascii=False)
+        cols = ", ".join(COLUMNS)
+        marks = ", ".join("?" for _ in COLUMNS)
+        with self._conn() as c:
+            c.execute(f"INSERT OR REPLACE INTO artifacts ({cols}) VALUES ({marks})",
+                      [_key(path)] + [row[k] for k in COLUMNS if k != "path"])
+
+    def record_fetch(self, path, source_url: Optional[str], kind: str, text: Optional[str] = None,
+                     extra: Optional[Dict] = None) -> None:
+        """取得した原文（英語）を記録。text を渡せばファイルを読み直さない"""
+        data = text.encode("utf-8") if text is not None else blob_store.read_bytes(path)
+        self.upsert(path, kind=kind, lang="en", source_url=source_url, content_hash=text_hash(data),
+                    status="ok", size=len(data), fetched_at=time.time(), extra=extra)
+        _update_search(path, text, kind)
+
+    def record_translation(self, src, dst, model: Optional[str], status: str = "ok",
+                           error: Optional[str] = None) -> None:
+        """翻訳結果を記録。原文のハッシュは索引から（無ければファイルから）取る"""
+        src_rec = self.get(src)
+        src_hash = src_rec["content_hash"] if src_rec else text_hash(blob_store.read_bytes(src))
+        dst_p = pathlib.Path(dst)
+        data = blob_store.read_bytes(dst_p) if status == "ok" and blob_store.exists(dst_p) else b""
+        self.upsert(dst, kind=src_rec["kind"] if src_rec else None, lang="ja",
+                    source_url=src_rec["source_url"] if src_rec else None, source_path=_key(src),
+                    content_hash=text_hash(data) if data else None, source_hash=src_hash, model=model,
+                    status=status, error=error, size=len(data), fetched_at=time.time())
+        if data:
+            _update_search(dst, data.decode("utf-8", errors="replace"), src_rec["kind"] if src_rec else None)
+
+    def forget(self, path) -> None:
+        with self._conn() as c:
+            c.execute("DELETE FROM artifacts WHERE path = ?", (_key(path),))
+
+    # ---------- read ----------
+    def get(self, path, adopt: bool = True) -> Optional[sqlite3.Row]:
+        """1 ファイルの記録。adopt=True なら索引に無い既存ファイルを取り込んでから返す"""
+        row = self._conn().execute("SELECT * FROM artifacts WHERE path = ?", (_key(path),)).fetchone()
+        if row is None and adopt and blob_store.exists(path):
+            self.adopt(path)
+            row = self._conn().execute("SELECT * FROM artifacts WHERE path = ?", (_key(path),)).fetchone()
+        return row
+
+    def adopt(self, path) -> None:
+        """索引導入前のファイルを取り込む（翻訳は原文より新しければ最新とみなす）"""
+        p = pathlib.Path(path)
+        store = blob_store.get_store()
+        if p.name.endswith(".ja.md"):
+            stem = p.name[: -len(".ja.md")]
+            src = next((p.with_name(stem + ext) for ext in (".ipynb", ".md")
+                        if store.exists(p.with_name(stem + ext))), None)
+            if src is None:
+                return
+            src_rec = self.get(src)
+            fresh = store.stat(p)[0] >= store.stat(src)[0]
+            data = store.read_bytes(p)
+            self.upsert(p, kind=src_rec["kind"] if src_rec else None, lang="ja",
+                        source_url=src_rec["source_url"] if src_rec else None, source_path=_key(src),
+                        content_hash=text_hash(data),
+                        source_hash=(src_rec["content_hash"] if src_rec else None) if fresh else None,
+                        status="ok", size=len(data), fetched_at=store.stat(p)[0])
+        else:
+            data = store.read_bytes(p)
+            self.upsert(p, kind=guess_kind(p), lang="en", content_hash=text_hash(data), status="ok",
+                        size=len(data), fetched_at=store.stat(p)[0])
+
+    def has(self, path) -> bool:
+        """記録が ok で、ファイルも残っているか（消えていれば記録も捨てる）"""
+        row = self.get(path)
+        if row is None or row["status"] != "ok":
+            return False
+        if not blob_store.exists(path):
+            self.forget(path)
+            return False
+        return True
+
+    def translation_stale(self, src, model: Optional[str] = None) -> bool:
+        """
+        src の翻訳が無い / 失敗 / 原文が翻訳後に変わった（model 指定時はモデル違いも）なら True
+        x.md と x.ipynb はどちらも x.ja.md に訳されるので、原文のハッシュは翻訳の記録にある原文
+        （ノートブックから訳したなら x.ipynb）と比べる
+        """
+        dst = translation_path(src)
+        if not self.has(dst):
+            return True
+        dst_rec = self.get(dst)
+        src_rec = self.get(dst_rec["source_path"] or src)
+        if src_rec is None:
+            return True
+        if dst_rec["source_hash"] != src_rec["content_hash"]:
+            return True
+        return bool(model) and dst_rec["model"] not in (None, model)
+
+    def find_translation_by_hash(self, source_hash: str, model: Optional[str] = None) -> Optional[sqlite3.Row]:
+        """同じ内容の原文を既に訳していればその記録を返す（重複翻訳の回避用）"""
+        q = "SELECT * FROM artifacts WHERE lang = 'ja' AND status = 'ok' AND source_hash = ?"
+        args: list = [source_hash]
+        if model:
+            q += " AND model = ?"
+            args.append(model)
+        for row in self._conn().execute(q + " ORDER BY fetched_at DESC", args):
+            if blob_store.exists(row["path"]):
+                return row
+        return None
+
+    def list(self, kind: Optional[str] = None, under=None, lang: Optional[str] = None) -> List[sqlite3.Row]:
+        q, args = "SELECT * FROM artifacts WHERE 1=1", []
+        if kind:
+            q += " AND kind = ?"
+            args.append(kind)
+        if lang:
+            q += " AND lang = ?"
+            args.append(lang)
+        if under:
+            q += " AND path LIKE ?"
+            args.append(_key(under).rstrip("/") + "/%")
+        return self._conn().execute(q + " ORDER BY path", args).fetchall()
+
+    def translated_paths(self, srcs: Iterable) -> Dict[str, bool]:
+        """複数の原文について「最新の翻訳があるか」を 1 回の問い合わせで返す（一覧表示用）"""
+        keys = [_key(s) for s in srcs]
+        if not keys:
+            return {}
+        # 翻訳（x.ja.md）側から引き、記録された原文（x.md または x.ipynb）のハッシュと比べる
+        dsts = {k: _key(translation_path(k)) for k in keys}
+        marks = ", ".join("?" for _ in dsts)
+        rows = self._conn().execute(
+            f"SELECT t.path AS dst, t.status AS status, t.source_hash = s.content_hash AS fresh "
+            f"FROM artifacts t JOIN artifacts s ON s.path = t.source_path "
+            f"WHERE t.path IN ({marks}) AND t.lang = 'ja'", list(dsts.values())).fetchall()
+        done = {r["dst"] for r in rows if r["status"] == "ok" and r["fresh"]}
+        return {k: dsts[k] in done for k in keys}
+
+    def scan(self, root) -> int:
+        """root 以下の .md / .ipynb を取り込む（原文を先に）。取り込んだ件数を返す"""
+        files = [p for p in blob_store.glob(root, "*", recursive=True) if p.suffix in (".md", ".ipynb")]
+        files.sort(key=lambda p: p.name.endswith(".ja.md"))
+        n = 0
+        for p in files:
+            if p.name.endswith(".ja.ipynb"):
+                continue
+            if self.get(p, adopt=False) is None:
+                self.adopt(p)
+                n += 1
+        return n
+
+
+def _update_search(path, text: Optional[str], kind: Optional[str]) -> None:
+    """全文検索の索引を更新（失敗しても取得・翻訳は止めない）"""
+    if pathlib.Path(path).suffix != ".md":
+        return
+    try:
+        from search_index import get_search_index
+        get_search_index().index_file(path, text=text, kind=kind)
+    except Exception as e:
+        print(f"[search] index update failed for {path}: {e!r}", file=sys.stderr)
+
+
+def guess_kind(path: pathlib.Path) -> Optional[str]:
+    name, parent = path.name, path.parent.name
+    if name.startswith("discussion_"):
+        return "discussion"
+    if name.rsplit(".", 1)[0] in ("overview", "data", "rules"):
+        return name.rsplit(".", 1)[0]
+    if path.suffix == ".ipynb":
+        return "notebook"
+    if parent in ("course", "kernel"):
+        return parent
+    return None
+
+
+_index: Optional[ArtifactIndex] = None
+_lock = threading.Lock()
+
+
+def get_index() -> ArtifactIndex:
+    """共有の索引を返す（初回のみ DB を開く）"""
+    global _index
+    with _lock:
+        if _index is None:
+            _index = ArtifactIndex()
+        return _index
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db", help="DB ファイル（既定: KAGGLE_ARTIFACT_DB または out/artifacts.sqlite）")
+    ap.add_argument("--list", action="store_true", help="記録を一覧表示")
+    ap.add_argument("--kind", help="--list の種類で絞り込み")
+    ap.add_argument("--stale", action="store_true", help="未翻訳 / 翻訳が古い原文を表示")
+    ap.add_argument("--scan", help="このディレクトリ以下の既存ファイルを取り込む")
+    args = ap.parse_args()
+
+    idx = ArtifactIndex(args.db)
+    if args.scan:
+        print(f"adopted {idx.scan(args.scan)} file(s)")
+    if args.list:
+        for r in idx.list(kind=args.kind):
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(r["fetched_at"] or 0))
+            print(f"{r['lang'] or '-':2s} {r['kind'] or '-':10s} {r['status'] or '-':6s} {when}  {r['path']}"
+                  + (f"  <- {r['source_url']}" if r["source_url"] else ""))
+    if args.stale:
+        for r in idx.list(kind=args.kind, lang="en"):
+            if r["path"].endswith(".md") and idx.translation_stale(r["path"]):
+                print(r["path"])
+    if not (args.scan or args.list or args.stale):
+        ap.print_help()
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+out/ の生成物を内容アドレス（sha256）の圧縮ストアにまとめる（任意。pack するまでは何も変わらない）
+- pack: ディレクトリ以下の .md / .ipynb / 投稿・翻訳キャッシュを zstd で圧縮して
+  out/.blobs/<sha の先頭 2 文字>/<sha>.zst に 1 つだけ置き、元のファイルを消す。
+  同じ内容（コンペ間で共通の rules、同じ版の再取得など）は 1 つのブロブを共有する
+- 画像（<stem>_files/ 以下）は Markdown の相対リンクや外部ビューアが通常ファイルとして開くので、圧縮も削除も
+  しない。内容アドレスのコピー（out/.blobs/<sha の先頭 2 文字>/<sha>.raw）へのハードリンクに置き換え、
+  ノート間で同じ画像は 1 つの実体を共有する（ハードリンクできないファイルシステムではそのまま残す）
+- 元のパスはディレクトリごとの小さな目録（.packed.json: ファイル名 → sha / サイズ / mtime）で引ける
+- 読み出しは exists() / read_bytes() / read_text()。通常ファイルがあればそれを、無ければ目録からブロブを
+  展開して返す。展開結果は sha をキーにしたメモリ上の LRU（KAGGLE_BLOB_CACHE_MB、既定 64MB）に置く
+- 同じパスに新しく書かれた通常ファイルは目録より優先される（次の pack で入れ替わる）
+- materialize / unpack で通常ファイルに戻す。gc で目録から参照されないブロブと、どのパスからも
+  リンクされていない画像の実体を消す
+- zstandard が無ければ zlib で圧縮する（拡張子 .zz）。読み出しは拡張子で判別
+環境変数:
+  KAGGLE_BLOB_DIR       ブロブの置き場所（既定: <project>/out/.blobs）
+  KAGGLE_BLOB_CACHE_MB  展開済みブロブの LRU の上限（既定: 64）
+Usage:
+  python3 blob_store.py --pack out                 # out 以下をストアに移す
+  python3 blob_store.py --stats out
+  python3 blob_store.py --materialize out/kernel/my-notebook.ipynb
+  python3 blob_store.py --unpack out/kernel        # ディレクトリごと通常ファイルに戻す
+  python3 blob_store.py --gc out
+"""
+
+import os, sys, json, zlib, fnmatch, hashlib, pathlib, threading
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # zlib で代用（圧縮率は下がる）
+    zstandard = None
+
+from fileio import write_bytes_atomic, write_text_atomic
+
+DEFAULT_BLOB_DIR = pathlib.Path(__file__).resolve().parent.parent / "out" / ".blobs"
+MANIFEST = ".packed.json"
+ZSTD_LEVEL = 10          # pack は一括処理なので圧縮率寄り（展開速度はレベルによらない）
+DEFAULT_CACHE_MB = 64
+# pack の対象（DB・ロック・トレース・archive_index.json などの管理ファイルは対象外）
+PACK_PATTERNS = ("*.md", "*.ipynb", "*.posts.jsonl", "*.ja.posts.json", "*.ja.cells.json")
+SKIP_DIRS = {".blobs", ".locks", "traces", ".parts"}
+# Markdown から相対リンクで参照される画像ディレクトリ（<stem>_files/）。中身はハードリンクで重複を除く
+ASSET_DIR_SUFFIX = "_files"
+ASSET_CODEC = "raw"  # 画像の実体は圧縮しない（既に圧縮済みで、パスから直接開けるようにするため）
+
+
+class _LRU:
+    """バイト数で上限を決める LRU（app の複数セッションから同時に読まれる）"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._d: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._d.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._d.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._d:
+                return
+            self._d[key] = data
+            self.bytes += len(data)
+            while self.bytes > self.max_bytes:
+                _, old = self._d.popitem(last=False)
+                self.bytes -= len(old)
+
+
+class BlobStore:
+    def __init__(self, blob_dir=None, cache_mb: Optional[float] = None):
+        self.blob_dir = pathlib.Path(blob_dir or os.getenv("KAGGLE_BLOB_DIR") or DEFAULT_BLOB_DIR)
+        mb = cache_mb if cache_mb is not None else float(os.getenv("KAGGLE_BLOB_CACHE_MB", DEFAULT_CACHE_MB))
+        self.cache = _LRU(int(mb * 1024 * 1024))
+        self._manifests: Dict[str, Tuple[int, Dict]] = {}  # 目録のパス → (mtime_ns, 中身)
+        self._lock = threading.Lock()
+
+    # ---------- blobs ----------
+    def _blob_path(self, sha: str, codec: str) -> pathlib.Path:
+        return self.blob_dir / sha[:2] / f"{sha}.{codec}"
+
+    def put(self, data: bytes) -> Tuple[Dict, bool]:
+        """data を保存して (目録の項目, 新規に書いたか) を返す。同じ内容のブロブがあれば書かない"""
+        sha = hashlib.sha256(data).hexdigest()
+        for codec in ("zst", "zz"):
+            p = self._blob_path(sha, codec)
+            if p.exists():
+                return {"sha": sha, "codec": codec, "size": len(data)}, False
+        codec = "zst" if zstandard else "zz"
+        packed = (zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data) if codec == "zst"
+                  else zlib.compress(data, 9))
+        p = self._blob_path(sha, codec)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        write_bytes_atomic(p, packed)
+        return {"sha": sha, "codec": codec, "size": len(data)}, True
+
+    def get(self, sha: str, codec: str) -> bytes:
+        data = self.cache.get(sha)
+        if data is not None:
+            return data
+        raw = self._blob_path(sha, codec).read_bytes()
+        if codec == "zst":
+            if zstandard is None:
+                raise RuntimeError("zstandard is required to read .zst blobs (pip install zstandard)")
+            data = zstandard.ZstdDecompressor().decompress(raw)
+        else:
+            data = zlib.decompress(raw)
+        self.cache.put(sha, data)
+        return data
+
+    # ---------- manifests ----------
+    def _manifest(self, d: pathlib.Path) -> Dict:
+        mp = d / MANIFEST
+        try:
+            mtime = mp.stat().st_mtime_ns
+        except OSError:
+            return {}
+        key = str(mp)
+        with self._lock:
+            hit = self._manifests.get(key)
+            if hit and hit[0] == mtime:
+                return hit[1]
+        try:
+            entries = json.loads(mp.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            entries = {}
+        with self._lock:
+            self._manifests[key] = (mtime, entries)
+        return entries
+
+    def _save_manifest(self, d: pathlib.Path, entries: Dict) -> None:
+        mp = d / MANIFEST
+        if entries:
+            write_text_atomic(mp, json.dumps(entries, ensure_ascii=False, indent=0, sort_keys=True))
+        else:
+            mp.unlink(missing_ok=True)
+
+    def entry(self, path) -> Optional[Dict]:
+        p = pathlib.Path(path)
+        return self._manifest(p.parent).get(p.name)
+
+    # ---------- path API ----------
+    def exists(self, path) -> bool:
+        return pathlib.Path(path).is_file() or self.entry(path) is not None
+
+    def read_bytes(self, path) -> bytes:
+        p = pathlib.Path(path)
+        try:
+            return p.read_bytes()
+        except FileNotFoundError:
+            e = self.entry(p)
+            if e is None:
+                raise
+            return self.get(e["sha"], e["codec"])
+
+    def read_text(self, path, encoding: str = "utf-8", errors: str = "strict") -> str:
+        return self.read_bytes(path).decode(encoding, errors)
+
+    def stat(self, path) -> Tuple[float, int]:
+        """(mtime, size)。pack 済みなら pack 時点の値"""
+        p = pathlib.Path(path)
+        try:
+            st = p.stat()
+            return st.st_mtime, st.st_size
+        except FileNotFoundError:
+            e = self.entry(p)
+            if e is None:
+                raise
+            return e["mtime"], e["size"]
+
+    def glob(self, root, pattern: str = "*", recursive: bool = False) -> Iterator[pathlib.Path]:
+        """root.glob(pattern)（recursive なら rglob）の pack 済みも含む版。pattern はファイル名に対して使う"""
+        root = pathlib.Path(root)
+        seen = set()
+        for p in (root.rglob(pattern) if recursive else root.glob(pattern)):
+            if p.is_file() and p.name != MANIFEST:
+                seen.add(p)
+                yield p
+        for mp in (root.rglob(MANIFEST) if recursive else [root / MANIFEST]):
+            if any(part in SKIP_DIRS for part in mp.relative_to(root).parts):
+                continue
+            for name in self._manifest(mp.parent):
+                p = mp.parent / name
+                if p not in seen and fnmatch.fnmatch(name, pattern):
+                    yield p
+
+    # ---------- pack / unpack ----------
+    def pack(self, root, patterns=PACK_PATTERNS, dry_run: bool = False) -> Dict[str, int]:
+        """root 以下の対象ファイルをブロブに移し、ディレクトリごとの目録に記録してから元ファイルを消す"""
+        root = pathlib.Path(root).resolve()
+        stats = {"files": 0, "bytes": 0, "new_blobs": 0, "stored_bytes": 0, "deduped": 0,
+                 "assets": 0, "asset_bytes": 0, "asset_linked": 0, "asset_shared_bytes": 0}
+        by_dir: Dict[pathlib.Path, List[pathlib.Path]] = {}
+        assets: List[pathlib.Path] = []
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS]
+            d = pathlib.Path(dirpath)
+            if d == self.blob_dir or self.blob_dir in d.parents:
+                continue
+            if any(part.endswith(ASSET_DIR_SUFFIX) for part in d.relative_to(root).parts):
+                assets += [d / f for f in filenames if not f.startswith(".")]
+                continue
+            files = [d / f for f in filenames if any(fnmatch.fnmatch(f, pat) for pat in patterns)]
+            if files:
+                by_dir[d] = files
+        for d, files in by_dir.items():
+            entries = dict(self._manifest(d))
+            for p in files:
+                data = p.read_bytes()
+                stats["files"] += 1
+                stats["bytes"] += len(data)
+                if dry_run:
+                    continue
+                e, created = self.put(data)
+                e["mtime"] = p.stat().st_mtime
+                if created:
+                    stats["new_blobs"] += 1
+                    stats["stored_bytes"] += self._blob_path(e["sha"], e["codec"]).stat().st_size
+                else:
+                    stats["deduped"] += 1
+                entries[p.name] = e
+            if dry_run:
+                continue
+            # 目録を書いてから元ファイルを消す（途中で落ちてもどちらかで読める）
+            self._save_manifest(d, entries)
+            for p in files:
+                p.unlink(missing_ok=True)
+        for p in assets:
+            size = p.stat().st_size
+            stats["assets"] += 1
+            stats["asset_bytes"] += size
+            if dry_run:
+                continue
+            linked, shared = self.link_asset(p)
+            stats["asset_linked"] += linked
+            stats["asset_shared_bytes"] += size if shared else 0
+        return stats
+
+    def link_asset(self, path) -> Tuple[bool, bool]:
+        """
+        path を内容アドレスの実体へのハードリンクに置き換え、(置き換えたか, 既存の実体を共有したか) を返す
+        既に実体へのリンクなら何もしない。実体は読み出し専用として扱う（書き換えは一時ファイル + os.replace で）
+        """
+        p = pathlib.Path(path)
+        data = p.read_bytes()
+        blob = self._blob_path(hashlib.sha256(data).hexdigest(), ASSET_CODEC)
+        created = not blob.exists()
+        if created:
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            write_bytes_atomic(blob, data)
+            os.utime(blob, (p.stat().st_mtime, p.stat().st_mtime))
+        elif os.path.samefile(blob, p):
+            return False, False
+        tmp = p.with_name(f".{p.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            os.link(blob, tmp)
+            os.replace(tmp, p)
+        except OSError:  # 別のファイルシステム・ハードリンク非対応: 通常ファイルのまま
+            tmp.unlink(missing_ok=True)
+            if created:
+                blob.unlink(missing_ok=True)
+            return False, False
+        return True, not created
+
+    def materialize(self, path) -> pathlib.Path:
+        """pack 済みのパスを通常ファイルに戻す（既に通常ファイルならそのまま）"""
+        p = pathlib.Path(path)
+        e = self.entry(p)
+        if e is None:
+            return p
+        if not p.is_file():
+            data = self.get(e["sha"], e["codec"])
+            tmp = p.with_name(f".{p.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(data)
+            os.utime(tmp, (e["mtime"], e["mtime"]))
+            os.replace(tmp, p)
+        entries = dict(self._manifest(p.parent))
+        entries.pop(p.name, None)
+        self._save_manifest(p.parent, entries)
+        return p
+
+    def unpack(self, root) -> int:
+        n = 0
+        for mp in list(pathlib.Path(root).rglob(MANIFEST)):
+            for name in list(self._manifest(mp.parent)):
+                self.materialize(mp.parent / name)
+                n += 1
+        return n
+
+    def gc(self, roots: List) -> Dict[str, int]:
+        """roots 以下の目録から参照されていないブロブを消す（ストアを共有する全ディレクトリを渡すこと）"""
+        used = {e["sha"] for r in roots for mp in pathlib.Path(r).rglob(MANIFEST)
+                for e in self._manifest(mp.parent).values()}
+        stats = {"kept": 0, "removed": 0, "freed_bytes": 0}
+        for b in self.blob_dir.glob("*/*.*"):
+            if b.name.startswith("."):
+                continue
+            sha, codec = b.name.split(".", 1)
+            # 画像の実体は、どこかのパスからハードリンクされている（リンク数 2 以上）間は残す
+            if (b.stat().st_nlink > 1) if codec == ASSET_CODEC else (sha in used):
+                stats["kept"] += 1
+            else:
+                stats["removed"] += 1
+                stats["freed_bytes"] += b.stat().st_size
+                b.unlink(missing_ok=True)
+        return stats
+
+    def summary(self, root) -> Dict[str, int]:
+        refs = [e for mp in pathlib.Path(root).rglob(MANIFEST) for e in self._manifest(mp.parent).values()]
+        blobs = [b for b in self.blob_dir.glob("*/*.*") if not b.name.startswith(".")]
+        assets = [b for b in blobs if b.name.endswith("." + ASSET_CODEC)]
+        blobs = [b for b in blobs if not b.name.endswith("." + ASSET_CODEC)]
+        return {"packed_files": len(refs), "logical_bytes": sum(e["size"] for e in refs),
+                "blobs": len(blobs), "stored_bytes": sum(b.stat().st_size for b in blobs),
+                "manifests": len(list(pathlib.Path(root).rglob(MANIFEST))),
+                "asset_blobs": len(assets), "asset_links": sum(b.stat().st_nlink - 1 for b in assets),
+                "asset_bytes": sum(b.stat().st_size for b in assets)}
+
+
+_store: Optional[BlobStore] = None
+_glock = threading.Lock()
+
+
+def get_store() -> BlobStore:
+    """プロセス共有のストア（LRU も共有）"""
+    global _store
+    with _glock:
+        if _store is None:
+            _store = BlobStore()
+        return _store
+
+
+def exists(path) -> bool:
+    return get_store().exists(path)
+
+
+def read_bytes(path) -> bytes:
+    return get_store().read_bytes(path)
+
+
+def read_text(path, encoding: str = "utf-8", errors: str = "strict") -> str:
+    return get_store().read_text(path, encoding, errors)
+
+
+def glob(root, pattern: str = "*", recursive: bool = False) -> List[pathlib.Path]:
+    return sorted(get_store().glob(root, pattern, recursive))
+
+
+def _mb(n: int) -> str:
+    return f"{n / 1024 / 1024:.1f}MB"
+
+
+def main():
+    import argparse
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pack", metavar="DIR", help="DIR 以下の生成物をストアに移す")
+    ap.add_argument("--dry-run", action="store_true", help="--pack で対象を数えるだけ")
+    ap.add_argument("--materialize", nargs="+", metavar="PATH", help="pack 済みのファイルを通常ファイルに戻す")
+    ap.add_argument("--unpack", metavar="DIR", help="DIR 以下をすべて通常ファイルに戻す")
+    ap.add_argument("--gc", nargs="+", metavar="DIR", help="DIR 以下の目録から参照されないブロブを消す")
+    ap.add_argument("--stats", metavar="DIR", help="pack 済みファイル数と圧縮後のサイズ")
+    ap.add_argument("--blob-dir", help="ブロブの置き場所（既定: KAGGLE_BLOB_DIR または out/.blobs）")
+    args = ap.parse_args()
+
+    store = BlobStore(args.blob_dir)
+    if not zstandard:
+        print("zstandard not installed; using zlib", file=sys.stderr)
+    if args.pack:
+        s = store.pack(args.pack, dry_run=args.dry_run)
+        print(f"{s['files']} file(s), {_mb(s['bytes'])}" + ("" if args.dry_run else
+              f" → {s['new_blobs']} new blob(s) {_mb(s['stored_bytes'])}, {s['deduped']} deduplicated"))
+        print(f"{s['assets']} image(s) in *{ASSET_DIR_SUFFIX}/, {_mb(s['asset_bytes'])}" + ("" if args.dry_run else
+              f" → {s['asset_linked']} hardlinked, {_mb(s['asset_shared_bytes'])} shared with identical images"))
+    elif args.materialize:
+        for p in args.materialize:
+            print(f"✅ {store.materialize(p)}")
+    elif args.unpack:
+        print(f"{store.unpack(args.unpack)} file(s) restored")
+    elif args.gc:
+        s = store.gc(args.gc)
+        print(f"kept {s['kept']} blob(s), removed {s['removed']} ({_mb(s['freed_bytes'])})")
+    elif args.stats:
+        s = store.summary(args.stats)
+        ratio = s["stored_bytes"] / s["logical_bytes"] if s["logical_bytes"] else 0
+        print(f"{s['packed_files']} packed file(s) in {s['manifests']} dir(s), {_mb(s['logical_bytes'])} "
+              f"→ {s['blobs']} blob(s) {_mb(s['stored_bytes'])} ({ratio:.0%})")
+        print(f"{s['asset_links']} image path(s) hardlinked to {s['asset_blobs']} file(s) {_mb(s['asset_bytes'])}")
+    else:
+        ap.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,517 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+1 つの Chrome プロセスの中で複数タブを並行に動かす非同期の取得エンジン（CDP 直結・asyncio）
+- build_driver() で起動した軽量プロファイルの Chrome に DevTools の websocket で直接つなぎ、
+  Target.createTarget で作ったタブを並行に読み込む（増えるのはタブごとのレンダラだけで、Chrome 本体は 1 つ）
+- 各タブの準備完了は kaggle_browser と同じ READY_JS（対象要素 + DOM / 通信の静止）をタブごとに評価して判定
+- 同時に使うタブ数は tabs（--tabs）で指定。タブは使い回し、TAB_MAX_USES ページごとに作り直す（メモリの膨張防止）
+- 画像等の遮断・webdriver 隠し・通信中件数の計測はタブごとに設定し、set_host_politeness() の制限も守る
+Usage:
+  python3 cdp_tabs.py --threads https://www.kaggle.com/competitions/titanic/discussion/586706 ... --tabs 8
+  python3 cdp_tabs.py --bench URL [URL ...] --tabs 4      # DriverPool（Chrome 4 個）と所要時間・メモリを比較
+"""
+
+import os, sys, json, time, asyncio, pathlib, itertools, threading, urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import websockets
+
+from kaggle_browser import (COOKIE_XPATHS, DISMISS_COOKIE_JS, NEW_DOCUMENT_SCRIPTS, READY_JS, DriverPool,
+                            build_driver, host_politeness, lean_enabled, load_blocked_urls, log_timing, open_page)
+from discussion_scraper import (EXTRACT_THREAD_JS, LIST_READY, PAGE_STATUS_JS, THREAD_READY, list_page_error,
+                                list_page_url, parse_discussion_list, thread_md_path, thread_posts_from_html,
+                                write_thread)
+from discussion_posts import load_posts, posts_path
+from fixtures import record_page, recorder, replay_url
+from tracing import span
+
+DEFAULT_TABS = 6
+TAB_MAX_USES = 50     # 1 タブで読み込むページ数の上限（超えたら閉じて作り直す）
+CALL_TIMEOUT = 30.0   # CDP コマンド 1 つの応答待ち（秒）
+
+
+class CDPError(RuntimeError):
+    """CDP のエラー応答 / ナビゲーション失敗 / 接続断"""
+
+
+# ---------- CDP 接続 ----------
+class Browser:
+    """ブラウザ全体への websocket 1 本。タブへのコマンドは flatten モードの sessionId を付けて送る"""
+
+    def __init__(self, ws):
+        self._ws = ws
+        self._ids = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._waiters: List[Tuple[Optional[str], str, asyncio.Future]] = []
+        self._reader = asyncio.create_task(self._read())
+
+    @classmethod
+    async def connect(cls, ws_url: str) -> "Browser":
+        return cls(await websockets.connect(ws_url, max_size=None, ping_interval=None))
+
+    async def _read(self) -> None:
+        try:
+            async for raw in self._ws:
+                msg = json.loads(raw)
+                if "id" in msg:
+                    fut = self._pending.pop(msg["id"], None)
+                    if fut is None or fut.done():
+                        continue
+                    if "error" in msg:
+                        fut.set_exception(CDPError(msg["error"].get("message", str(msg["error"]))))
+                    else:
+                        fut.set_result(msg.get("result", {}))
+                    continue
+                key = (msg.get("sessionId"), msg.get("method"))
+                for w in [w for w in self._waiters if (w[0], w[1]) == key]:
+                    self._waiters.remove(w)
+                    if not w[2].done():
+                        w[2].set_result(msg.get("params", {}))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            for fut in self._pending.values():
+                if not fut.done():
+                    fut.set_exception(CDPError("browser connection closed"))
+            self._pending.clear()
+
+    async def send(self, method: str, params: Optional[Dict] = None, session_id: Optional[str] = None,
+                   timeout: float = CALL_TIMEOUT) -> Dict:
+        if self._reader.done():
+            raise CDPError("browser connection closed")
+        mid = next(self._ids)
+        msg = {"id": mid, "method": method, "params": params or {}}
+        if session_id:
+            msg["sessionId"] = session_id
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[mid] = fut
+        try:
+            await self._ws.send(json.dumps(msg))
+            return await asyncio.wait_for(fut, timeout)
+        finally:
+            self._pending.pop(mid, None)
+
+    def expect(self, session_id: Optional[str], method: str) -> asyncio.Future:
+        """次に届く method イベントの params を受け取る Future（コマンドを送る前に登録する）"""
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append((session_id, method, fut))
+        return fut
+
+    def forget(self, fut: asyncio.Future) -> None:
+        self._waiters = [w for w in self._waiters if w[2] is not fut]
+
+    async def close(self) -> None:
+        await self._ws.close()
+        await asyncio.gather(self._reader, return_exceptions=True)
+
+
+def devtools_ws_url(driver) -> str:
+    """build_driver() の Chrome の DevTools websocket URL（chromedriver が開いた debuggerAddress から引く）"""
+    addr = (driver.capabilities.get("goog:chromeOptions") or {}).get("debuggerAddress")
+    if not addr:
+        raise CDPError("Chrome did not report a debuggerAddress")
+    opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))  # localhost をプロキシに流さない
+    with opener.open(f"http://{addr}/json/version", timeout=10) as r:
+        return json.loads(r.read())["webSocketDebuggerUrl"]
+
+
+class AsyncHostPoliteness:
+    """HostPoliteness の asyncio 版（同じ min_interval / max_concurrent で、待つ間イベントループを塞がない）"""
+
+    def __init__(self, min_interval: float = 1.0, max_concurrent: int = 2):
+        self.min_interval = min_interval
+        self.max_concurrent = max(1, max_concurrent)
+        self._sems: Dict[str, asyncio.Semaphore] = {}
+        self._next_at: Dict[str, float] = {}
+
+    @asynccontextmanager
+    async def slot(self, url: str) -> AsyncIterator[None]:
+        host = urlparse(url).netloc or "local"
+        sem = self._sems.setdefault(host, asyncio.Semaphore(self.max_concurrent))
+        async with sem:
+            now = time.monotonic()
+            start = max(now, self._next_at.get(host, 0.0))
+            self._next_at[host] = start + self.min_interval
+            if start > now:
+                await asyncio.sleep(start - now)
+            yield
+
+
+# ---------- タブ ----------
+class Tab:
+    def __init__(self, browser: Browser, target_id: str, session_id: str,
+                 politeness: Optional[AsyncHostPoliteness] = None):
+        self.browser = browser
+        self.target_id = target_id
+        self.session_id = session_id
+        self.politeness = politeness
+        self.uses = 0
+
+    async def call(self, method: str, timeout: float = CALL_TIMEOUT, **params) -> Dict:
+        return await self.browser.send(method, params, self.session_id, timeout)
+
+    async def evaluate(self, expression: str, timeout: float = CALL_TIMEOUT) -> Any:
+        """式を評価して値を返す（Promise なら解決を待つ）"""
+        res = await self.call("Runtime.evaluate", timeout=timeout, expression=expression,
+                              returnByValue=True, awaitPromise=True)
+        if "exceptionDetails" in res:
+            d = res["exceptionDetails"]
+            raise CDPError((d.get("exception") or {}).get("description") or d.get("text", "evaluate failed"))
+        return (res.get("result") or {}).get("value")
+
+    async def run_js(self, body: str, *args, timeout: float = CALL_TIMEOUT) -> Any:
+        """execute_script と同じ形（arguments を使い return で返す関数本体）で実行する"""
+        return await self.evaluate(f"(function() {{{body}\n}}).apply(null, {json.dumps(list(args))})", timeout)
+
+    async def html(self) -> str:
+        return await self.evaluate("document.documentElement.outerHTML") or ""
+
+    async def navigate(self, url: str, timeout: float = 30.0) -> None:
+        """Page.navigate して DOMContentLoaded まで待つ（eager と同じ。届かなくても先へ進み wait_ready に任せる）"""
+        dcl = self.browser.expect(self.session_id, "Page.domContentEventFired")
+        try:
+            res = await self.call("Page.navigate", timeout=timeout, url=url)
+            if res.get("errorText"):
+                raise CDPError(f"{res['errorText']}: {url}")
+            try:
+                await asyncio.wait_for(dcl, timeout)
+            except asyncio.TimeoutError:
+                pass
+        finally:
+            self.browser.forget(dcl)
+
+    async def wait_ready(self, css: Optional[str] = None, xpath: Optional[str] = None, quiet_ms: int = 500,
+                         timeout: float = 15.0, max_inflight: int = 0) -> Dict:
+        """kaggle_browser.wait_ready のタブ版（READY_JS をこのタブで評価する）"""
+        args = json.dumps([css, xpath, int(quiet_ms), int(timeout * 1000), int(max_inflight)])
+        expr = f"new Promise((done) => (function() {{{READY_JS}}}).apply(null, {args}.concat([done])))"
+        try:
+            res = await self.evaluate(expr, timeout=timeout + 5)
+        except (CDPError, asyncio.TimeoutError) as e:
+            res = {"ready": False, "reason": f"error: {e.__class__.__name__}", "found": False,
+                   "mutations": 0, "elapsed": timeout}
+        return res or {"ready": False, "reason": "no-result", "found": False, "mutations": 0, "elapsed": 0.0}
+
+    async def open(self, url: str, **ready_kwargs) -> Dict:
+        """kaggle_browser.open_page のタブ版: navigate → wait_ready → Cookie バナー処理"""
+        t0 = time.perf_counter()
+        with span("tab.open_page", "browser", url=url) as sp:
+            async with AsyncExitStack() as slot:
+                if self.politeness:
+                    with span("politeness wait", "browser"):
+                        await slot.enter_async_context(self.politeness.slot(url))
+                t_get0 = time.perf_counter()
+                with span("tab.navigate", "browser", url=url):
+                    await self.navigate(replay_url(url), timeout=ready_kwargs.get("timeout", 15.0) + 15)
+                t_get = time.perf_counter() - t_get0
+                with span("wait_ready", "browser") as w:
+                    res = await self.wait_ready(**ready_kwargs)
+                    w.update(reason=res.get("reason"), found=res.get("found"))
+            try:
+                await self.run_js(DISMISS_COOKIE_JS, COOKIE_XPATHS)
+            except CDPError:
+                pass
+            await self.record_snapshot(url)
+            sp["reason"] = res.get("reason")
+        log_timing(url, time.perf_counter() - t0,
+                   f"(tab get={t_get:.2f}s ready={res.get('elapsed', 0):.2f}s {res.get('reason')})")
+        return res
+
+    async def record_snapshot(self, url: str) -> None:
+        if recorder():
+            record_page(url, await self.html())
+
+    async def scroll_until_stable(self, tries: int = 6, quiet_ms: int = 400, timeout: float = 5.0) -> int:
+        with span("scroll_until_stable", "browser") as sp:
+            last_h = await self.evaluate("document.body.scrollHeight")
+            scrolls = 0
+            for _ in range(tries):
+                await self.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+                await self.wait_ready(quiet_ms=quiet_ms, timeout=timeout)
+                scrolls += 1
+                h = await self.evaluate("document.body.scrollHeight")
+                if h == last_h:
+                    break
+                last_h = h
+            sp["scrolls"] = scrolls
+        return last_h
+
+
+class TabPool:
+    """
+    1 つのブラウザのタブを最大 size 個まで遅延生成して使い回す（DriverPool のタブ版）。
+        async with tab_browser(tabs=8) as pool:
+            async with pool.acquire() as tab: ...
+    使用中に例外が出たタブは状態が分からないので閉じる
+    """
+
+    def __init__(self, browser: Browser, size: int = DEFAULT_TABS, blocked_urls: Optional[List[str]] = None,
+                 max_uses: int = TAB_MAX_USES):
+        self.browser = browser
+        self.size = max(1, size)
+        self.blocked_urls = blocked_urls
+        self.max_uses = max(1, max_uses)
+        p = host_politeness()
+        self.politeness = AsyncHostPoliteness(p.min_interval, p.max_concurrent) if p else None
+        self._sem = asyncio.Semaphore(self.size)
+        self._idle: List[Tab] = []
+        self.opened = 0
+        self.pages = 0
+
+    async def _new_tab(self) -> Tab:
+        with span("tab startup", "browser"):
+            target = await self.browser.send("Target.createTarget", {"url": "about:blank"})
+            attached = await self.browser.send("Target.attachToTarget",
+                                               {"targetId": target["targetId"], "flatten": True})
+            tab = Tab(self.browser, target["targetId"], attached["sessionId"], self.politeness)
+            await tab.call("Page.enable")
+            for src in NEW_DOCUMENT_SCRIPTS:
+                try:
+                    await tab.call("Page.addScriptToEvaluateOnNewDocument", source=src)
+                except CDPError:
+                    pass
+            if self.blocked_urls is not None:
+                try:
+                    await tab.call("Network.enable")
+                    await tab.call("Network.setBlockedURLs", urls=self.blocked_urls)
+                except CDPError:
+                    pass
+        self.opened += 1
+        return tab
+
+    async def _close_tab(self, tab: Tab) -> None:
+        try:
+            await self.browser.send("Target.closeTarget", {"targetId": tab.target_id}, timeout=5)
+        except (CDPError, asyncio.TimeoutError):
+            pass
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[Tab]:
+        async with self._sem:
+            tab = self._idle.pop() if self._idle else await self._new_tab()
+            ok = False
+            try:
+                yield tab
+                ok = True
+            finally:
+                tab.uses += 1
+                self.pages += 1
+                if ok and tab.uses < self.max_uses:
+                    self._idle.append(tab)
+                else:
+                    await self._close_tab(tab)
+
+    async def close(self) -> None:
+        tabs, self._idle = self._idle, []
+        for tab in tabs:
+            await self._close_tab(tab)
+
+
+@asynccontextmanager
+async def tab_browser(tabs: int = DEFAULT_TABS, headless: bool = True, lean: Optional[bool] = None,
+                      blocked_urls: Optional[List[str]] = None,
+                      max_uses: int = TAB_MAX_USES) -> AsyncIterator[TabPool]:
+    """build_driver() で Chrome を 1 つ起動し、その中のタブのプールを返す"""
+    if lean is None:
+        lean = lean_enabled()
+    drv = await asyncio.to_thread(build_driver, headless=headless, lean=lean, blocked_urls=blocked_urls)
+    browser = pool = None
+    try:
+        browser = await Browser.connect(await asyncio.to_thread(devtools_ws_url, drv))
+        patterns = (list(blocked_urls) if blocked_urls is not None else load_blocked_urls()) if lean else None
+        pool = TabPool(browser, tabs, blocked_urls=patterns, max_uses=max_uses)
+        yield pool
+    finally:
+        if pool:
+            await pool.close()
+        if browser:
+            await browser.close()
+        await asyncio.to_thread(drv.quit)
+
+
+# ---------- Discussion ----------
+async def list_discussions_async(pool: TabPool, list_url: str, max_items: int = 30, page: int = 1) -> List[Dict]:
+    """
+    discussion_scraper.list_discussions のタブ版
+    スレッドリンクが無いページは EmptyListPage、読み込みに失敗したページはそれ以外の例外
+    """
+    url = list_page_url(list_url, page)
+    async with pool.acquire() as tab:
+        res = await tab.open(url, **LIST_READY)
+        if not res.get("found"):
+            raise list_page_error(url, await tab.run_js(PAGE_STATUS_JS))
+        html = await tab.html()
+    return await asyncio.to_thread(parse_discussion_list, html, max_items)
+
+
+async def fetch_thread_html(pool: TabPool, thread_url: str) -> str:
+    """スレッドを開いて遅延読み込みを出し切り、本文 HTML を返す（EXTRACT_THREAD_JS を 1 回評価）"""
+    async with pool.acquire() as tab:
+        await tab.open(thread_url, **THREAD_READY)
+        await tab.scroll_until_stable()
+        await tab.record_snapshot(thread_url)  # 記録モード: 遅延読み込み後の DOM で上書き
+        t0 = time.perf_counter()
+        res = await tab.run_js(EXTRACT_THREAD_JS) or {}
+        html = res.get("html") or (await tab.html() if not res else "")
+    log_timing("extract thread", time.perf_counter() - t0,
+               f"(tab mode={res.get('mode')} elements={res.get('elements')} html={len(html) / 1024:.0f}KB)")
+    return html
+
+
+async def save_thread_md_async(pool: TabPool, thread_url: str, out_dir: str = "out/discussion",
+                               keep_header: bool = False) -> pathlib.Path:
+    """discussion_scraper.save_thread_md のタブ版（変換と書き込みはスレッドで行い、ループを塞がない）"""
+    path = thread_md_path(thread_url, out_dir)
+    html = await fetch_thread_html(pool, thread_url)
+    posts = await asyncio.to_thread(
+        lambda: thread_posts_from_html(html, keep_header=keep_header, previous=load_posts(posts_path(path))))
+    return await asyncio.to_thread(write_thread, path, thread_url, posts)
+
+
+async def save_threads(pool: TabPool, urls: List[str], out_dir: str = "out/discussion",
+                       on_done: Optional[Callable[[str, Optional[pathlib.Path], Optional[BaseException]], None]] = None
+                       ) -> int:
+    """urls を空いたタブから順に保存し、失敗数を返す。on_done(url, path, error) を 1 件ごとに呼ぶ"""
+    async def one(url: str) -> int:
+        try:
+            path = await save_thread_md_async(pool, url, out_dir)
+        except Exception as e:
+            if on_done:
+                on_done(url, None, e)
+            return 1
+        if on_done:
+            on_done(url, path, None)
+        return 0
+
+    return sum(await asyncio.gather(*(one(u) for u in urls)))
+
+
+# ---------- メモリ計測 / benchmark ----------
+def _mem_kb(pid: int) -> int:
+    """PSS（共有ページを按分した値）があれば PSS、無ければ RSS"""
+    for name, key in (("smaps_rollup", "Pss:"), ("status", "VmRSS:")):
+        try:
+            for line in pathlib.Path(f"/proc/{pid}/{name}").read_text().splitlines():
+                if line.startswith(key):
+                    return int(line.split()[1])
+        except (OSError, ValueError):
+            continue
+    return 0
+
+
+def child_processes_mb(pid: Optional[int] = None) -> Optional[float]:
+    """pid の子孫プロセス（chromedriver と Chrome 一式）の合計メモリ MB。/proc が無ければ None"""
+    proc = pathlib.Path("/proc")
+    if not proc.is_dir():
+        return None
+    pid = pid or os.getpid()
+    children: Dict[int, List[int]] = {}
+    for d in proc.iterdir():
+        if not d.name.isdigit():
+            continue
+        try:
+            ppid = int((d / "stat").read_text().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(d.name))
+    total, stack = 0, list(children.get(pid, []))
+    while stack:
+        p = stack.pop()
+        stack += children.get(p, [])
+        total += _mem_kb(p)
+    return total / 1024
+
+
+class _PeakMemory(threading.Thread):
+    def __init__(self, interval: float = 0.25):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = 0.0
+        self._stop_ev = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_ev.is_set():
+            self.peak = max(self.peak, child_processes_mb() or 0.0)
+            self._stop_ev.wait(self.interval)
+
+    def stop(self) -> float:
+        self._stop_ev.set()
+        self.join()
+        return self.peak
+
+
+def bench(urls: List[str], tabs: int = 4, headless: bool = True) -> Dict[str, Dict[str, float]]:
+    """同じ URL 群を「Chrome tabs 個（DriverPool）」と「Chrome 1 個のタブ tabs 個」で読み込み比較"""
+    results: Dict[str, Dict[str, float]] = {}
+
+    mem = _PeakMemory()
+    mem.start()
+    t0 = time.perf_counter()
+    with DriverPool(size=tabs, headless=headless) as pool:
+        def load(u: str) -> None:
+            with pool.acquire() as d:
+                open_page(d, u)
+        with ThreadPoolExecutor(max_workers=tabs) as ex:
+            list(ex.map(load, urls))
+    results[f"drivers x{tabs}"] = {"seconds": time.perf_counter() - t0, "peak_mb": mem.stop()}
+
+    async def run_tabs() -> None:
+        async with tab_browser(tabs=tabs, headless=headless) as pool:
+            async def load(u: str) -> None:
+                async with pool.acquire() as tab:
+                    await tab.open(u)
+            await asyncio.gather(*(load(u) for u in urls))
+
+    mem = _PeakMemory()
+    mem.start()
+    t0 = time.perf_counter()
+    asyncio.run(run_tabs())
+    results[f"tabs x{tabs}"] = {"seconds": time.perf_counter() - t0, "peak_mb": mem.stop()}
+    return results
+
+
+def main():
+    import argparse
+    from kaggle_browser import set_host_politeness
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--threads", nargs="+", default=[], help="Discussion スレッド URL")
+    ap.add_argument("--out", default="out/discussion", help="スレッド保存先ディレクトリ")
+    ap.add_argument("--tabs", type=int, default=DEFAULT_TABS, help="同時に使うタブ数")
+    ap.add_argument("--bench", nargs="+", default=[], help="DriverPool と比べる URL（複数可）")
+    ap.add_argument("--min-interval", type=float, default=1.0, help="同一ホストへのページ読み込み間隔（秒）")
+    ap.add_argument("--no-headless", action="store_true")
+    args = ap.parse_args()
+
+    if args.bench:
+        res = bench(args.bench, tabs=args.tabs, headless=not args.no_headless)
+        print(f"{'mode':12s} {'pages':>6s} {'load[s]':>8s} {'peak MB':>9s} {'MB/slot':>8s}")
+        for label, r in res.items():
+            print(f"{label:12s} {len(args.bench):6d} {r['seconds']:8.2f} {r['peak_mb']:9.0f} "
+                  f"{r['peak_mb'] / max(1, args.tabs):8.0f}")
+        return
+    if not args.threads:
+        ap.print_help()
+        return
+
+    set_host_politeness(min_interval=args.min_interval, max_concurrent=args.tabs)
+
+    def done(url: str, path: Optional[pathlib.Path], err: Optional[BaseException]) -> None:
+        print(f"✅ {path}" if err is None else f"❌ {url}: {err!r}", file=sys.stdout if err is None else sys.stderr)
+
+    async def run() -> int:
+        async with tab_browser(tabs=args.tabs, headless=not args.no_headless) as pool:
+            return await save_threads(pool, args.threads, args.out, on_done=done)
+
+    t0 = time.perf_counter()
+    failed = asyncio.run(run())
+    log_timing(f"{len(args.threads)} threads with {args.tabs} tabs", time.perf_counter() - t0)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Discussion スレッドを投稿（元投稿 + コメント）単位のレコードに分ける
+- スレッド本文 HTML をコメント要素ごとに切り分け、1 投稿 1 行の JSONL（discussion_<id>.posts.jsonl）に保存
+  レコード: {"id", "parent", "depth", "author", "timestamp", "votes", "html_sha", "html", "md"}
+- HTML→Markdown 変換は前回の JSONL と html_sha が同じ投稿では省く（新規 / 編集された投稿だけ変換）
+- 結合した .md / .ja.md は assemble_thread_md() で投稿を並べて作る（翻訳は投稿単位でキャッシュできる）
+- コメント要素が見つからない場合はスレッド全体を 1 投稿として扱う（従来どおりの 1 ファイル）
+Usage:
+  python3 discussion_posts.py --split thread.html        # 保存済み HTML の分割結果を表示
+"""
+
+import re, json, hashlib, pathlib
+from typing import Callable, Dict, List, Optional
+
+from bs4 import BeautifulSoup
+
+import blob_store
+from fileio import write_text_atomic
+# html2md と同じパーサで切り分ける（lxml は壊れた HTML の補い方が違い、投稿単位とスレッド全体の変換がずれる）
+from html_to_markdown import PARSER as _PARSER
+
+POSTS_SUFFIX = ".posts.jsonl"
+OP_ID = "op"
+
+# コメント 1 件を囲む要素（先に当たったものを使う）。Kaggle の DOM が変わったらここを直す
+COMMENT_SELECTORS = [
+    "[data-testid='discussions-comment']",
+    "[data-testid*='comment-item']",
+    "[data-comment-id]",
+    "[id^='comment-']",
+]
+_ID_RE = re.compile(r"(\d{3,})")
+_PROFILE_HREF_RE = re.compile(r"^(?:https://www\.kaggle\.com)?/([A-Za-z0-9_-]+)/?$")
+_RESERVED_PATHS = {"competitions", "code", "datasets", "discussions", "models", "learn", "c", "account"}
+
+
+def posts_path(md_path) -> pathlib.Path:
+    """discussion_<id>.md → discussion_<id>.posts.jsonl"""
+    p = pathlib.Path(md_path)
+    return p.with_name(p.name.rsplit(".", 1)[0] + POSTS_SUFFIX)
+
+
+def sha(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:24]
+
+
+# ---------------- split ----------------
+def _comment_nodes(soup) -> List:
+    for sel in COMMENT_SELECTORS:
+        nodes = soup.select(sel)
+        if nodes:
+            return nodes
+    return []
+
+
+def _post_id(el, fallback: str) -> str:
+    for attr in ("data-comment-id", "id", "data-testid"):
+        m = _ID_RE.search(str(el.get(attr) or ""))
+        if m:
+            return m.group(1)
+    return fallback
+
+
+def _meta_nodes(el) -> Dict:
+    """投稿者リンク・時刻・投票数の要素（見つからなければ None）"""
+    author = next((a for a in el.select("a[href]")
+                   if (m := _PROFILE_HREF_RE.match(a["href"])) and m.group(1) not in _RESERVED_PATHS
+                   and a.get_text(strip=True)), None)
+    ts = el.select_one("time[datetime]") or next(
+        (s for s in el.select("span[title]") if re.search(r"\d{4}", s["title"])), None)
+    return {"author": author, "timestamp": ts, "votes": el.select_one("[aria-label*='vote' i]")}
+
+
+def _meta(el) -> Dict:
+    """投稿者・時刻・投票数を拾える範囲で拾う（取れなければ None）"""
+    n = _meta_nodes(el)
+    votes = None
+    if n["votes"] is not None:
+        m = re.search(r"-?\d[\d,]*", n["votes"].get_text(" ", strip=True) or n["votes"].get("aria-label", ""))
+        votes = int(m.group(0).replace(",", "")) if m else None
+    ts = n["timestamp"]
+    return {"author": n["author"].get_text(strip=True) if n["author"] is not None else None,
+            "timestamp": (ts.get("datetime") or ts.get("title")) if ts is not None else None,
+            "votes": votes}
+
+
+def split_posts(html: str) -> List[Dict]:
+    """
+    スレッド本文 HTML → 投稿レコード（md は未設定）。先頭は元投稿（id "op"）
+    返信はコメント要素の入れ子で判定し、各投稿の本文からは入れ子の返信を除く
+    """
+    soup = BeautifulSoup(html or "", _PARSER)
+    nodes = _comment_nodes(soup)
+    if not nodes:
+        return [{"id": OP_ID, "parent": None, "depth": 0, "author": None, "timestamp": None, "votes": None,
+                 "html": html or ""}]
+
+    node_ids = {id(n) for n in nodes}
+    ids: Dict[int, str] = {}
+    posts = []
+    for i, n in enumerate(nodes):
+        pid = _post_id(n, f"c{i}")
+        while pid in ids.values():  # 同じ ID が取れてしまった場合は連番で区別
+            pid += "_"
+        ids[id(n)] = pid
+        parent, depth = None, 0
+        for anc in n.parents:
+            if id(anc) in node_ids:
+                depth += 1
+                parent = parent or ids.get(id(anc))
+        posts.append({"id": pid, "parent": parent, "depth": depth, **_meta(n), "_node": n})
+
+    # 本文: 入れ子のコメントと、見出しに出す投稿者・時刻・投票数の要素を除いた HTML
+    # （先に文字列化してから元の木を崩す）
+    bodies = []
+    for p in posts:
+        frag = BeautifulSoup(str(p.pop("_node")), _PARSER)
+        for inner in _comment_nodes(frag)[1:]:
+            inner.decompose()
+        for node in _meta_nodes(frag).values():
+            if node is not None:
+                node.decompose()
+        bodies.append(str(frag))
+    for n in nodes:
+        n.decompose()
+    op = {"id": OP_ID, "parent": None, "depth": 0, "author": None, "timestamp": None, "votes": None,
+          "html": str(soup)}
+    for p, body in zip(posts, bodies):
+        p["html"] = body
+    return [op] + posts
+
+
+def convert_posts(posts: List[Dict], html2md: Callable[[str], str], previous: Optional[List[Dict]] = None,
+                  postprocess: Optional[Callable[[Dict, str], str]] = None) -> int:
+    """
+    各投稿に html_sha と md を付ける。previous（前回の JSONL）と html_sha が同じ投稿は変換しない
+    postprocess(post, md) で投稿ごとの整形ができる。戻り値: 実際に変換した件数
+    """
+    prev = {(p["id"], p.get("html_sha")): p.get("md", "") for p in (previous or [])}
+    converted = 0
+    for p in posts:
+        p["html_sha"] = sha(p["html"])
+        md = prev.get((p["id"], p["html_sha"]))
+        if md is None:
+            md = html2md(p["html"])
+            if postprocess:
+                md = postprocess(p, md)
+            converted += 1
+        p["md"] = md
+    return converted
+
+
+# ---------------- io ----------------
+def load_posts(path) -> List[Dict]:
+    p = pathlib.Path(path)
+    if not blob_store.exists(p):
+        return []
+    out = []
+    for line in blob_store.read_text(p).splitlines():
+        if line.strip():
+            try:
+                out.append(json.loads(line))
+            except ValueError:
+                continue
+    return out
+
+
+def save_posts(path, posts: List[Dict]) -> None:
+    write_text_atomic(path, "".join(json.dumps(x, ensure_ascii=False) + "\n" for x in posts))
+
+
+# ---------------- assemble ----------------
+def post_header(post: Dict) -> str:
+    bits = [post.get("author") or "(unknown)"]
+    if post.get("timestamp"):
+        bits.append(post["timestamp"])
+    if post.get("votes") is not None:
+        bits.append(f"▲{post['votes']}")
+    return "#### " + ("↳ " * post.get("depth", 0)) + " · ".join(bits)
+
+
+def assemble_thread_md(posts: List[Dict], bodies: Optional[Dict[str, str]] = None) -> str:
+    """
+    投稿を 1 つの Markdown にまとめる。bodies（投稿 id → 本文）を渡せばそれを使う（翻訳版の組み立て用）
+    1 投稿だけのときは本文をそのまま返す
+    """
+    def body(p):
+        return (bodies or {}).get(p["id"], p.get("md", "")).strip()
+
+    if len(posts) == 1:
+        return body(posts[0])
+    parts = [body(posts[0])] if body(posts[0]) else []
+    for p in posts[1:]:
+        parts.append(post_header(p) + "\n\n" + body(p))
+    return "\n\n---\n\n".join(parts).strip()
+
+
+def main():
+    import argparse
+    from html_to_markdown import html2md
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--split", required=True, help="保存済みのスレッド HTML")
+    args = ap.parse_args()
+    posts = split_posts(pathlib.Path(args.split).read_text(encoding="utf-8"))
+    convert_posts(posts, html2md)
+    for p in posts:
+        print(f"{p['id']:>10} parent={p['parent']} depth={p['depth']} author={p['author']} "
+              f"ts={p['timestamp']} votes={p['votes']} md={len(p['md'])} chars")
+
+
+if __name__ == "__main__":
+    main()
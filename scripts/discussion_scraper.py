@@ -1,158 +1,222 @@
 # discussion_scraper.py
-# pip install selenium webdriver-manager markdownify
+# pip install selenium webdriver-manager markdownify beautifulsoup4 lxml
 
 import re, time, pathlib
 from typing import List, Dict, Optional
+from urllib.parse import urljoin
+from bs4 import BeautifulSoup
 from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
-import markdownify
-
-
-# ============ 共通ユーティリティ ============
-def build_driver(headless: bool = True) -> webdriver.Chrome:
-    opt = webdriver.ChromeOptions()
-    if headless:
-        opt.add_argument("--headless=new")
-    opt.add_argument("--no-sandbox")
-    opt.add_argument("--disable-dev-shm-usage")
-    opt.add_argument("--window-size=1920,1080")
-    opt.add_argument("--disable-blink-features=AutomationControlled")
-    opt.add_experimental_option("excludeSwitches", ["enable-automation"])
-    opt.add_experimental_option("useAutomationExtension", False)
-    opt.add_argument(
-        "--user-agent=Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
-        "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-    )
-    drv = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=opt)
-    try:
-        drv.execute_cdp_cmd(
-            "Page.addScriptToEvaluateOnNewDocument",
-            {"source": "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})"},
-        )
-    except Exception:
-        pass
-    return drv
-
-
-def click_cookie_if_appears(driver: webdriver.Chrome) -> None:
-    for xp in [
-        "//div[contains(., 'OK, Got it.') and contains(@class,'bxFwkO')]",
-        "//button[contains(., 'Accept all') or contains(., 'Accept All')]",
-    ]:
-        try:
-            WebDriverWait(driver, 3).until(EC.element_to_be_clickable((By.XPATH, xp))).click()
-            time.sleep(0.2)
-            break
-        except Exception:
-            pass
+from selenium.common.exceptions import TimeoutException
+
+# 軽量プロファイル（画像/フォント/トラッカー遮断・eager）＋イベント駆動の待機
+from kaggle_browser import build_driver, log_timing, open_page, record_snapshot, scroll_until_stable
+from artifact_index import get_index
+from fileio import write_text_atomic
+from html_to_markdown import html2md  # 共通の HTML→Markdown 変換
+from discussion_posts import (OP_ID, assemble_thread_md, convert_posts, load_posts, posts_path, save_posts,
+                              split_posts)
 
 
-def _stabilize_page(driver: webdriver.Chrome, tries: int = 6, pause: float = 0.5) -> None:
-    last_h = 0
-    for _ in range(tries):
-        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-        time.sleep(pause)
-        h = driver.execute_script("return document.body.scrollHeight;")
-        if h == last_h:
+# ============ 一覧取得（/discussion/<id> のみ・コメント行は除外） ============
+# page_source を 1 回だけ取得し BeautifulSoup で解析する（アンカーごとの WebDriver 往復をしない）
+KAGGLE_BASE = "https://www.kaggle.com"
+_THREAD_HREF_RE = re.compile(r"/discussion/(\d+)/?$")
+_COMMENTS_RE = re.compile(r"(\d[\d,]*)\s*comments?\b", re.IGNORECASE)
+
+
+def _to_int(text: str) -> Optional[int]:
+    m = re.search(r"-?\d[\d,]*", text or "")
+    return int(m.group(0).replace(",", "")) if m else None
+
+
+def _item_container(a, tid: str):
+    """アンカーを含む 1 スレッド分の行（li か、他スレッドを含まない最大の祖先）"""
+    li = a.find_parent("li")
+    if li is not None:
+        return li
+    node = a
+    for _ in range(6):
+        parent = node.parent
+        if parent is None or parent.name in ("body", "html", "[document]"):
+            break
+        ids = {m.group(1) for x in parent.select("a[href*='/discussion/']")
+               if (m := _THREAD_HREF_RE.search(x.get("href", "")))}
+        if ids - {tid}:
             break
-        last_h = h
+        node = parent
+    return node
 
 
-def html2md(html: str) -> str:
-    return markdownify.markdownify(
-        html, heading_style="ATX", strip=["script", "style", "svg", "iframe"]
-    ).strip()
+def _item_meta(row) -> Dict:
+    """行から votes / comments / last_activity を拾う（無ければ None）"""
+    votes = None
+    for el in row.select("[class*='vote'], [aria-label*='vote']"):
+        votes = _to_int(el.get_text(" ", strip=True) or el.get("aria-label", ""))
+        if votes is not None:
+            break
 
+    m = _COMMENTS_RE.search(row.get_text(" ", strip=True))
+    comments = int(m.group(1).replace(",", "")) if m else None
 
-# ============ 一覧取得（/discussion/<id> のみ・コメント行は除外） ============
-# ============ 一覧取得（/discussion/<id> のみ・コメント行は除外） ============
-def list_discussions(list_url: str, max_items: int = 30, page: int = 1) -> List[Dict]:
-    # ページ番号に応じてURLを変える
-    if page > 1:
-        if "?" in list_url:
-            url = f"{list_url}&page={page}"
-        else:
-            url = f"{list_url}?page={page}"
+    last_activity = None
+    t = row.find("time")
+    if t is not None:
+        last_activity = t.get("datetime") or t.get("title") or t.get_text(strip=True)
     else:
-        url = list_url
+        for sp in row.select("span[title]"):
+            # Kaggle は相対表記（"2 days ago"）の title に絶対日時を入れている
+            if re.search(r"\d{4}", sp.get("title", "")):
+                last_activity = sp["title"]
+                break
+    return {"votes": votes, "comments": comments, "last_activity": last_activity}
+
 
-    driver = build_driver(headless=True)
+def parse_discussion_list(html: str, max_items: int = 30, base_url: str = KAGGLE_BASE) -> List[Dict]:
+    """
+    Discussion 一覧ページの HTML からスレッド情報を抽出する。
+    戻り値: [{"id", "title", "url", "votes", "comments", "last_activity"}, ...]
+    """
+    soup = BeautifulSoup(html, "html.parser")
     topics: List[Dict] = []
+    by_url: Dict[str, Dict] = {}
+    for a in soup.select("a[href*='/discussion/']"):
+        href = (a.get("href") or "").strip()
+        m = _THREAD_HREF_RE.search(href)
+        if not m:
+            continue
+        full = urljoin(base_url, href).rstrip("/")
+        title = a.get_text(" ", strip=True)
+
+        # “N comments” だけのリンクは件数として使い、一覧には出さない
+        cm = _COMMENTS_RE.fullmatch(title) if title else None
+        if cm or re.fullmatch(r"comments?", title, flags=re.IGNORECASE):
+            if full in by_url and cm and by_url[full]["comments"] is None:
+                by_url[full]["comments"] = int(cm.group(1).replace(",", ""))
+            continue
+        if full in by_url:
+            continue
+        if len(topics) >= max_items:
+            continue  # 既出スレッドの comments 補完のため走査だけ続ける
+
+        if not title:
+            h = a.find(["h3", "span"])
+            title = h.get_text(strip=True) if h else full.rsplit("/", 1)[-1]
+
+        item = {"id": m.group(1), "title": title, "url": full}
+        item.update(_item_meta(_item_container(a, m.group(1))))
+        topics.append(item)
+        by_url[full] = item
+    return topics
+
+
+# 一覧ページ・スレッドページの準備完了の目印（open_page / cdp_tabs 共通）
+LIST_READY = {"css": "a[href*='/discussion/']", "timeout": 15}
+THREAD_READY = {"xpath": "//main//*[self::h1 or self::h2 or self::h3]", "timeout": 15}
+
+
+def list_page_url(list_url: str, page: int = 1) -> str:
+    """ページ番号に応じてURLを変える"""
+    if page <= 1:
+        return list_url
+    return f"{list_url}{'&' if '?' in list_url else '?'}page={page}"
+
+
+# 一覧を開けたかどうか（readyState と HTTP ステータス。ステータスが取れない環境では 0）
+PAGE_STATUS_JS = """
+const nav = performance.getEntriesByType('navigation')[0];
+return [document.readyState, nav ? (nav.responseStatus || 0) : 0];
+"""
+
+
+class EmptyListPage(Exception):
+    """一覧ページは正常に開けたが、スレッドリンクが 1 件も無い（最終ページの先）"""
+
+
+def list_page_error(url: str, status) -> Exception:
+    """スレッドリンクが無かったときの例外。読み込みに失敗していれば（429 など）EmptyListPage にしない"""
+    state, code = (list(status or []) + ["", 0])[:2]
+    if state == "complete" and (code or 0) < 400:
+        return EmptyListPage(url)
+    return RuntimeError(f"list page not loaded (readyState={state!r} status={code}): {url}")
+
+
+def list_discussions(list_url: str, max_items: int = 30, page: int = 1,
+                     driver: Optional[webdriver.Chrome] = None) -> List[Dict]:
+    """
+    driver を渡すとそれを使い回す（渡さなければ 1 回限りの driver を起動して閉じる）
+    スレッドリンクが無いページは EmptyListPage、読み込みに失敗したページはそれ以外の例外
+    """
+    url = list_page_url(list_url, page)
+    own = driver is None
+    if own:
+        driver = build_driver(headless=True)
     try:
-        driver.get(url)
-        click_cookie_if_appears(driver)
-
-        WebDriverWait(driver, 15).until(
-            EC.presence_of_all_elements_located((By.CSS_SELECTOR, "a[href*='/discussion/']"))
-        )
-        anchors = driver.find_elements(By.CSS_SELECTOR, "a[href*='/discussion/']")
-
-        seen = set()
-        for a in anchors:
-            href = (a.get_attribute("href") or "").strip()
-            if not re.search(r"/discussion/\d+/?$", href):
-                continue
-            if href in seen:
-                continue
-
-            title = (a.text or "").strip()
-            if not title:
-                try:
-                    title = a.find_element(By.XPATH, ".//h3|.//span").text.strip()
-                except Exception:
-                    title = href.rsplit("/", 1)[-1]
-
-            if re.fullmatch(r"comments?", title, flags=re.IGNORECASE):
-                continue  # “comment(s)”のみの行は除外
-
-            votes = comments = ""
-            try:
-                votes = a.find_element(By.XPATH, ".//span[contains(@class,'vote')]").text
-            except Exception:
-                pass
-            try:
-                comments = a.find_element(By.XPATH, ".//span[contains(.,'comment')]").text
-            except Exception:
-                pass
-
-            topics.append({"title": title, "url": href, "votes": votes, "comments": comments})
-            seen.add(href)
-
-            if len(topics) >= max_items:
-                break
+        open_page(driver, url, **LIST_READY)
+        try:
+            WebDriverWait(driver, 1).until(
+                EC.presence_of_all_elements_located((By.CSS_SELECTOR, "a[href*='/discussion/']"))
+            )
+        except TimeoutException:
+            raise list_page_error(url, driver.execute_script(PAGE_STATUS_JS)) from None
+        html = driver.page_source
     finally:
-        driver.quit()
+        if own:
+            driver.quit()
+
+    t0 = time.perf_counter()
+    topics = parse_discussion_list(html, max_items=max_items)
+    log_timing("parse discussion list", time.perf_counter() - t0, f"({len(topics)} items)")
     return topics
 
 
-# ============ スレッド本文取得（まず素直に取得→あとで“最初の ### まで”上を削除） ============
-def _find_post_root(d: webdriver.Chrome):
-    """本文ルート候補（厳しく待たずに見つかったもので進む）"""
-    for xp in [
-        "//main//article[.//h1 or .//h2 or .//h3]",
-        "//article",
-        "//main",
-    ]:
-        try:
-            return d.find_element(By.XPATH, xp)
-        except Exception:
-            continue
-    return None
+def bench_parse(fixture: str, repeat: int = 50) -> None:
+    """保存済み一覧ページ（page_source）に対する parse_discussion_list の所要時間を計測"""
+    html = pathlib.Path(fixture).read_text(encoding="utf-8")
+    n = len(parse_discussion_list(html))
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        parse_discussion_list(html)
+    per = (time.perf_counter() - t0) / repeat
+    print(f"{fixture}: {n} items, {per * 1000:.1f} ms/parse ({len(html) / 1024:.0f}KB, x{repeat})")
 
 
-def _first_heading_from_root(root) -> Optional[webdriver.remote.webelement.WebElement]:
-    """本文ルートから最初の h1/h2/h3 を探す（header配下は除外）"""
-    if root is None:
-        return None
-    try:
-        hs = root.find_elements(By.XPATH, ".//*[self::h1 or self::h2 or self::h3][not(ancestor::header)]")
-        return hs[0] if hs else None
-    except Exception:
-        return None
+# ============ スレッド本文取得（まず素直に取得→あとで“最初の ### まで”上を削除） ============
+# 本文ルート探索→最初の見出し→見出し+後続兄弟の outerHTML 連結までを 1 回の execute_script で行う
+# （要素ごとの get_attribute は WebDriver の HTTP 往復になり、長いスレッドでは数秒かかるため）
+EXTRACT_THREAD_JS = """
+const xpFirst = (xp, ctx) => document.evaluate(
+  xp, ctx || document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+// 本文ルート候補（厳しく待たずに見つかったもので進む）
+let root = null;
+for (const xp of ["//main//article[.//h1 or .//h2 or .//h3]", "//article", "//main"]) {
+  root = xpFirst(xp);
+  if (root) break;
+}
+if (!root) return {mode: "page", html: document.documentElement.outerHTML, elements: 1};
+// 本文ルートから最初の h1/h2/h3 を探す（header配下は除外）
+const heading = xpFirst(".//*[self::h1 or self::h2 or self::h3][not(ancestor::header)]", root);
+if (!heading) return {mode: "root", html: root.innerHTML || "", elements: 1};
+// 見出し以降（タイトル要素+兄弟）
+const parts = [heading.outerHTML];
+for (let el = heading.nextElementSibling; el; el = el.nextElementSibling) {
+  const h = el.outerHTML || "";
+  if (h.trim()) parts.push(h);
+}
+return {mode: "heading", html: parts.join("\\n"), elements: parts.length};
+"""
+
+
+def _extract_thread_html(d: webdriver.Chrome) -> Dict:
+    """スレッド本文 HTML を 1 往復で取得（mode: heading / root / page）"""
+    t0 = time.perf_counter()
+    res = d.execute_script(EXTRACT_THREAD_JS) or {"mode": "page", "html": d.page_source, "elements": 1}
+    log_timing("extract thread", time.perf_counter() - t0,
+               f"(mode={res.get('mode')} elements={res.get('elements')} "
+               f"html={len(res.get('html') or '') / 1024:.0f}KB)")
+    return res
 
 
 def _cut_above_first_heading(md: str) -> str:
@@ -180,52 +244,74 @@ def _promote_first_heading_to_h1(md: str) -> str:
             break
     return '\n'.join(lines).strip()
 
-def fetch_thread_markdown(thread_url: str, keep_header: bool = False) -> str:
-    d = build_driver(headless=True)
-    try:
-        d.get(thread_url)
-        click_cookie_if_appears(d)
-        _stabilize_page(d)
-
-        root = _find_post_root(d)
-
-        if root is None:
-            # 最終フォールバック：ページ全体をMD化
-            base_md = html2md(d.page_source)
-        else:
-            # 可能なら見出し以降（タイトル要素+兄弟）をHTMLで組み立て
-            heading = _first_heading_from_root(root)
-            if heading is not None:
-                parts = [heading.get_attribute("outerHTML")]
-                for el in heading.find_elements(By.XPATH, "./following-sibling::*"):
-                    h = el.get_attribute("outerHTML") or ""
-                    if h.strip():
-                        parts.append(h)
-                body_html = "\n".join(parts)
-                base_md = html2md(body_html)
-            else:
-                # ルート全体
-                base_md = html2md(root.get_attribute("innerHTML") or "")
-
-        md = base_md.strip()
-        if not keep_header:
-            md = _cut_above_first_heading(md)
-        
-        md = _promote_first_heading_to_h1(md)
+def _tidy_post_md(keep_header: bool):
+    def tidy(post: Dict, md: str) -> str:
+        md = md.strip()
+        if post["id"] == OP_ID:
+            if not keep_header:
+                md = _cut_above_first_heading(md)
+            md = _promote_first_heading_to_h1(md)
         # 余計な連続空行を軽く整形
-        md = re.sub(r"\n{3,}", "\n\n", md).strip()
-        return md
+        return re.sub(r"\n{3,}", "\n\n", md).strip()
+    return tidy
 
+
+def fetch_thread_posts(thread_url: str, keep_header: bool = False, driver: Optional[webdriver.Chrome] = None,
+                       previous: Optional[List[Dict]] = None) -> List[Dict]:
+    """
+    スレッドを投稿単位のレコードで返す（discussion_posts.split_posts 参照）
+    previous（前回の投稿レコード）と HTML が同じ投稿は Markdown 変換を省く
+    """
+    own = driver is None
+    d = build_driver(headless=True) if own else driver
+    try:
+        open_page(d, thread_url, **THREAD_READY)
+        scroll_until_stable(d)
+        record_snapshot(d, thread_url)  # 記録モード: 遅延読み込み後の DOM で上書き
+
+        res = _extract_thread_html(d)
     finally:
-        d.quit()
+        if own:
+            d.quit()
+    return thread_posts_from_html(res.get("html") or "", keep_header=keep_header, previous=previous)
+
+
+def thread_posts_from_html(html: str, keep_header: bool = False,
+                           previous: Optional[List[Dict]] = None) -> List[Dict]:
+    """抽出済みのスレッド本文 HTML → 投稿レコード（ブラウザ操作を含まない部分）"""
+    t0 = time.perf_counter()
+    posts = split_posts(html)
+    converted = convert_posts(posts, html2md, previous, postprocess=_tidy_post_md(keep_header))
+    log_timing("html2md thread", time.perf_counter() - t0, f"({converted}/{len(posts)} posts converted)")
+    return posts
 
 
-def save_thread_md(thread_url: str, out_dir: str = "out/discussion", keep_header: bool = False) -> pathlib.Path:
+def fetch_thread_markdown(thread_url: str, keep_header: bool = False,
+                          driver: Optional[webdriver.Chrome] = None) -> str:
+    return assemble_thread_md(fetch_thread_posts(thread_url, keep_header=keep_header, driver=driver))
+
+
+def save_thread_md(thread_url: str, out_dir: str = "out/discussion", keep_header: bool = False,
+                   driver: Optional[webdriver.Chrome] = None) -> pathlib.Path:
+    """discussion_<id>.md と投稿単位の discussion_<id>.posts.jsonl を保存"""
+    path = thread_md_path(thread_url, out_dir)
+    posts = fetch_thread_posts(thread_url, keep_header=keep_header, driver=driver,
+                               previous=load_posts(posts_path(path)))
+    return write_thread(path, thread_url, posts)
+
+
+def thread_md_path(thread_url: str, out_dir: str = "out/discussion") -> pathlib.Path:
     outp = pathlib.Path(out_dir); outp.mkdir(parents=True, exist_ok=True)
     tid = thread_url.rstrip("/").split("/")[-1]
-    md = fetch_thread_markdown(thread_url, keep_header=keep_header)
-    path = outp / f"discussion_{tid}.md"
-    path.write_text(md, encoding="utf-8")
+    return outp / f"discussion_{tid}.md"
+
+
+def write_thread(path: pathlib.Path, thread_url: str, posts: List[Dict]) -> pathlib.Path:
+    """投稿レコードから .posts.jsonl / .md を書き、索引に記録する"""
+    save_posts(posts_path(path), posts)
+    md = assemble_thread_md(posts)
+    write_text_atomic(path, md)
+    get_index().record_fetch(path, thread_url, kind="discussion", text=md, extra={"posts": len(posts)})
     return path
 
 
@@ -240,13 +326,17 @@ if __name__ == "__main__":
     ap.add_argument("--out", default="out/discussion", help="スレッド保存先ディレクトリ")
     ap.add_argument("--keep-header", action="store_true", help="上部を削らずそのまま出力（デバッグ用）")
     ap.add_argument("--page", type=int, default=1, help="リスト取得時のページ番号 (デフォルト=1)")
+    ap.add_argument("--bench-parse", help="保存済み一覧ページHTMLで一覧パーサを計測（ネットワーク不要）")
     args = ap.parse_args()
 
-    if args.list:
+    if args.bench_parse:
+        bench_parse(args.bench_parse)
+    elif args.list:
         items = list_discussions(args.list, max_items=args.max, page=args.page)
         print(f"=== Page {args.page} ===")
         for i, it in enumerate(items, 1):
-            print(f"{i:02d}. {it['title']} -> {it['url']}")
+            meta = " ".join(f"{k}={it[k]}" for k in ("votes", "comments", "last_activity") if it.get(k) is not None)
+            print(f"{i:02d}. {it['title']} -> {it['url']}" + (f"  [{meta}]" if meta else ""))
     elif args.thread:
         p = save_thread_md(args.thread, out_dir=args.out, keep_header=args.keep_header)
         print("Saved:", p)
@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+生成物の書き込み（一時ファイルに書いてから os.replace で置き換える）
+- 読み手（app の別セッション・検索索引など）は書きかけの内容を見ない
+- 同じパスに同時に書いても中身が混ざらない（どちらか一方が残る）
+他のモジュールに依存しないので、artifact_index / blob_store などどこからでも import できる
+"""
+
+import os, pathlib, threading
+
+
+def write_bytes_atomic(path, data: bytes) -> None:
+    p = pathlib.Path(path)
+    tmp = p.with_name(f".{p.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        tmp.write_bytes(data)
+        os.replace(tmp, p)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def write_text_atomic(path, text: str) -> None:
+    write_bytes_atomic(path, text.encode("utf-8"))
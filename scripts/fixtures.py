@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+スクレイパーの記録／再生（オフラインでのベンチマーク・回帰確認用）
+- 記録: 環境変数 KAGGLE_RECORD_DIR=<dir> を付けて普段どおり実行すると、
+        ブラウザで開いたページ（描画後 DOM、<script> は除去）と HTTP で取得した本文
+        （rendered-kernel HTML など）を <dir> に保存する
+- 再生: KAGGLE_REPLAY_URL=http://127.0.0.1:8800 を付けると、各スクレイパーの URL が
+        ローカル再生サーバに向く（https://www.kaggle.com/x → http://127.0.0.1:8800/www.kaggle.com/x）
+- 同じ URL をブラウザと HTTP の両方で取った場合（course の iframe 解決のフォールバックなど）は
+  種類（page / http）ごとに別々に保存し、再生でも取った方法に合う方を返す（HTTP は /_http/ 付きの URL で取りに来る）
+Usage:
+  KAGGLE_RECORD_DIR=fixtures/titanic python3 save_kaggle_comp_markdown.py --url https://www.kaggle.com/competitions/titanic
+  python3 fixtures.py serve --store fixtures/titanic --port 8800
+  python3 fixtures.py bench --store fixtures/titanic --update-golden   # 初回: 出力を golden として保存
+  python3 fixtures.py bench --store fixtures/titanic                   # 以降: 所要時間 + golden との一致を確認
+  python3 fixtures.py serve-api --kernels fixtures/kernels --port 8801  # Kaggle API の代替（<user>/<slug>.ipynb を返す）
+  KAGGLE_API_ENDPOINT=http://127.0.0.1:8801/api/v1 python3 pull_kernel_to_markdown.py --user <user> --out /tmp/k
+"""
+
+import os, re, sys, json, time, hashlib, pathlib, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlsplit
+
+INDEX_NAME = "index.json"
+HTTP_PREFIX = "/_http"  # 再生サーバへの HTTP 取得（kind="http"）の目印。無ければブラウザのページ（kind="page"）
+_SCRIPT_RE = re.compile(r"<script\b[^>]*>.*?</script>", re.S | re.I)
+
+
+# ---------- URL の付け替え（再生時） ----------
+def replay_url(url: str, kind: str = "page") -> str:
+    """KAGGLE_REPLAY_URL が設定されていれば再生サーバ上の URL に付け替える（kind は記録の種類）"""
+    base = os.getenv("KAGGLE_REPLAY_URL")
+    if not base or url.startswith(base):
+        return url
+    parts = urlsplit(url)
+    if not parts.netloc:
+        return url
+    prefix = HTTP_PREFIX if kind == "http" else ""
+    return (base.rstrip("/") + prefix + "/" + parts.netloc + parts.path
+            + (f"?{parts.query}" if parts.query else ""))
+
+
+def original_url(path_qs: str) -> tuple:
+    """再生サーバのパス（[/_http]/<host>/<path>?<query>）を (元の URL, kind) に戻す"""
+    kind = "page"
+    if path_qs.startswith(HTTP_PREFIX + "/"):
+        path_qs, kind = path_qs[len(HTTP_PREFIX):], "http"
+    return "https://" + path_qs.lstrip("/"), kind
+
+
+# ---------- store ----------
+class FixtureStore:
+    """<root>/index.json に "<kind> <url>" -> {url, file, kind, content_type, recorded_at} を持つ"""
+
+    def __init__(self, root):
+        self.root = pathlib.Path(root)
+        self._lock = threading.Lock()
+
+    @property
+    def index_path(self) -> pathlib.Path:
+        return self.root / INDEX_NAME
+
+    def index(self) -> Dict[str, Dict]:
+        try:
+            return json.loads(self.index_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def key(url: str, kind: str) -> str:
+        return f"{kind} {url}"
+
+    def put(self, url: str, body: bytes, kind: str, content_type: str = "text/html; charset=utf-8") -> None:
+        key = self.key(url, kind)
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16] + ".html"
+        with self._lock:
+            self.root.mkdir(parents=True, exist_ok=True)
+            (self.root / name).write_bytes(body)
+            idx = self.index()
+            idx[key] = {"url": url, "file": name, "kind": kind, "content_type": content_type,
+                        "recorded_at": time.time()}
+            tmp = self.index_path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(idx, ensure_ascii=False, indent=2), encoding="utf-8")
+            os.replace(tmp, self.index_path)
+
+    def get(self, url: str, kind: str = "page") -> Optional[tuple]:
+        idx = self.index()
+        meta = idx.get(self.key(url, kind)) or idx.get(url)  # 種類を持たない古い記録は URL だけで引く
+        if not meta:
+            return None
+        return (self.root / meta["file"]).read_bytes(), meta.get("content_type", "text/html; charset=utf-8")
+
+
+_recorder: Optional[FixtureStore] = None
+_rec_lock = threading.Lock()
+
+
+def recorder() -> Optional[FixtureStore]:
+    global _recorder
+    root = os.getenv("KAGGLE_RECORD_DIR")
+    if not root:
+        return None
+    with _rec_lock:
+        if _recorder is None or _recorder.root != pathlib.Path(root):
+            _recorder = FixtureStore(root)
+        return _recorder
+
+
+def record_page(url: str, page_source: str) -> None:
+    """ブラウザで描画済みの DOM を保存（再生時に JS が DOM を作り直さないよう <script> を除く）"""
+    rec = recorder()
+    if rec:
+        rec.put(url, _SCRIPT_RE.sub("", page_source).encode("utf-8"), kind="page")
+
+
+def record_http(url: str, body: bytes, content_type: Optional[str]) -> None:
+    rec = recorder()
+    if rec:
+        rec.put(url, body, kind="http", content_type=content_type or "application/octet-stream")
+
+
+# ---------- replay server ----------
+def make_server(store: FixtureStore, host: str = "127.0.0.1", port: int = 8800) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url, kind = original_url(self.path)
+            hit = store.get(url, kind) or store.get("http://" + url[len("https://"):], kind)
+            if hit is None:
+                self.send_error(404, "not recorded")
+                return
+            body, ctype = hit
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+# ---------- Kaggle API stand-in ----------
+def make_api_server(kernels_dir, host: str = "127.0.0.1", port: int = 8801) -> ThreadingHTTPServer:
+    """
+    kernels/list と kernels/pull だけを返す Kaggle API の代替サーバ（認証は見ない）
+    <kernels_dir>/<user>/<slug>.ipynb をノートとして扱い、版番号はファイルの更新時刻
+    """
+    root = pathlib.Path(kernels_dir)
+
+    def meta(path: pathlib.Path) -> Dict:
+        user, slug = path.parent.name, path.stem
+        mtime = int(path.stat().st_mtime)
+        return {"ref": f"{user}/{slug}", "title": slug, "author": user, "slug": slug,
+                "kernelType": "notebook", "currentVersionNumber": mtime,
+                "lastRunTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(mtime))}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            q = {k: v[0] for k, v in parse_qs(parts.query).items()}
+            if parts.path.endswith("/kernels/list"):
+                page, size = int(q.get("page", 1)), int(q.get("pageSize", 20))
+                files = sorted((root / q.get("user", "")).glob("*.ipynb"))
+                self._json([meta(f) for f in files[(page - 1) * size:page * size]])
+            elif parts.path.endswith("/kernels/pull"):
+                f = root / q.get("userName", "") / f"{q.get('kernelSlug', '')}.ipynb"
+                if not f.is_file():
+                    self.send_error(404, "no such kernel")
+                    return
+                self._json({"metadata": meta(f),
+                            "blob": {"source": f.read_text(encoding="utf-8"), "language": "python",
+                                     "kernelType": "notebook"}})
+            else:
+                self.send_error(404)
+
+        def _json(self, obj):
+            body = json.dumps(obj).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+# ---------- benchmark / regression ----------
+def fetcher_for(url: str):
+    """URL の形から対応する取得関数を選ぶ（(名前, 関数) or None）"""
+    from kaggle_browser import build_driver  # kaggle_browser がこのモジュールを import するので関数内で読む
+    path = urlsplit(url).path.rstrip("/")
+    if re.search(r"/competitions/[^/]+/overview$", path):
+        from save_kaggle_comp_markdown import fetch_overview
+        return "fetch_overview", lambda u: _with_driver(build_driver, fetch_overview, u)
+    if re.search(r"/competitions/[^/]+/(data|rules)$", path):
+        from save_kaggle_comp_markdown import fetch_generic_tab
+        return "fetch_generic_tab", lambda u: _with_driver(build_driver, fetch_generic_tab, u)
+    if re.search(r"/discussion/\d+$", path):
+        from discussion_scraper import fetch_thread_markdown
+        return "fetch_thread_markdown", fetch_thread_markdown
+    if path.endswith("/discussion"):
+        from discussion_scraper import list_discussions
+        return "list_discussions", lambda u: json.dumps(list_discussions(u, max_items=1000),
+                                                         ensure_ascii=False, indent=1)
+    if re.search(r"/code/[^/]+/[^/]+$", path):
+        from save_kaggle_course_markdown import fetch_notebook_markdown
+        return "fetch_notebook_markdown", fetch_notebook_markdown
+    return None
+
+
+def _with_driver(build_driver, fn, url):
+    d = build_driver(headless=True)
+    try:
+        return fn(d, url)
+    finally:
+        d.quit()
+
+
+def bench(store_dir: str, port: int = 8800, update_golden: bool = False) -> int:
+    """記録済みページを再生サーバ経由で各取得関数に通し、時間と golden との差分を表示。不一致数を返す"""
+    store = FixtureStore(store_dir)
+    srv = make_server(store, port=port)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    os.environ["KAGGLE_REPLAY_URL"] = f"http://127.0.0.1:{srv.server_address[1]}"
+    os.environ.pop("KAGGLE_RECORD_DIR", None)
+    os.environ.setdefault("KAGGLE_HTTP_CACHE_MAX_MB", "0")  # 計測にディスクキャッシュを混ぜない
+
+    golden_dir = store.root / "golden"
+    golden_dir.mkdir(exist_ok=True)
+    bad = 0
+    try:
+        pages: Dict[str, Dict] = {}
+        for key, meta in store.index().items():  # 同じ URL の page と http は 1 回だけ（取得関数が両方使う）
+            url = meta.get("url", key)
+            if url not in pages or meta.get("kind") == "page":
+                pages[url] = meta
+        for url, meta in sorted(pages.items()):
+            f = fetcher_for(url)
+            if f is None:
+                continue
+            name, fn = f
+            t0 = time.perf_counter()
+            try:
+                out = fn(url)
+            except Exception as e:
+                bad += 1
+                print(f"ERR  {name:24s} {url}  {e!r}")
+                continue
+            dt = time.perf_counter() - t0
+            golden = golden_dir / (meta["file"].rsplit(".", 1)[0] + ".md")
+            if update_golden or not golden.exists():
+                golden.write_text(out, encoding="utf-8")
+                status = "SAVE"
+            elif golden.read_text(encoding="utf-8") == out:
+                status = "OK  "
+            else:
+                status = "DIFF"
+                bad += 1
+            print(f"{status} {name:24s} {dt:6.2f}s  {url}")
+    finally:
+        srv.shutdown()
+    return bad
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sp = sub.add_parser("serve", help="記録済みページを再生する HTTP サーバを起動")
+    sp.add_argument("--store", required=True)
+    sp.add_argument("--port", type=int, default=8800)
+    ap_ = sub.add_parser("serve-api", help="Kaggle API（kernels/list, kernels/pull）の代替サーバを起動")
+    ap_.add_argument("--kernels", required=True, help="<user>/<slug>.ipynb を置いたディレクトリ")
+    ap_.add_argument("--port", type=int, default=8801)
+    bp = sub.add_parser("bench", help="再生サーバ経由で各取得関数の時間と golden 一致を確認")
+    bp.add_argument("--store", required=True)
+    bp.add_argument("--port", type=int, default=0, help="0 なら空きポート")
+    bp.add_argument("--update-golden", action="store_true")
+    args = ap.parse_args()
+
+    if args.cmd == "serve":
+        srv = make_server(FixtureStore(args.store), port=args.port)
+        print(f"replaying {args.store} on http://127.0.0.1:{args.port}  "
+              f"(export KAGGLE_REPLAY_URL=http://127.0.0.1:{args.port})")
+        try:
+            srv.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    elif args.cmd == "serve-api":
+        srv = make_api_server(args.kernels, port=args.port)
+        print(f"serving kernels in {args.kernels} on http://127.0.0.1:{args.port}  "
+              f"(export KAGGLE_API_ENDPOINT=http://127.0.0.1:{args.port}/api/v1)")
+        try:
+            srv.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    else:
+        sys.exit(1 if bench(args.store, port=args.port, update_golden=args.update_golden) else 0)
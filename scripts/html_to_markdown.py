@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTML → Markdown 変換（全スクリプト共通）
+- 出力は従来の markdownify(html, heading_style="ATX", strip=[script, style, svg, iframe]).strip() と同一
+- 解析は従来どおり html.parser（閉じタグの補い方などが変わらないよう、木は markdownify と同じものを使う）
+- 単純な表（セルが文字列だけの <table>。ノートブック出力の DataFrame など）だけを lxml で直接
+  Markdown 化して差し込み、markdownify の要素ごとの再帰処理を省く（lxml が無ければ従来の変換のみ）。
+  初回呼び出し時に markdownify の出力と突き合わせ、一致しなければ高速経路は使わない。
+Usage:
+  python3 html_to_markdown.py --bench rendered_notebook.html
+  python3 html_to_markdown.py --check fixtures/html            # <stem>.html と <stem>.md（golden）を比較
+  python3 html_to_markdown.py --check fixtures/html --update   # golden を現在の出力で作り直す
+"""
+
+import re, sys, time, pathlib, threading
+from typing import List, Optional
+
+import markdownify
+from bs4 import BeautifulSoup
+
+from tracing import span
+
+try:
+    import lxml.html
+    HAVE_LXML = True
+except ImportError:  # lxml が無い環境では従来どおり html.parser + markdownify
+    HAVE_LXML = False
+
+MD_OPTIONS = dict(heading_style="ATX", strip=["script", "style", "svg", "iframe"])
+# 木を作るパーサ（markdownify と同じ）。HTML を切り分けてから変換する側（discussion_posts）もこれを使う
+PARSER = "html.parser"
+
+# 表の高速経路を適用してよい祖先（markdownify がインデントや接頭辞を付けないブロック）
+_TRANSPARENT_ANCESTORS = {"html", "body", "div", "section", "article", "main"}
+_ROW_GROUPS = {"thead", "tbody", "tfoot"}
+_PLACEHOLDER = "KGMDTABLE{}X"
+
+_re_whitespace = re.compile(r"[\t ]+")
+_re_newline_whitespace = re.compile(r"[\t \r\n]*[\r\n][\t \r\n]*")
+
+
+def html2md_reference(html: str) -> str:
+    """従来実装（html.parser + markdownify）。比較・フォールバック用"""
+    return markdownify.markdownify(html, **MD_OPTIONS).strip()
+
+
+# ---------- 表の高速経路 ----------
+def _prev_element(el):
+    """直前の兄弟要素（コメント等は飛ばす。BeautifulSoup の find_previous_sibling() 相当）"""
+    p = el.getprevious()
+    while p is not None and not isinstance(p.tag, str):
+        p = p.getprevious()
+    return p
+
+
+def _colspan(cell) -> int:
+    v = cell.get("colspan")
+    return max(1, min(1000, int(v))) if v and v.isdigit() else 1
+
+
+class _TableConverter:
+    def __init__(self):
+        self._conv = markdownify.MarkdownConverter(**MD_OPTIONS)
+
+    def cell_text(self, cell) -> str:
+        text = cell.text or ""
+        text = _re_newline_whitespace.sub("\n", text)
+        text = _re_whitespace.sub(" ", text)
+        text = self._conv.escape(text, set()).strip()
+        return " " + text.replace("\n", " ") + " |" * _colspan(cell)
+
+    def row(self, tr) -> str:
+        cells = [c for c in tr if isinstance(c.tag, str)]
+        parent = tr.getparent()
+        is_first_row = _prev_element(tr) is None
+        is_headrow = all(c.tag == "th" for c in cells) or (
+            parent.tag == "thead" and len(parent.findall("tr")) == 1
+        )
+        table = parent if parent.tag == "table" else parent.getparent()
+        is_head_row_missing = (is_first_row and parent.tag != "tbody") or (
+            is_first_row and parent.tag == "tbody" and not table.findall(".//thead")
+        )
+        infer = self._conv.options.get("table_infer_header", False)
+        full = sum(_colspan(c) for c in cells)
+        overline = underline = ""
+        if (is_headrow or (is_head_row_missing and infer)) and is_first_row:
+            underline = "| " + " | ".join(["---"] * full) + " |\n"
+        elif (is_head_row_missing and not infer) or (
+            is_first_row and (parent.tag == "table" or (parent.tag == "tbody" and _prev_element(parent) is None))
+        ):
+            overline = "| " + " | ".join([""] * full) + " |\n" + "| " + " | ".join(["---"] * full) + " |\n"
+        return overline + "|" + "".join(self.cell_text(c) for c in cells) + "\n" + underline
+
+    def rows(self, table) -> Optional[List]:
+        """高速経路で扱える単純な表なら tr のリストを、そうでなければ None を返す"""
+        if (table.text or "").strip():
+            return None
+        rows = []
+        for child in table:
+            if not isinstance(child.tag, str):
+                continue
+            if (child.tail or "").strip():
+                return None
+            groups = [child] if child.tag == "tr" else (list(child) if child.tag in _ROW_GROUPS else None)
+            if groups is None:
+                return None  # caption / colgroup などは従来処理に任せる
+            for tr in groups:
+                if not isinstance(tr.tag, str):
+                    continue
+                if tr.tag != "tr" or (tr.tail or "").strip() or (tr.text or "").strip():
+                    return None
+                for c in tr:
+                    if not isinstance(c.tag, str):
+                        if c.tail and c.tail.strip():
+                            return None
+                        continue
+                    if c.tag not in ("td", "th") or len(c) or (c.tail or "").strip():
+                        return None
+                rows.append(tr)
+        return rows
+
+    def convert(self, table) -> Optional[str]:
+        rows = self.rows(table)
+        if not rows:
+            return None
+        return "".join(self.row(tr) for tr in rows).strip()
+
+
+_tables = None
+_fast_ok = None
+_fast_lock = threading.Lock()
+
+_CALIBRATION_HTML = (
+    "<div><p>a_b *c*</p>"
+    "<table><thead><tr><th></th><th>col_1</th><th colspan=\"2\">x*y</th></tr></thead>"
+    "<tbody><tr><th>0</th><td> 1.5 </td><td>a\n b</td><td></td></tr>"
+    "<tr><th>1</th><td>&amp;</td><td>__</td><td>z</td></tr></tbody></table>"
+    "<table><tr><td>no</td><td>head</td></tr><tr><td>1</td><td>2</td></tr></table>"
+    "<table><tbody><tr><td>a</td></tr></tbody></table>"
+    "text<table><tr><th>h</th></tr><tr><td>v</td></tr></table>tail"
+    "<ul><li>one<li>two</ul><p>x<p>y</div>"
+)
+
+
+def _fast_path_enabled() -> bool:
+    """インストール済み markdownify と表の出力が一致するかを 1 回だけ確認"""
+    global _tables, _fast_ok
+    with _fast_lock:
+        if _fast_ok is None:
+            _tables = _TableConverter()
+            try:
+                _fast_ok = _convert_lxml(_CALIBRATION_HTML, use_tables=True) == html2md_reference(_CALIBRATION_HTML)
+            except Exception:
+                _fast_ok = False
+            if not _fast_ok:
+                print("[html2md] table fast path disabled (markdownify output differs)", file=sys.stderr)
+        return _fast_ok
+
+
+def _convert_lxml(html: str, use_tables: bool) -> str:
+    """html.parser の木で変換し、高速経路で扱える表だけ lxml で Markdown 化した結果に差し替える"""
+    if not use_tables or "<table" not in html:
+        return html2md_reference(html)
+
+    conv = markdownify.MarkdownConverter(**MD_OPTIONS)
+    soup = BeautifulSoup(html, PARSER)
+    done = {}
+    for table in soup.find_all("table"):
+        if any(a.name not in _TRANSPARENT_ANCESTORS for a in table.parents if a is not soup):
+            continue
+        md = _tables.convert(lxml.html.fragment_fromstring(str(table)))
+        if md is None:
+            continue
+        token = _PLACEHOLDER.format(len(done))
+        if token in html:
+            continue
+        p = soup.new_tag("p")
+        p.string = token
+        table.replace_with(p)
+        done[token] = md
+    if not done:
+        return html2md_reference(html)
+
+    out = conv.convert_soup(soup).strip()
+    for token, md in done.items():
+        out = out.replace(token, md, 1)
+    return out
+
+
+def html2md(html: str) -> str:
+    with span("html2md", "convert", chars=len(html), lxml=HAVE_LXML):
+        if not HAVE_LXML:
+            return html2md_reference(html)
+        return _convert_lxml(html, use_tables=_fast_path_enabled())
+
+
+# ---------- golden check / benchmark ----------
+def check(fixture_dir: str, update: bool = False) -> int:
+    """<stem>.html を変換し、<stem>.md（golden）および従来実装と比較。不一致数を返す"""
+    bad = 0
+    for src in sorted(pathlib.Path(fixture_dir).rglob("*.html")):
+        html = src.read_text(encoding="utf-8")
+        out = html2md(html)
+        golden = src.with_suffix(".md")
+        if update:
+            golden.write_text(out, encoding="utf-8")
+            print("updated:", golden)
+            continue
+        problems = []
+        if out != html2md_reference(html):
+            problems.append("differs from markdownify")
+        if golden.exists() and out != golden.read_text(encoding="utf-8"):
+            problems.append(f"differs from {golden.name}")
+        bad += bool(problems)
+        print(("NG " if problems else "OK ") + str(src) + ("  " + ", ".join(problems) if problems else ""))
+    return bad
+
+
+def bench(path: str, repeat: int = 3) -> None:
+    html = pathlib.Path(path).read_text(encoding="utf-8")
+    html2md(html)  # 高速経路の判定を計測から外す
+
+    def best(fn):
+        ts = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn(html)
+            ts.append(time.perf_counter() - t0)
+        return min(ts)
+
+    ref, new = best(html2md_reference), best(html2md)
+    print(f"{path}: {len(html) / 1024:.0f}KB  markdownify={ref:.3f}s  html2md={new:.3f}s  x{ref / max(new, 1e-9):.1f}"
+          f"  (lxml={'on' if HAVE_LXML else 'off'}, tables={'on' if HAVE_LXML and _fast_ok else 'off'})")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--bench", nargs="*", default=[], help="計測する HTML ファイル")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--check", help="golden 比較するフィクスチャディレクトリ（*.html と *.md）")
+    ap.add_argument("--update", action="store_true", help="--check の golden を現在の出力で上書き")
+    args = ap.parse_args()
+
+    if args.check:
+        sys.exit(1 if check(args.check, update=args.update) else 0)
+    for p in args.bench:
+        bench(p, repeat=args.repeat)
+    if not args.check and not args.bench:
+        ap.print_help()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+app の複数セッションから来る重い処理（Chrome での取得・Gemini 翻訳）をプロセス内で調停する
+- 同じキー（操作 + URL / ファイル）の処理が実行中なら新しく起動せず、その結果を待って共有する（single-flight）
+- 種類ごとに同時実行数の上限（ブラウザ / 翻訳 / API）を持ち、空くまで待たせる。待ちが多すぎれば即座に断る
+- 別プロセス（scheduler や CLI）と同じキーがぶつからないよう、実行中はキーごとのロックファイルも握る。
+  still_needed を渡せば、ロック待ちの間に他が済ませた処理は実行しない
+環境変数:
+  KAGGLE_MAX_BROWSERS      ブラウザを使う処理の同時実行数（既定: 3）
+  KAGGLE_MAX_TRANSLATIONS  翻訳の同時実行数（既定: 2）
+  KAGGLE_MAX_API_JOBS      Kaggle API を使う処理の同時実行数（既定: 4）
+  KAGGLE_MAX_WAITING       空き待ちの上限。超えたら Busy（既定: 16）
+"""
+
+import os, hashlib, pathlib, threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows ではプロセス間ロックなし（プロセス内の調停だけ）
+    fcntl = None
+
+DEFAULT_LIMITS = {"browser": 3, "translate": 2, "api": 4}
+DEFAULT_MAX_WAITING = 16
+ADMISSION_TIMEOUT = 600.0
+LOCK_DIR = pathlib.Path(__file__).resolve().parent.parent / "out" / ".locks"
+
+
+class Busy(RuntimeError):
+    """待ち行列が一杯、または空き待ちが ADMISSION_TIMEOUT を超えた"""
+
+
+class _Limiter:
+    """重み付きの同時実行数制限（1 つの処理が複数のブラウザを使う場合は weight で数える）"""
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self.in_use = 0
+        self.waiting = 0
+        self.peak = 0
+        self._cv = threading.Condition()
+
+    def acquire(self, weight: int, timeout: float, max_waiting: int) -> None:
+        weight = min(max(1, weight), self.capacity)
+        with self._cv:
+            if self.in_use + weight > self.capacity:
+                if self.waiting >= max_waiting:
+                    raise Busy(f"too many waiting jobs ({self.waiting})")
+                self.waiting += 1
+                try:
+                    if not self._cv.wait_for(lambda: self.in_use + weight <= self.capacity, timeout):
+                        raise Busy(f"no free slot within {timeout:.0f}s")
+                finally:
+                    self.waiting -= 1
+            self.in_use += weight
+            self.peak = max(self.peak, self.in_use)
+
+    def release(self, weight: int) -> None:
+        weight = min(max(1, weight), self.capacity)
+        with self._cv:
+            self.in_use -= weight
+            self._cv.notify_all()
+
+
+@contextmanager
+def _file_lock(key: str, lock_dir: Optional[pathlib.Path]) -> Iterator[None]:
+    if fcntl is None or lock_dir is None:
+        yield
+        return
+    lock_dir.mkdir(parents=True, exist_ok=True)
+    path = lock_dir / (hashlib.sha1(key.encode("utf-8")).hexdigest()[:20] + ".lock")
+    with open(path, "a+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class Coordinator:
+    def __init__(self, limits: Optional[Dict[str, int]] = None, max_waiting: Optional[int] = None,
+                 lock_dir: Optional[pathlib.Path] = LOCK_DIR, timeout: float = ADMISSION_TIMEOUT):
+        limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self._limiters = {k: _Limiter(v) for k, v in limits.items()}
+        self.max_waiting = DEFAULT_MAX_WAITING if max_waiting is None else max_waiting
+        self.lock_dir = lock_dir
+        self.timeout = timeout
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.stats = {"started": 0, "coalesced": 0, "skipped": 0, "rejected": 0, "failed": 0}
+
+    def run(self, key: str, kind: str, fn: Callable[[], object], weight: int = 1,
+            still_needed: Optional[Callable[[], bool]] = None) -> Tuple[object, bool]:
+        """
+        fn() を実行して (結果, 相乗りしたか) を返す。同じ key が実行中ならその完了を待って結果を共有する
+        still_needed() が False になっていれば（他プロセスが済ませた等）fn を呼ばずに None を返す
+        """
+        with self._lock:
+            fut = self._inflight.get(key)
+            owner = fut is None
+            if owner:
+                fut = self._inflight[key] = Future()
+            else:
+                self.stats["coalesced"] += 1
+        if not owner:
+            return fut.result(), True
+
+        limiter = self._limiters[kind]
+        try:
+            try:
+                limiter.acquire(weight, self.timeout, self.max_waiting)
+            except Busy:
+                self._count("rejected")
+                raise
+            try:
+                with _file_lock(key, self.lock_dir):
+                    if still_needed is not None and not still_needed():
+                        self._count("skipped")
+                        result = None
+                    else:
+                        self._count("started")
+                        result = fn()
+            finally:
+                limiter.release(weight)
+        except BaseException as e:
+            if not isinstance(e, Busy):
+                self._count("failed")
+            fut.set_exception(e)
+            raise
+        else:
+            fut.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    def status(self) -> Dict:
+        with self._lock:
+            inflight = sorted(self._inflight)
+        return {
+            "inflight": inflight,
+            "slots": {k: {"in_use": l.in_use, "capacity": l.capacity, "waiting": l.waiting, "peak": l.peak}
+                      for k, l in self._limiters.items()},
+            **self.stats,
+        }
+
+
+_coordinator: Optional[Coordinator] = None
+_glock = threading.Lock()
+
+
+def get_coordinator() -> Coordinator:
+    """プロセス共有の Coordinator（Streamlit の全セッションで 1 つ）"""
+    global _coordinator
+    with _glock:
+        if _coordinator is None:
+            _coordinator = Coordinator(
+                limits={"browser": int(os.getenv("KAGGLE_MAX_BROWSERS", DEFAULT_LIMITS["browser"])),
+                        "translate": int(os.getenv("KAGGLE_MAX_TRANSLATIONS", DEFAULT_LIMITS["translate"])),
+                        "api": int(os.getenv("KAGGLE_MAX_API_JOBS", DEFAULT_LIMITS["api"]))},
+                max_waiting=int(os.getenv("KAGGLE_MAX_WAITING", DEFAULT_MAX_WAITING)),
+            )
+        return _coordinator
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Kaggle API クライアント（kaggle CLI を起動せずにプロセス内で呼ぶ）
+- 認証済みの requests.Session を 1 つ共有（keep-alive / 一時的な 5xx・429 は自動再試行）
+- ノートの本文（.ipynb の JSON）はファイルに落とさずメモリ上で受け取る
+認証: 環境変数 KAGGLE_USERNAME / KAGGLE_KEY、無ければ ~/.kaggle/kaggle.json（KAGGLE_CONFIG_DIR で変更可）
+環境変数:
+  KAGGLE_API_ENDPOINT  API のベース URL（既定: https://www.kaggle.com/api/v1）
+                       ローカルの代替サーバ（fixtures.py serve-api）に向けるときに使う
+"""
+
+import os, json, pathlib, threading
+from typing import Dict, List, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from tracing import span
+
+DEFAULT_ENDPOINT = "https://www.kaggle.com/api/v1"
+POOL_SIZE = 16
+
+
+class KaggleApiError(RuntimeError):
+    pass
+
+
+def load_credentials() -> Optional[Tuple[str, str]]:
+    """(username, key) を返す。見つからなければ None"""
+    user, key = os.getenv("KAGGLE_USERNAME"), os.getenv("KAGGLE_KEY")
+    if user and key:
+        return user, key
+    cfg_dir = pathlib.Path(os.getenv("KAGGLE_CONFIG_DIR", pathlib.Path.home() / ".kaggle"))
+    try:
+        cfg = json.loads((cfg_dir / "kaggle.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if cfg.get("username") and cfg.get("key"):
+        return cfg["username"], cfg["key"]
+    return None
+
+
+class KaggleApiClient:
+    def __init__(self, endpoint: Optional[str] = None, auth: Optional[Tuple[str, str]] = None):
+        self.endpoint = (endpoint or os.getenv("KAGGLE_API_ENDPOINT") or DEFAULT_ENDPOINT).rstrip("/")
+        auth = auth or load_credentials()
+        if auth is None and self.endpoint == DEFAULT_ENDPOINT:
+            raise KaggleApiError("Kaggle の認証情報がありません（~/.kaggle/kaggle.json か KAGGLE_USERNAME / KAGGLE_KEY）")
+        s = requests.Session()
+        s.auth = auth
+        s.headers.update({"User-Agent": "kaggle_translator"})
+        retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=("GET",))
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry)
+        s.mount("https://", adapter)
+        s.mount("http://", adapter)
+        self.session = s
+
+    def _get(self, path: str, **params):
+        with span(f"kaggle_api {path}", "http", **params) as sp:
+            r = self.session.get(f"{self.endpoint}/{path.lstrip('/')}", params=params, timeout=60)
+            sp.update(status=r.status_code, bytes=len(r.content))
+        if r.status_code in (401, 403):
+            raise KaggleApiError(f"{r.status_code} {path}: 認証エラー（kaggle.json を確認してください）")
+        if r.status_code == 404:
+            raise KaggleApiError(f"404 {path}: {params}")
+        r.raise_for_status()
+        return r.json()
+
+    def kernel_pull(self, kernel_ref: str) -> Dict:
+        """{"metadata": {...}, "blob": {"source", "language", "kernelType"}} を返す"""
+        user, slug = kernel_ref.split("/", 1)
+        return self._get("kernels/pull", userName=user, kernelSlug=slug)
+
+    def kernels_list(self, user: str, page: int = 1, page_size: int = 100) -> List[Dict]:
+        return self._get("kernels/list", user=user, page=page, pageSize=page_size) or []
+
+
+_client: Optional[KaggleApiClient] = None
+_lock = threading.Lock()
+
+
+def get_client() -> KaggleApiClient:
+    """共有クライアントを返す（初回のみ認証情報を読む）"""
+    global _client
+    with _lock:
+        if _client is None:
+            _client = KaggleApiClient()
+        return _client
@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+スクレイパー共通の軽量ブラウザプロファイル
+- 必要なのは DOM テキストだけなので、画像/動画/フォント/トラッカーは CDP で遮断
+- pageLoadStrategy=eager（DOMContentLoaded で driver.get が返る）
+- 画像は Chrome 設定でも無効化
+ブロックリストは以下で差し替え可能:
+  - build_driver(blocked_urls=[...])
+  - 環境変数 KAGGLE_BLOCKED_URLS_FILE（1 行 1 パターン、# はコメント）
+  - 環境変数 KAGGLE_LEAN_BROWSER=0 で従来どおりフルロード
+待機は固定 sleep ではなく wait_ready()（MutationObserver + 通信中リクエスト数）で行う。
+Usage (benchmark):
+  python3 kaggle_browser.py --bench https://www.kaggle.com/competitions/titanic/overview
+  python3 kaggle_browser.py --bench-fixtures fixtures/pages --runs 3
+"""
+
+import os, sys, time, queue, pathlib, threading
+from contextlib import ExitStack, contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional
+from urllib.parse import urlparse
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+from webdriver_manager.chrome import ChromeDriverManager
+
+from fixtures import record_page, recorder, replay_url
+from tracing import span
+
+USER_AGENT = (
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+)
+
+# Network.setBlockedURLs のワイルドカード形式（* のみ使用可）
+DEFAULT_BLOCKED_URLS: List[str] = [
+    # 画像
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.avif", "*.ico", "*.bmp",
+    # 動画・音声
+    "*.mp4", "*.webm", "*.ogg", "*.mp3", "*.m3u8",
+    # フォント
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*fonts.googleapis.com*", "*fonts.gstatic.com*",
+    # 解析・広告・トラッカー
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*googlesyndication.com*", "*facebook.net*", "*hotjar.com*",
+    "*segment.io*", "*sentry.io*", "*intercom.io*",
+]
+
+
+def load_blocked_urls(path: Optional[str] = None) -> List[str]:
+    """KAGGLE_BLOCKED_URLS_FILE（または path）があればそれを、無ければ既定リストを返す"""
+    path = path or os.getenv("KAGGLE_BLOCKED_URLS_FILE")
+    if not path:
+        return list(DEFAULT_BLOCKED_URLS)
+    lines = pathlib.Path(path).read_text(encoding="utf-8").splitlines()
+    return [ln.strip() for ln in lines if ln.strip() and not ln.strip().startswith("#")]
+
+
+def lean_enabled() -> bool:
+    return os.getenv("KAGGLE_LEAN_BROWSER", "1").lower() not in ("0", "false", "no")
+
+
+# fetch / XHR の通信中件数を window.__kgInflight に数える（network-idle 判定用）
+INFLIGHT_TRACKER_JS = """
+(() => {
+  if (window.__kgInflight !== undefined) return;
+  window.__kgInflight = 0;
+  const inc = () => { window.__kgInflight++; };
+  const dec = () => { window.__kgInflight = Math.max(0, window.__kgInflight - 1); };
+  const origFetch = window.fetch;
+  if (origFetch) {
+    window.fetch = function() {
+      inc();
+      return origFetch.apply(this, arguments).finally(dec);
+    };
+  }
+  const origSend = XMLHttpRequest.prototype.send;
+  XMLHttpRequest.prototype.send = function() {
+    inc();
+    this.addEventListener('loadend', dec, {once: true});
+    return origSend.apply(this, arguments);
+  };
+})();
+"""
+
+# 新しい文書ごとに先に実行しておくスクリプト（webdriver フラグ隠し + 通信中件数の計測）
+NEW_DOCUMENT_SCRIPTS: List[str] = [
+    "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})",
+    INFLIGHT_TRACKER_JS,
+]
+
+COOKIE_XPATHS = [
+    "//div[contains(., 'OK, Got it.') and contains(@class,'bxFwkO')]",
+    "//button[contains(., 'Accept all') or contains(., 'Accept All')]",
+]
+# arguments[0] = XPath のリスト。見つかった最初の要素を押す
+DISMISS_COOKIE_JS = """
+for (const xp of arguments[0]) {
+  const el = document.evaluate(xp, document, null,
+               XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+  if (el) { el.click(); return true; }
+}
+return false;
+"""
+
+
+# ---------- webdriver ----------
+def build_driver(
+    headless: bool = True,
+    lean: Optional[bool] = None,
+    blocked_urls: Optional[Iterable[str]] = None,
+) -> webdriver.Chrome:
+    if lean is None:
+        lean = lean_enabled()
+
+    opt = webdriver.ChromeOptions()
+    if headless:
+        opt.add_argument("--headless=new")
+    opt.add_argument("--no-sandbox")
+    opt.add_argument("--disable-dev-shm-usage")
+    opt.add_argument("--window-size=1920,1080")
+    opt.add_argument("--disable-blink-features=AutomationControlled")
+    opt.add_argument("--disable-features=Translate,AutomationControlled")
+    opt.add_experimental_option("excludeSwitches", ["enable-automation"])
+    opt.add_experimental_option("useAutomationExtension", False)
+    opt.add_argument(f"--user-agent={USER_AGENT}")
+    if lean:
+        # DOMContentLoaded で制御を返す（画像・解析スクリプトの load を待たない）
+        opt.page_load_strategy = "eager"
+        opt.add_argument("--blink-settings=imagesEnabled=false")
+        opt.add_argument("--mute-audio")
+        opt.add_experimental_option(
+            "prefs", {"profile.managed_default_content_settings.images": 2}
+        )
+
+    with span("driver startup", "browser", headless=headless, lean=lean):
+        drv = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=opt)
+    for src in NEW_DOCUMENT_SCRIPTS:
+        try:
+            drv.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {"source": src})
+        except Exception:
+            pass
+    if lean:
+        patterns = list(blocked_urls) if blocked_urls is not None else load_blocked_urls()
+        try:
+            drv.execute_cdp_cmd("Network.enable", {})
+            drv.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+        except Exception:
+            pass
+    return drv
+
+
+# ---------- host politeness ----------
+class HostPoliteness:
+    """同一ホストへのページ読み込みを「同時 max_concurrent 件・開始間隔 min_interval 秒以上」に制限"""
+
+    def __init__(self, min_interval: float = 1.0, max_concurrent: int = 2):
+        self.min_interval = min_interval
+        self.max_concurrent = max(1, max_concurrent)
+        self._lock = threading.Lock()
+        self._sems: Dict[str, threading.Semaphore] = {}
+        self._next_at: Dict[str, float] = {}
+
+    @contextmanager
+    def slot(self, url: str) -> Iterator[None]:
+        host = urlparse(url).netloc or "local"
+        with self._lock:
+            sem = self._sems.setdefault(host, threading.BoundedSemaphore(self.max_concurrent))
+        with sem:
+            with self._lock:
+                now = time.monotonic()
+                start = max(now, self._next_at.get(host, 0.0))
+                self._next_at[host] = start + self.min_interval
+            if start > now:
+                time.sleep(start - now)
+            yield
+
+
+# open_page が参照するプロセス共通の制限（既定は無制限）
+_politeness: Optional[HostPoliteness] = None
+
+
+def set_host_politeness(min_interval: float = 1.0, max_concurrent: int = 2) -> None:
+    global _politeness
+    _politeness = HostPoliteness(min_interval, max_concurrent)
+
+
+def host_politeness() -> Optional[HostPoliteness]:
+    """set_host_politeness() で設定した制限（未設定なら None）"""
+    return _politeness
+
+
+# ---------- driver pool ----------
+class DriverPool:
+    """
+    Chrome セッションを最大 size 個まで遅延生成して使い回す（スレッド間で共有可）。
+        with DriverPool(3) as pool:
+            with pool.acquire() as d: ...
+    """
+
+    def __init__(self, size: int = 3, headless: bool = True, **driver_kwargs):
+        self.size = max(1, size)
+        self.headless = headless
+        self.driver_kwargs = driver_kwargs
+        self._idle: "queue.Queue[webdriver.Chrome]" = queue.Queue()
+        self._all: List[webdriver.Chrome] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def acquire(self) -> Iterator[webdriver.Chrome]:
+        """使用中に例外が出たドライバは（Chrome / chromedriver が落ちているかもしれないので）捨てて作り直す"""
+        try:
+            drv = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = len(self._all) < self.size
+                if create:
+                    self._all.append(None)  # 枠を予約（生成は lock の外で行う）
+            # 空きが無ければ、使用中のドライバが返るか捨てられて枠が空く（None）まで待つ
+            drv = None if create else self._idle.get()
+        if drv is None:
+            drv = self._build()
+        ok = False
+        try:
+            yield drv
+            ok = True
+        finally:
+            if ok:
+                self._idle.put(drv)
+            else:
+                self._discard(drv)
+
+    def _build(self) -> webdriver.Chrome:
+        """予約済みの枠（_all の None）にドライバを作る。失敗したら枠を他の待ち手に回す"""
+        t0 = time.perf_counter()
+        try:
+            drv = build_driver(headless=self.headless, **self.driver_kwargs)
+        except Exception:
+            self._idle.put(None)
+            raise
+        with self._lock:
+            if None in self._all:
+                self._all[self._all.index(None)] = drv
+        log_timing("driver startup", time.perf_counter() - t0)
+        return drv
+
+    def _discard(self, drv: webdriver.Chrome) -> None:
+        with self._lock:
+            if drv in self._all:
+                self._all[self._all.index(drv)] = None
+        try:
+            drv.quit()
+        except Exception:
+            pass
+        self._idle.put(None)  # 次の acquire が作り直す
+
+    def close(self) -> None:
+        with self._lock:
+            drivers, self._all = [d for d in self._all if d is not None], []
+        for d in drivers:
+            try:
+                d.quit()
+            except Exception:
+                pass
+
+    def __enter__(self) -> "DriverPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+# ---------- readiness ----------
+# 対象要素が現れ、DOM 変化と fetch/XHR が quiet_ms だけ止まったら即座に返す
+READY_JS = """
+const [css, xpath, quietMs, timeoutMs, maxInflight, done] = arguments;
+const t0 = performance.now();
+let last = t0, mutations = 0;
+const mo = new MutationObserver((recs) => { mutations += recs.length; last = performance.now(); });
+mo.observe(document.documentElement, {childList: true, subtree: true, characterData: true});
+const found = () => {
+  if (css && !document.querySelector(css)) return false;
+  if (xpath && !document.evaluate(xpath, document, null,
+        XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue) return false;
+  return true;
+};
+const finish = (ready, reason) => {
+  mo.disconnect();
+  done({ready: ready, reason: reason, found: found(), mutations: mutations,
+        elapsed: (performance.now() - t0) / 1000});
+};
+const tick = () => {
+  const now = performance.now();
+  const idle = (window.__kgInflight || 0) <= maxInflight;
+  if (document.readyState !== 'loading' && found() && idle && now - last >= quietMs) {
+    finish(true, 'stable');
+  } else if (now - t0 >= timeoutMs) {
+    finish(false, found() ? 'timeout' : 'not-found');
+  } else {
+    setTimeout(tick, 50);
+  }
+};
+tick();
+"""
+
+
+def log_timing(label: str, seconds: float, detail: str = "") -> None:
+    """ページ単位の所要時間を stderr に 1 行で出す（stdout は各 CLI の出力用）"""
+    print(f"[timing] {label}: {seconds:.2f}s{(' ' + detail) if detail else ''}", file=sys.stderr)
+
+
+def wait_ready(
+    driver: webdriver.Chrome,
+    css: Optional[str] = None,
+    xpath: Optional[str] = None,
+    quiet_ms: int = 500,
+    timeout: float = 15.0,
+    max_inflight: int = 0,
+) -> Dict:
+    """
+    css/xpath の要素が存在し、DOM 変化と通信が quiet_ms 途切れた時点で返す。
+    timeout で打ち切っても例外にはしない（戻り値の ready/found で判断する）。
+    """
+    driver.set_script_timeout(timeout + 5)
+    try:
+        res = driver.execute_async_script(
+            READY_JS, css, xpath, int(quiet_ms), int(timeout * 1000), int(max_inflight)
+        )
+    except Exception as e:
+        res = {"ready": False, "reason": f"error: {e.__class__.__name__}", "found": False,
+               "mutations": 0, "elapsed": timeout}
+    return res or {"ready": False, "reason": "no-result", "found": False, "mutations": 0, "elapsed": 0.0}
+
+
+def open_page(driver: webdriver.Chrome, url: str, **ready_kwargs) -> Dict:
+    """driver.get → wait_ready → Cookie バナー処理 までを行い、所要時間をログに残す"""
+    t0 = time.perf_counter()
+    with span("open_page", "browser", url=url) as sp:
+        with ExitStack() as slot:
+            if _politeness:
+                with span("politeness wait", "browser"):
+                    slot.enter_context(_politeness.slot(url))
+            t_get0 = time.perf_counter()
+            with span("driver.get", "browser", url=url):
+                driver.get(replay_url(url))  # 再生モードならローカルの再生サーバへ
+            t_get = time.perf_counter() - t_get0
+            with span("wait_ready", "browser") as w:
+                res = wait_ready(driver, **ready_kwargs)
+                w.update(reason=res.get("reason"), found=res.get("found"))
+        with span("dismiss_cookie_banner", "browser"):
+            dismiss_cookie_banner(driver)
+        record_snapshot(driver, url)
+        sp["reason"] = res.get("reason")
+    log_timing(url, time.perf_counter() - t0,
+               f"(get={t_get:.2f}s ready={res.get('elapsed', 0):.2f}s {res.get('reason')})")
+    return res
+
+
+def record_snapshot(driver: webdriver.Chrome, url: str) -> None:
+    """記録モード（KAGGLE_RECORD_DIR）なら現在の DOM を url のフィクスチャとして保存"""
+    if recorder():
+        record_page(url, driver.page_source)
+
+
+def dismiss_cookie_banner(driver: webdriver.Chrome) -> bool:
+    """Cookie バナーがあれば押す。無ければ待たずに即 False（XPath ごとの 3 秒待ちをしない）"""
+    try:
+        return bool(driver.execute_script(DISMISS_COOKIE_JS, COOKIE_XPATHS))
+    except Exception:
+        return False
+
+
+def scroll_until_stable(driver: webdriver.Chrome, tries: int = 6, quiet_ms: int = 400,
+                        timeout: float = 5.0) -> int:
+    """最下部へスクロール→DOM が落ち着くまで待つ、を高さが変わらなくなるまで繰り返す"""
+    with span("scroll_until_stable", "browser") as sp:
+        last_h = driver.execute_script("return document.body.scrollHeight;")
+        scrolls = 0
+        for _ in range(tries):
+            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+            wait_ready(driver, quiet_ms=quiet_ms, timeout=timeout)
+            scrolls += 1
+            h = driver.execute_script("return document.body.scrollHeight;")
+            if h == last_h:
+                break
+            last_h = h
+        sp["scrolls"] = scrolls
+    return last_h
+
+
+# ---------- benchmark ----------
+_TRANSFER_JS = """
+const nav = performance.getEntriesByType('navigation')[0];
+const res = performance.getEntriesByType('resource');
+let bytes = nav ? (nav.transferSize || 0) : 0;
+for (const r of res) bytes += (r.transferSize || 0);
+return {bytes: bytes, requests: res.length + 1,
+        dcl: nav ? nav.domContentLoadedEventEnd : 0};
+"""
+
+
+def measure_load(driver: webdriver.Chrome, url: str) -> Dict[str, float]:
+    """driver.get の所要時間と転送バイト数（Resource Timing 合計）を返す"""
+    t0 = time.perf_counter()
+    driver.get(url)
+    elapsed = time.perf_counter() - t0
+    stats = driver.execute_script(_TRANSFER_JS) or {}
+    return {
+        "seconds": elapsed,
+        "bytes": float(stats.get("bytes", 0)),
+        "requests": float(stats.get("requests", 0)),
+    }
+
+
+def bench(urls: List[str], runs: int = 3, headless: bool = True) -> Dict[str, Dict[str, float]]:
+    """lean / full の 2 プロファイルで同じ URL 群を読み込み平均を比較"""
+    results: Dict[str, Dict[str, float]] = {}
+    for label, lean in (("full", False), ("lean", True)):
+        d = build_driver(headless=headless, lean=lean)
+        try:
+            rows = [measure_load(d, u) for _ in range(runs) for u in urls]
+        finally:
+            d.quit()
+        n = max(1, len(rows))
+        results[label] = {k: sum(r[k] for r in rows) / n for k in ("seconds", "bytes", "requests")}
+    return results
+
+
+def fixture_urls(fixture_dir: str) -> List[str]:
+    return [p.resolve().as_uri() for p in sorted(pathlib.Path(fixture_dir).rglob("*.html"))]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--bench", nargs="*", default=[], help="計測する URL（複数可）")
+    ap.add_argument("--bench-fixtures", help="保存済み HTML フィクスチャのディレクトリ（*.html を file:// で読み込み）")
+    ap.add_argument("--runs", type=int, default=3, help="URL ごとの繰り返し回数")
+    ap.add_argument("--no-headless", action="store_true")
+    args = ap.parse_args()
+
+    urls = list(args.bench)
+    if args.bench_fixtures:
+        urls += fixture_urls(args.bench_fixtures)
+    if not urls:
+        ap.print_help()
+        sys.exit(0)
+
+    res = bench(urls, runs=args.runs, headless=not args.no_headless)
+    print(f"{'profile':8s} {'load[s]':>9s} {'KB':>10s} {'requests':>9s}")
+    for label, r in res.items():
+        print(f"{label:8s} {r['seconds']:9.2f} {r['bytes'] / 1024:10.1f} {r['requests']:9.0f}")
+    if res["full"]["seconds"] > 0:
+        print(f"speedup: x{res['full']['seconds'] / max(res['lean']['seconds'], 1e-9):.2f}, "
+              f"bytes saved: {(1 - res['lean']['bytes'] / max(res['full']['bytes'], 1)) * 100:.1f}%")
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTTP 共通層（ブラウザを使わない取得用）
+- プロセス内で 1 つの requests.Session を共有（keep-alive / コネクションプール）
+- 一時的な 5xx / 429 は urllib3 Retry で自動再試行
+- ディスクキャッシュ: ETag / Last-Modified を保存し、次回は条件付き GET（304 なら本文を再利用）
+  容量上限を超えたら最終アクセスが古い順（LRU）に削除（合計サイズは保存のたびに足し込み、
+  ディレクトリの走査は初回と上限超過時だけ）
+環境変数:
+  KAGGLE_HTTP_CACHE_DIR     キャッシュ置き場（既定: ~/.cache/kaggle_translator/http）
+  KAGGLE_HTTP_CACHE_MAX_MB  上限サイズ MB（既定: 512、0 でキャッシュ無効）
+"""
+
+import os, sys, json, time, atexit, hashlib, pathlib, threading
+from typing import Dict, Optional
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from fixtures import record_http, replay_url
+from tracing import span
+
+DEFAULT_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+    ),
+    "Accept-Language": "en-US,en;q=0.9",
+}
+
+POOL_SIZE = 16
+
+_session = None
+_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """共有 Session を返す（初回のみ生成）"""
+    global _session
+    with _lock:
+        if _session is None:
+            s = requests.Session()
+            s.headers.update(DEFAULT_HEADERS)
+            retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                          allowed_methods=("GET", "HEAD"))
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry)
+            s.mount("https://", adapter)
+            s.mount("http://", adapter)
+            _session = s
+        return _session
+
+
+# ---------- disk cache ----------
+class HttpCache:
+    """URL ごとに <sha256>.body / <sha256>.json を保存する条件付き GET 用キャッシュ"""
+
+    def __init__(self, root: pathlib.Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.total: Optional[int] = None  # キャッシュ全体のバイト数（初回の store で走査して求める）
+        self.stats = {"hits": 0, "misses": 0, "bytes_saved": 0, "bytes_fetched": 0}
+
+    def _paths(self, url: str):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return self.root / f"{key}.json", self.root / f"{key}.body"
+
+    def lookup(self, url: str) -> Optional[Dict]:
+        meta_p, body_p = self._paths(url)
+        try:
+            meta = json.loads(meta_p.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if meta.get("url") != url or not body_p.exists():
+            return None
+        return meta
+
+    def read_body(self, url: str) -> bytes:
+        meta_p, body_p = self._paths(url)
+        data = body_p.read_bytes()
+        now = time.time()
+        try:
+            os.utime(meta_p, (now, now))  # LRU 用に最終アクセスを更新
+        except OSError:
+            pass
+        return data
+
+    def forget(self, url: str) -> None:
+        for p in self._paths(url):
+            try:
+                size = p.stat().st_size
+                p.unlink()
+            except OSError:
+                continue
+            with self._lock:
+                if self.total is not None:
+                    self.total -= size
+
+    @staticmethod
+    def _size(*paths: pathlib.Path) -> int:
+        n = 0
+        for p in paths:
+            try:
+                n += p.stat().st_size
+            except OSError:
+                pass
+        return n
+
+    def store(self, url: str, resp: requests.Response) -> None:
+        etag = resp.headers.get("ETag")
+        last_mod = resp.headers.get("Last-Modified")
+        if not (etag or last_mod):
+            return  # 検証子が無ければ再検証できないので保存しない
+        self.root.mkdir(parents=True, exist_ok=True)
+        meta_p, body_p = self._paths(url)
+        old = self._size(meta_p, body_p)
+        meta = {"url": url, "etag": etag, "last_modified": last_mod,
+                "encoding": resp.encoding, "content_type": resp.headers.get("Content-Type"), "size": len(resp.content), "stored_at": time.time()}
+        for p, data in ((body_p, resp.content), (meta_p, json.dumps(meta).encode("utf-8"))):
+            tmp = p.with_suffix(p.suffix + f".{threading.get_ident()}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, p)
+        with self._lock:
+            if self.total is not None:
+                self.total += self._size(meta_p, body_p) - old
+            over = self.total is None or self.total > self.max_bytes
+        if over:
+            self.evict()
+
+    def evict(self) -> None:
+        """ディレクトリを走査して合計サイズを数え直し、上限を超えていれば最終アクセスの古い順に削除"""
+        with self._lock:
+            entries = []
+            for meta_p in self.root.glob("*.json"):
+                body_p = meta_p.with_suffix(".body")
+                try:
+                    entries.append((meta_p.stat().st_mtime, meta_p, body_p,
+                                    body_p.stat().st_size + meta_p.stat().st_size))
+                except OSError:
+                    continue
+            total = sum(e[3] for e in entries)
+            for _, meta_p, body_p, size in sorted(entries, key=lambda e: e[0]):
+                if total <= self.max_bytes:
+                    break
+                for p in (meta_p, body_p):
+                    try:
+                        p.unlink()
+                    except OSError:
+                        pass
+                total -= size
+            self.total = total
+
+    def record(self, hit: bool, nbytes: int) -> None:
+        with self._lock:
+            if hit:
+                self.stats["hits"] += 1
+                self.stats["bytes_saved"] += nbytes
+            else:
+                self.stats["misses"] += 1
+                self.stats["bytes_fetched"] += nbytes
+
+    def report(self) -> None:
+        st = self.stats
+        total = st["hits"] + st["misses"]
+        if not total:
+            return
+        print(f"[http-cache] hits={st['hits']} misses={st['misses']} "
+              f"hit_rate={st['hits'] / total * 100:.0f}% "
+              f"saved={st['bytes_saved'] / 1024:.0f}KB fetched={st['bytes_fetched'] / 1024:.0f}KB",
+              file=sys.stderr)
+
+
+_cache: Optional[HttpCache] = None
+
+
+def get_cache() -> Optional[HttpCache]:
+    """共有キャッシュを返す（KAGGLE_HTTP_CACHE_MAX_MB=0 なら None）"""
+    global _cache
+    with _lock:
+        if _cache is None:
+            max_mb = float(os.getenv("KAGGLE_HTTP_CACHE_MAX_MB", "512"))
+            if max_mb <= 0:
+                return None
+            root = pathlib.Path(os.getenv(
+                "KAGGLE_HTTP_CACHE_DIR", pathlib.Path.home() / ".cache" / "kaggle_translator" / "http"))
+            _cache = HttpCache(root, int(max_mb * 1024 * 1024))
+            atexit.register(_cache.report)
+        return _cache
+
+
+def get_bytes(url: str, timeout: int = 30, cache: bool = True) -> tuple[bytes, Optional[str]]:
+    """GET して (本文, encoding) を返す。cache=True なら条件付き GET でディスクキャッシュを使う"""
+    orig_url, url = url, replay_url(url, kind="http")  # 再生モードならローカルの再生サーバへ
+    c = get_cache() if cache else None
+    meta = c.lookup(url) if c else None
+    headers = {}
+    if meta:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    with span("http.get", "http", url=orig_url, conditional=bool(headers)) as sp:
+        r = get_session().get(url, timeout=timeout, headers=headers)
+        sp.update(status=r.status_code, bytes=len(r.content))
+    if meta and r.status_code == 304:
+        try:
+            body = c.read_body(url)
+        except FileNotFoundError:
+            # lookup の後に本文が追い出された: 記録を捨てて条件なしで取り直す
+            c.forget(url)
+            return get_bytes(orig_url, timeout=timeout, cache=cache)
+        c.record(hit=True, nbytes=len(body))
+        record_http(orig_url, body, meta.get("content_type"))
+        return body, meta.get("encoding")
+    r.raise_for_status()
+    if c:
+        c.record(hit=False, nbytes=len(r.content))
+        c.store(url, r)
+    record_http(orig_url, r.content, r.headers.get("Content-Type"))
+    return r.content, r.encoding
+
+
+def get_text(url: str, timeout: int = 30, cache: bool = True) -> str:
+    body, encoding = get_bytes(url, timeout=timeout, cache=cache)
+    return body.decode(encoding or "utf-8", errors="replace")
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+app の同時利用を模した負荷試験（job_coordinator の相乗り・同時実行数上限・アトミック書き込みの確認）
+- --sessions 個のスレッドが app のセッションの代わりに、少数の対象（スレッド ID）へ
+  「取得 → 翻訳」を偏った頻度（Zipf）で繰り返し要求する
+- 既定の処理は sleep + 出力ファイルの書き込みだけ（Chrome / Gemini 不要）。--cmd で実コマンドも可
+  （{target} が対象名に置き換わる。例: --cmd "python3 discussion_scraper.py --thread https://.../{target}"）
+- 読み手スレッドが出力ファイルを読み続け、書きかけ（行が揃っていない）内容を見たら数える
+- --no-coordinator で調停なし（各セッションが直接実行）と比べられる
+Usage:
+  python3 load_test_sessions.py --sessions 12 --requests 20 --targets 5
+  python3 load_test_sessions.py --sessions 12 --requests 20 --targets 5 --no-coordinator
+"""
+
+import argparse, random, shlex, shutil, statistics, subprocess, tempfile, threading, time, pathlib
+from collections import Counter
+from typing import Dict, List
+
+from fileio import write_text_atomic
+from job_coordinator import Busy, Coordinator
+
+WRITE_LINES = 2000  # 出力 1 ファイルの行数（書きかけを検出しやすいよう大きめ）
+
+
+class Gauge:
+    """種類ごとの同時実行数とその最大値"""
+
+    def __init__(self):
+        self.now: Counter = Counter()
+        self.peak: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def enter(self, kind: str) -> None:
+        with self._lock:
+            self.now[kind] += 1
+            self.peak[kind] = max(self.peak[kind], self.now[kind])
+
+    def leave(self, kind: str) -> None:
+        with self._lock:
+            self.now[kind] -= 1
+
+
+def make_job(kind: str, target: str, out_dir: pathlib.Path, seconds: float, cmd: str, atomic: bool,
+             gauge: Gauge, executed: Counter, lock: threading.Lock):
+    def job():
+        gauge.enter(kind)
+        try:
+            with lock:
+                executed[(kind, target)] += 1
+            if cmd:
+                subprocess.run(shlex.split(cmd.format(target=target)), check=True,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            else:
+                time.sleep(seconds * random.uniform(0.7, 1.3))
+            stamp = f"{kind}-{target}-{time.time_ns()}"
+            text = "".join(f"{stamp}\n" for _ in range(WRITE_LINES))
+            path = out_dir / f"{target}.{kind}.md"
+            if atomic:
+                write_text_atomic(path, text)
+            else:
+                # 比較用: 直接書き込み（途中を読まれうる）
+                with path.open("w", encoding="utf-8") as f:
+                    for i in range(0, len(text), 4096):
+                        f.write(text[i:i + 4096])
+                        f.flush()
+            return stamp
+        finally:
+            gauge.leave(kind)
+    return job
+
+
+def reader(out_dir: pathlib.Path, stop: threading.Event, torn: List[int]) -> None:
+    while not stop.is_set():
+        for p in out_dir.glob("*.md"):
+            try:
+                lines = p.read_text(encoding="utf-8").splitlines()
+            except OSError:
+                continue
+            if lines and (len(lines) != WRITE_LINES or len(set(lines)) != 1):
+                torn[0] += 1
+        time.sleep(0.001)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sessions", type=int, default=12, help="同時セッション数")
+    ap.add_argument("--requests", type=int, default=20, help="1 セッションあたりの要求数")
+    ap.add_argument("--targets", type=int, default=5, help="対象（スレッド）の種類数。少ないほど重複が多い")
+    ap.add_argument("--job-seconds", type=float, default=0.2, help="合成処理 1 件の所要時間")
+    ap.add_argument("--cmd", default="", help="合成処理の代わりに実行するコマンド（{target} を置換）")
+    ap.add_argument("--browsers", type=int, default=3)
+    ap.add_argument("--translations", type=int, default=2)
+    ap.add_argument("--max-waiting", type=int, default=64)
+    ap.add_argument("--no-coordinator", action="store_true", help="調停なし・直接書き込みで実行（比較用）")
+    args = ap.parse_args()
+
+    out_dir = pathlib.Path(tempfile.mkdtemp(prefix="kaggle_load_"))
+    coord = Coordinator(limits={"browser": args.browsers, "translate": args.translations},
+                        max_waiting=args.max_waiting, lock_dir=out_dir / ".locks")
+    gauge, executed, elock = Gauge(), Counter(), threading.Lock()
+    weights = [1 / (i + 1) for i in range(args.targets)]
+    targets = [f"t{i}" for i in range(args.targets)]
+    latencies: List[float] = []
+    outcome: Dict[str, int] = Counter()
+    olock = threading.Lock()
+
+    def session(sid: int) -> None:
+        rnd = random.Random(sid)
+        for _ in range(args.requests):
+            target = rnd.choices(targets, weights)[0]
+            for action, kind in (("scrape", "browser"), ("translate", "translate")):
+                job = make_job(kind, target, out_dir, args.job_seconds, args.cmd, not args.no_coordinator,
+                               gauge, executed, elock)
+                t0 = time.perf_counter()
+                try:
+                    if args.no_coordinator:
+                        job()
+                        res = "started"
+                    else:
+                        _, shared = coord.run(f"{action}:{target}", kind, job)
+                        res = "coalesced" if shared else "started"
+                except Busy:
+                    res = "rejected"
+                with olock:
+                    latencies.append(time.perf_counter() - t0)
+                    outcome[res] += 1
+            time.sleep(rnd.uniform(0, args.job_seconds / 2))
+
+    stop, torn = threading.Event(), [0]
+    rd = threading.Thread(target=reader, args=(out_dir, stop, torn), daemon=True)
+    rd.start()
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(args.sessions)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    stop.set()
+    rd.join()
+
+    total = sum(outcome.values())
+    runs = sum(executed.values())
+    lat = sorted(latencies)
+    print(f"mode: {'no coordinator' if args.no_coordinator else 'coordinator'}  "
+          f"sessions={args.sessions} targets={args.targets}  wall {wall:.1f}s")
+    print(f"requests {total}: {dict(outcome)}")
+    print(f"jobs executed {runs} ({runs / max(1, total):.0%} of requests); "
+          f"max runs for one target/action: {max(executed.values(), default=0)}")
+    print(f"peak concurrency: {dict(gauge.peak)}  (limits browser={args.browsers} translate={args.translations})")
+    if lat:
+        print(f"latency p50 {statistics.median(lat) * 1000:.0f}ms  p95 {lat[int(len(lat) * 0.95) - 1] * 1000:.0f}ms")
+    print(f"torn reads observed: {torn[0]}")
+    shutil.rmtree(out_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+取得 → 変換 → 翻訳 を 1 プロセスでつなぐパイプライン
+- 取得側（コンペのタブ / Discussion スレッド）は .md を保存した直後に有界キューへ流し、
+  翻訳側はそれを届いた順に訳す。取得と翻訳が重なるので、全体の所要時間は遅い方の段に近づく
+- 訳すのはこの実行で取得した文書のうち、翻訳が無い / 古いものだけ（out/ の *.md を glob し直さない）
+- キューが埋まると取得側が待つ（翻訳が詰まっている間にブラウザで先読みし続けない）
+Usage:
+  python3 pipeline.py --url https://www.kaggle.com/competitions/titanic --out out
+  python3 pipeline.py --slugs titanic spaceship-titanic --out out          # out/<slug>/ に保存
+  python3 pipeline.py --threads https://www.kaggle.com/competitions/titanic/discussion/586706 --out out/discussion
+  python3 pipeline.py --url titanic --out out --no-translate               # 取得だけ
+"""
+
+import argparse, sys, time, pathlib, threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Optional, Tuple
+
+from kaggle_browser import DriverPool, log_timing, set_host_politeness
+from discussion_scraper import save_thread_md
+from save_kaggle_comp_markdown import (
+    TRANSLATE_QUEUE_MAX, TranslationWorker, comp_slug, comp_url, save_competition,
+)
+
+
+class Pipeline:
+    """取得段が emit() した文書を翻訳段へ渡し、段ごとの時刻を数える"""
+
+    def __init__(self, translator: Optional[TranslationWorker] = None):
+        self.translator = translator
+        self.t0 = time.perf_counter()
+        self.first_doc: Optional[float] = None
+        self.fetch_done: Optional[float] = None
+        self.fetched = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def emit(self, path: pathlib.Path) -> None:
+        with self._lock:
+            self.fetched += 1
+            if self.first_doc is None:
+                self.first_doc = time.perf_counter()
+        print(f"✅ saved: {path}")
+        if self.translator:
+            self.translator.submit(path)  # 翻訳待ちが満杯ならここで待つ
+
+    def report(self) -> None:
+        end = time.perf_counter()
+        fetch = (self.fetch_done or end) - self.t0
+        msg = f"{self.fetched} doc(s) fetched in {fetch:.1f}s"
+        if self.first_doc is not None:
+            msg += f", first after {self.first_doc - self.t0:.1f}s"
+        tr = self.translator
+        if tr:
+            msg += (f"; {tr.translated} translated, {tr.skipped} up to date, {tr.failed} failed"
+                    f" (translate busy {tr.busy:.1f}s)")
+            if tr.last_done and self.fetch_done:
+                msg += f", translation finished {max(0.0, tr.last_done - self.fetch_done):.1f}s after the last fetch"
+        print(msg)
+        log_timing("pipeline total", end - self.t0)
+
+
+def run_pipeline(pipe: Pipeline, comps: List[Tuple[str, pathlib.Path]], threads: List[str],
+                 thread_dir: pathlib.Path, browsers: int = 3, tab_workers: int = 3, headless: bool = True) -> None:
+    """comps = [(コンペ URL, 保存先)]、threads = スレッド URL。取得し終えたら pipe.fetch_done を立てる"""
+    def fetch_thread(url: str) -> None:
+        with pool.acquire() as d:
+            path = save_thread_md(url, str(thread_dir), driver=d)
+        pipe.emit(path)  # ドライバを返してから渡す（翻訳待ちで待ってもブラウザを塞がない）
+
+    with DriverPool(size=browsers, headless=headless) as pool, \
+            ThreadPoolExecutor(max_workers=max(1, browsers)) as ex:
+        futs = {ex.submit(save_competition, pool, url, outdir, workers=tab_workers,
+                          on_saved=lambda tab, path, changed: pipe.emit(path)): url
+                for url, outdir in comps}
+        futs.update({ex.submit(fetch_thread, u): u for u in threads})
+        for fut in as_completed(futs):
+            try:
+                fut.result()
+            except Exception as e:
+                pipe.failed += 1
+                print(f"❌ {futs[fut]}: {e!r}", file=sys.stderr)
+    pipe.fetch_done = time.perf_counter()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", help="コンペ URL または slug（out 直下に overview/data/rules.md を保存）")
+    ap.add_argument("--slugs", nargs="+", default=[], help="コンペ slug（URL も可）。out/<slug>/ に保存")
+    ap.add_argument("--slugs-file", help="slug を 1 行 1 件で書いたファイル（# はコメント）")
+    ap.add_argument("--threads", nargs="+", default=[], help="Discussion スレッド URL")
+    ap.add_argument("--out", default="out", help="保存ディレクトリ")
+    ap.add_argument("--discussion-out", default=None, help="スレッドの保存先（既定: --out）")
+    ap.add_argument("--no-translate", action="store_true", help="取得だけ行う")
+    ap.add_argument("--model", default=None, help="翻訳に使う Gemini モデル名（既定: gemini-1.5-flash / $GEMINI_MODEL）。"
+                    "auto はチャンクごとに振り分け（gemini-1.5-pro も使うので費用が増える）")
+    ap.add_argument("--queue-size", type=int, default=TRANSLATE_QUEUE_MAX, help="翻訳待ちキューの上限")
+    ap.add_argument("--browsers", type=int, default=3, help="Chrome セッション数の上限")
+    ap.add_argument("--workers", type=int, default=3, help="1 コンペ内のタブの並行取得数")
+    ap.add_argument("--min-interval", type=float, default=1.0, help="同一ホストへのページ読み込み間隔（秒）")
+    ap.add_argument("--per-host", type=int, default=3, help="同一ホストへの同時ページ読み込み数")
+    ap.add_argument("--no-headless", action="store_true")
+    args = ap.parse_args()
+
+    out = pathlib.Path(args.out)
+    slugs = list(args.slugs)
+    if args.slugs_file:
+        lines = pathlib.Path(args.slugs_file).read_text(encoding="utf-8").splitlines()
+        slugs += [ln.strip() for ln in lines if ln.strip() and not ln.strip().startswith("#")]
+    comps = [(comp_url(comp_slug(args.url)), out)] if args.url else []
+    comps += [(comp_url(s), out / s) for s in dict.fromkeys(comp_slug(x) for x in slugs)]
+    if not comps and not args.threads:
+        ap.error("--url / --slugs / --slugs-file / --threads のいずれかを指定してください")
+
+    set_host_politeness(min_interval=args.min_interval, max_concurrent=args.per_host)
+    translator = None if args.no_translate else TranslationWorker(args.model, maxsize=args.queue_size)
+    pipe = Pipeline(translator)
+    if translator:
+        translator.start()
+    try:
+        run_pipeline(pipe, comps, args.threads, pathlib.Path(args.discussion_out or out),
+                     browsers=args.browsers, tab_workers=args.workers, headless=not args.no_headless)
+    finally:
+        if translator:
+            translator.close()
+    pipe.report()
+    if pipe.failed or (translator and translator.failed):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
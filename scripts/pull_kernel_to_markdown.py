@@ -3,18 +3,48 @@
 """
 Kaggle Notebook(.ipynb) → Markdown 変換（自分のEditノート含む）
 - Kaggle API で .ipynb を取得（private でも OK: ~/.kaggle/kaggle.json 必須）
+  kaggle CLI は起動せず、プロセス内の API クライアント（kaggle_api.py）で本文をメモリに直接読む
 - nbconvert で .md へ
-- 画像/添付は <slug>_files/ 下に保存
+- 画像/添付は <slug>_files/ 下に保存（同一内容の画像は 1 ファイルにまとめ、大きい画像は縮小・再圧縮）
+- 長いテキスト出力は先頭/末尾だけ残して省略行数を注記（学習ログ等で .md が膨らまないように）
+- 取得した .ipynb も <slug>.ipynb として残す（translate_notebook_with_gemini.py がセル単位で翻訳に使う）
+- 複数指定 / ユーザー単位の一括取得は並列。<out>/kernel_versions.json に各ノートの版を記録し、
+  版が変わっていないノートは取得も変換もしない
 Usage:
   python3 pull_kernel_to_markdown.py --url https://www.kaggle.com/code/<user>/<slug>/edit --out out/course [--include-outputs]
   python3 pull_kernel_to_markdown.py --ref <user>/<slug> --out out/course
+  python3 pull_kernel_to_markdown.py --ref <a>/<slug1> <b>/<slug2> --out out/kernel --workers 4
+  python3 pull_kernel_to_markdown.py --user <user> --out out/kernel            # そのユーザーの全ノート
 """
 
-import argparse, json, os, re, shutil, subprocess, tempfile, pathlib, sys
-from typing import Optional
+import argparse, hashlib, io, json, re, pathlib, sys, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple, Union
 import nbformat
+import requests
 from nbconvert import MarkdownExporter
 
+import blob_store
+from artifact_index import get_index
+from fileio import write_bytes_atomic, write_text_atomic
+from kaggle_api import KaggleApiError, get_client
+from tracing import span
+
+try:
+    from PIL import Image  # 任意: 画像の縮小・再圧縮に使う（無ければ重複除去のみ）
+except ImportError:
+    Image = None
+
+# 出力の上限（0 で無制限）
+MAX_OUTPUT_LINES = 40     # テキスト出力 1 つあたりの行数
+MAX_HTML_KB = 64          # HTML 出力（DataFrame 等）1 つあたり。超えたら text/plain に落とす
+MAX_IMAGE_PX = 1200       # 画像の長辺
+MAX_IMAGE_KB = 200        # 画像 1 枚あたり（超えたら JPEG に再圧縮を試す）
+
+VERSIONS_NAME = "kernel_versions.json"
+LIST_PAGE_SIZE = 100
+
 def parse_ref_from_url(url: str) -> Optional[str]:
     """
     https://www.kaggle.com/code/<user>/<slug> (/edit や /tutorial 付きでもOK)
@@ -27,43 +57,178 @@ def parse_ref_from_url(url: str) -> Optional[str]:
     # 末尾に /edit 等が付いても上の正規表現で slug は取れている
     return f"{user}/{slug}"
 
-def run(cmd: list[str], cwd: Optional[str] = None) -> None:
+def kernel_version(meta: Dict) -> Optional[str]:
+    """API のメタデータから版の目印を取り出す（版番号が無ければ lastRunTime）"""
+    for k in ("currentVersionNumber", "versionNumber", "lastRunTime"):
+        if meta.get(k) not in (None, ""):
+            return str(meta[k])
+    return None
+
+def fetch_notebook(kernel_ref: str) -> Tuple[nbformat.NotebookNode, Dict]:
+    """
+    Kaggle API（kernels/pull）でノートを取得し、(NotebookNode, メタデータ) を返す
+    ファイルには書かず、返ってきた JSON をそのまま nbformat で読む
+    """
+    resp = get_client().kernel_pull(kernel_ref)
+    blob, meta = resp.get("blob") or {}, resp.get("metadata") or {}
+    kind = blob.get("kernelType") or meta.get("kernelType")
+    if kind and kind != "notebook":
+        raise KaggleApiError(f"{kernel_ref} is a {kind}, not a notebook")
+    source = blob.get("source")
+    if not source:
+        raise KaggleApiError(f"{kernel_ref}: empty notebook source")
+    return nbformat.reads(source, as_version=4), meta
+
+def _truncate_lines(text: str, max_lines: int) -> str:
+    """先頭と末尾を残し、間を「… N 行省略 …」に置き換える"""
+    lines = text.splitlines(keepends=True)
+    if not max_lines or len(lines) <= max_lines:
+        return text
+    head = max_lines // 2
+    tail = max_lines - head
+    omitted = len(lines) - head - tail
+    return "".join(lines[:head]) + f"… ({omitted} lines omitted) …\n" + "".join(lines[len(lines) - tail:])
+
+
+def limit_outputs(nb, max_lines: int = MAX_OUTPUT_LINES, max_html_kb: int = MAX_HTML_KB) -> Dict[str, int]:
+    """
+    セル出力を上限内に収める（nb をその場で書き換え）
+    - stream / text/plain / traceback: 行数を max_lines に切り詰め
+    - text/html: max_html_kb を超えたら HTML を捨て text/plain（切り詰め後）を残す
+    戻り値: 切り詰めた出力数など
+    """
+    stats = {"truncated": 0, "html_dropped": 0}
+    for cell in nb.cells:
+        if cell.get("cell_type") != "code":
+            continue
+        for out in cell.get("outputs", []):
+            if out.get("output_type") == "stream":
+                text = out.get("text", "")
+                new = _truncate_lines(text, max_lines)
+                stats["truncated"] += new != text
+                out["text"] = new
+            elif out.get("output_type") == "error":
+                tb = out.get("traceback", [])
+                if max_lines and len(tb) > max_lines:
+                    out["traceback"] = tb[:1] + [f"… ({len(tb) - max_lines} frames omitted) …"] + tb[-(max_lines - 1):]
+                    stats["truncated"] += 1
+            data = out.get("data")
+            if not data:
+                continue
+            html = data.get("text/html")
+            if html is not None and max_html_kb and len(html) > max_html_kb * 1024:
+                del data["text/html"]
+                stats["html_dropped"] += 1
+            text = data.get("text/plain")
+            if isinstance(text, str):
+                new = _truncate_lines(text, max_lines)
+                stats["truncated"] += new != text
+                data["text/plain"] = new
+    return stats
+
+
+def shrink_image(data: bytes, ext: str, max_px: int = MAX_IMAGE_PX, max_kb: int = MAX_IMAGE_KB) -> tuple[bytes, str]:
+    """
+    Pillow があれば長辺 max_px に縮小し、max_kb を超える場合は JPEG 再圧縮の方が小さければ採用
+    戻り値: (画像データ, 拡張子)。Pillow が無い / 読めない画像はそのまま返す
+    """
+    if Image is None or ext not in (".png", ".jpg", ".jpeg"):
+        return data, ext
+    too_big = bool(max_kb) and len(data) > max_kb * 1024
     try:
-        subprocess.run(cmd, check=True, cwd=cwd)
-    except subprocess.CalledProcessError as e:
-        print("ERROR running:", " ".join(cmd), file=sys.stderr)
-        raise
-
-def kaggle_pull_ipynb(kernel_ref: str, dest_dir: pathlib.Path) -> pathlib.Path:
-    """
-    kaggle kernels pull <ref> -p <dest_dir>
-    を実行して .ipynb を取得し、そのパスを返す
-    """
-    dest_dir.mkdir(parents=True, exist_ok=True)
-    run(["kaggle", "kernels", "pull", kernel_ref, "-p", str(dest_dir)])
-    # 取得物から .ipynb を探す
-    ipynb_list = list(dest_dir.glob("*.ipynb"))
-    if not ipynb_list:
-        # サブフォルダに入るケースも一応捜索
-        ipynb_list = list(dest_dir.rglob("*.ipynb"))
-    if not ipynb_list:
-        raise FileNotFoundError("Downloaded files do not include an .ipynb")
-    # 通常はカーネル名と同じ .ipynb が落ちる
-    return ipynb_list[0]
-
-def ipynb_to_markdown(ipynb_path: pathlib.Path, out_md: pathlib.Path, include_outputs: bool) -> None:
-    """
-    nbconvert MarkdownExporter を使って .md に変換
+        img = Image.open(io.BytesIO(data))
+        img.load()
+    except Exception:
+        return data, ext
+    if max_px and max(img.size) > max_px:
+        img.thumbnail((max_px, max_px))
+        buf = io.BytesIO()
+        img.save(buf, format="PNG" if ext == ".png" else "JPEG", optimize=True)
+        data = buf.getvalue()
+        too_big = bool(max_kb) and len(data) > max_kb * 1024
+    if too_big:
+        buf = io.BytesIO()
+        img.convert("RGB").save(buf, format="JPEG", quality=80, optimize=True)
+        if len(buf.getvalue()) < len(data):
+            return buf.getvalue(), ".jpg"
+    return data, ext
+
+
+def store_images(body: str, outputs: Dict[str, bytes], out_dir: pathlib.Path, files_dir_name: str,
+                 max_px: int = MAX_IMAGE_PX, max_kb: int = MAX_IMAGE_KB) -> tuple[str, Dict[str, int]]:
+    """
+    nbconvert の outputs（<files_dir>/<stem>_<cell>_<i>.png → bytes）を内容ハッシュ名で保存し、
+    本文中の参照を付け替える。同じ画像は 1 ファイルにまとまる
+    """
+    files_dir = out_dir / files_dir_name
+    stats = {"images": len(outputs), "unique": 0, "bytes_in": 0, "bytes_out": 0}
+    by_hash: Dict[str, str] = {}
+    renames: Dict[str, str] = {}
+    for relname, data in outputs.items():
+        stats["bytes_in"] += len(data)
+        digest = hashlib.sha256(data).hexdigest()[:16]
+        if digest not in by_hash:
+            ext = pathlib.PurePosixPath(relname).suffix.lower()
+            small, ext = shrink_image(data, ext, max_px=max_px, max_kb=max_kb)
+            name = f"{files_dir_name}/{digest}{ext}"
+            files_dir.mkdir(parents=True, exist_ok=True)
+            write_bytes_atomic(out_dir / name, small)  # pack 後はハードリンクなので、その場では書き換えない
+            by_hash[digest] = name
+            stats["unique"] += 1
+            stats["bytes_out"] += len(small)
+        renames[relname] = by_hash[digest]
+    if renames:
+        pat = re.compile("|".join(re.escape(k) for k in sorted(renames, key=len, reverse=True)))
+        body = pat.sub(lambda m: renames[m.group(0)], body)
+    return body, stats
+
+
+_HASHED_NAME_RE = re.compile(r"^[0-9a-f]{16}\.[a-z0-9]+$")
+
+
+def prune_images(out_md: pathlib.Path, body: str, files_dir_name: str) -> int:
+    """
+    <files_dir>/ の内容ハッシュ名の画像のうち、本文と同じ画像ディレクトリを使う .md / .ja.md の
+    どれからも参照されていないもの（前の版の出力）を消す。消した数を返す
+    """
+    files_dir = out_md.parent / files_dir_name
+    if not files_dir.is_dir():
+        return 0
+    stem = files_dir_name[: -len("_files")] if files_dir_name.endswith("_files") else files_dir_name
+    texts = [body]
+    for sib in (out_md.parent / f"{stem}.md", out_md.parent / f"{stem}.ja.md"):
+        if sib != out_md and blob_store.exists(sib):
+            texts.append(blob_store.read_text(sib, errors="replace"))
+    used = set(re.findall(re.escape(files_dir_name) + r"/([0-9a-f]{16}\.[a-z0-9]+)", "\n".join(texts)))
+    removed = 0
+    for f in files_dir.iterdir():
+        if _HASHED_NAME_RE.match(f.name) and f.name not in used:
+            f.unlink(missing_ok=True)
+            removed += 1
+    return removed
+
+
+def ipynb_to_markdown(ipynb: Union[pathlib.Path, nbformat.NotebookNode], out_md: pathlib.Path, include_outputs: bool,
+                      max_lines: int = MAX_OUTPUT_LINES, max_html_kb: int = MAX_HTML_KB,
+                      max_image_px: int = MAX_IMAGE_PX, max_image_kb: int = MAX_IMAGE_KB,
+                      files_dir: Optional[str] = None) -> None:
+    """
+    nbconvert MarkdownExporter を使って .md に変換（ipynb は .ipynb のパスか読み込み済みの NotebookNode）
     - include_outputs=False の場合、出力を除去（テキストだけ欲しい時に）
-    - 添付や画像は <stem>_files/ ディレクトリに保存
+    - 添付や画像は <stem>_files/ ディレクトリに内容ハッシュ名で保存（重複は 1 枚）。
+      どの版の .md からも参照されなくなった画像は書き出し後に消す
+    - 長いテキスト / HTML 出力と大きい画像は上限に収める（各上限 0 で無制限）
+    - files_dir で画像ディレクトリ名を変えられる（翻訳版が原文と同じ <slug>_files/ を共有する場合など）
     """
     out_md.parent.mkdir(parents=True, exist_ok=True)
     resources = {
         "unique_key": out_md.stem,
-        "output_files_dir": out_md.stem + "_files"
+        "output_files_dir": files_dir or out_md.stem + "_files"
     }
-    with ipynb_path.open("r", encoding="utf-8") as f:
-        nb = nbformat.read(f, as_version=4)
+    if isinstance(ipynb, nbformat.NotebookNode):
+        nb = ipynb
+    else:
+        nb = nbformat.reads(blob_store.read_text(ipynb), as_version=4)
 
     exporter = MarkdownExporter()
     # 出力を含めない場合
@@ -71,43 +236,166 @@ def ipynb_to_markdown(ipynb_path: pathlib.Path, out_md: pathlib.Path, include_ou
         exporter.exclude_output_prompt = True
         exporter.exclude_input_prompt = True
         exporter.exclude_output = True
+    else:
+        lim = limit_outputs(nb, max_lines=max_lines, max_html_kb=max_html_kb)
+        if any(lim.values()):
+            print(f"outputs: {lim['truncated']} truncated, {lim['html_dropped']} large HTML replaced by text")
 
-    body, res = exporter.from_notebook_node(nb, resources=resources)
+    with span("nbconvert", "convert", cells=len(nb.cells), outputs=include_outputs):
+        body, res = exporter.from_notebook_node(nb, resources=resources)
 
-    # 本文を書き出し
-    out_md.write_text(body, encoding="utf-8")
-
-    # 画像や添付を保存
+    # 画像や添付を保存（outputs のキーは "<stem>_files/<name>" で .md からの相対パス）
     outputs = res.get("outputs", {})
     if outputs:
-        files_dir = out_md.parent / resources["output_files_dir"]
-        files_dir.mkdir(parents=True, exist_ok=True)
-        for relname, data in outputs.items():
-            (files_dir / relname).write_bytes(data)
+        with span("store_images", "convert", images=len(outputs)):
+            body, st = store_images(body, outputs, out_md.parent, resources["output_files_dir"],
+                                    max_px=max_image_px, max_kb=max_image_kb)
+        print(f"images: {st['images']} -> {st['unique']} files, "
+              f"{st['bytes_in'] / 1024:.0f}KB -> {st['bytes_out'] / 1024:.0f}KB")
+
+    # 本文を書き出し、前の版にしか無い画像を片付ける
+    write_text_atomic(out_md, body)
+    removed = prune_images(out_md, body, resources["output_files_dir"])
+    if removed:
+        print(f"images: removed {removed} unreferenced file(s)")
+
+# ---------- batch / version tracking ----------
+def list_user_kernels(user: str) -> Dict[str, Dict]:
+    """kernels/list を全ページ読み、ref -> {title, version} を返す"""
+    kernels: Dict[str, Dict] = {}
+    client = get_client()
+    for page in range(1, 1000):
+        rows = [k for k in client.kernels_list(user, page=page, page_size=LIST_PAGE_SIZE) if k.get("ref")]
+        for k in rows:
+            kernels[k["ref"]] = {"title": k.get("title"), "version": kernel_version(k)}
+        if len(rows) < LIST_PAGE_SIZE:
+            break
+    return kernels
+
+
+def kernel_versions(refs: List[str]) -> Dict[str, Optional[str]]:
+    """refs の現在の版を作者ごとの一覧 1 回で調べる（取れなければ None = 常に取得）"""
+    versions: Dict[str, Optional[str]] = {}
+    for user in sorted({r.split("/", 1)[0] for r in refs}):
+        try:
+            listed = list_user_kernels(user)
+        except (requests.RequestException, KaggleApiError) as e:
+            print(f"WARN: kernels/list user={user} failed: {e}", file=sys.stderr)
+            listed = {}
+        for ref in refs:
+            if ref.split("/", 1)[0] == user:
+                versions[ref] = (listed.get(ref) or {}).get("version")
+    return versions
+
+
+def load_versions(path: pathlib.Path) -> Dict[str, Dict]:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def save_versions(path: pathlib.Path, versions: Dict[str, Dict]) -> None:
+    write_text_atomic(path, json.dumps(versions, ensure_ascii=False, indent=2))
+
+
+def pull_one(kernel_ref: str, outdir: pathlib.Path, **convert_kw) -> Tuple[pathlib.Path, Optional[str]]:
+    """1 ノートを取得して <outdir>/<slug>.ipynb と <slug>.md を書き、(パス, 取得した版) を返す"""
+    out_md = outdir / f"{kernel_ref.split('/', 1)[1]}.md"
+    nb, meta = fetch_notebook(kernel_ref)
+    write_text_atomic(out_md.with_suffix(".ipynb"), nbformat.writes(nb))  # 変換で出力を書き換える前に保存
+    ipynb_to_markdown(nb, out_md, **convert_kw)
+    url, extra = f"https://www.kaggle.com/code/{kernel_ref}", {"ref": kernel_ref, "version": kernel_version(meta)}
+    idx = get_index()
+    idx.record_fetch(out_md.with_suffix(".ipynb"), url, kind="notebook", extra=extra)
+    idx.record_fetch(out_md, url, kind="kernel", extra=extra)
+    return out_md, kernel_version(meta)
+
+
+def pull_many(refs: List[str], outdir: pathlib.Path, workers: int = 4, force: bool = False,
+              **convert_kw) -> int:
+    """
+    版が前回から変わったノートだけ並列に取得・変換し、失敗数を返す
+    変換オプション（include_outputs や上限値）が変わった場合も取り直す
+    """
+    outdir.mkdir(parents=True, exist_ok=True)
+    vpath = outdir / VERSIONS_NAME
+    known = load_versions(vpath)
+    options = json.dumps(convert_kw, sort_keys=True)
+    t0 = time.perf_counter()
+    current = kernel_versions(refs)
+
+    todo = []
+    for ref in refs:
+        old, ver = known.get(ref) or {}, current.get(ref)
+        md = outdir / f"{ref.split('/', 1)[1]}.md"
+        if (not force and ver is not None and old.get("version") == ver
+                and old.get("options") == options
+                and blob_store.exists(md) and blob_store.exists(md.with_suffix(".ipynb"))):
+            continue
+        todo.append(ref)
+    print(f"{len(todo)} / {len(refs)} kernels to pull ({len(refs) - len(todo)} unchanged)")
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        futs = {ex.submit(pull_one, ref, outdir, **convert_kw): ref for ref in todo}
+        try:
+            for fut in as_completed(futs):
+                ref = futs[fut]
+                try:
+                    out_md, pulled_ver = fut.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"❌ {ref}: {e!r}", file=sys.stderr)
+                    continue
+                known[ref] = {"version": current.get(ref) or pulled_ver, "options": options, "md": out_md.name,
+                              "pulled_at": datetime.now(timezone.utc).replace(microsecond=0).isoformat()}
+                print("Saved:", out_md)
+        finally:
+            save_versions(vpath, known)
+    print(f"done in {time.perf_counter() - t0:.1f}s ({failed} failed)")
+    return failed
+
 
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--url", help="Kaggle notebook URL (edit / tutorial でもOK)")
-    ap.add_argument("--ref", help="<user>/<slug> の形式で指定する場合")
+    ap.add_argument("--url", nargs="+", default=[], help="Kaggle notebook URL (edit / tutorial でもOK、複数可)")
+    ap.add_argument("--ref", nargs="+", default=[], help="<user>/<slug> の形式で指定する場合（複数可）")
+    ap.add_argument("--refs-file", help="<user>/<slug> または URL を 1 行 1 件で書いたファイル")
+    ap.add_argument("--user", action="append", default=[], help="このユーザーの全ノートを取得（複数回指定可）")
+    ap.add_argument("--workers", type=int, default=4, help="並列取得数")
+    ap.add_argument("--force", action="store_true", help="版が変わっていなくても取得し直す")
     ap.add_argument("--out", default="out/course", help="出力ディレクトリ")
     ap.add_argument("--include-outputs", action="store_true", help="ノート出力(グラフ/print等)も.mdに含める")
+    ap.add_argument("--max-output-lines", type=int, default=MAX_OUTPUT_LINES, help="テキスト出力 1 つの行数上限（0 で無制限）")
+    ap.add_argument("--max-html-kb", type=int, default=MAX_HTML_KB, help="HTML 出力 1 つのサイズ上限 KB（0 で無制限）")
+    ap.add_argument("--max-image-px", type=int, default=MAX_IMAGE_PX, help="画像の長辺の上限 px（要 Pillow、0 で無制限）")
+    ap.add_argument("--max-image-kb", type=int, default=MAX_IMAGE_KB, help="画像 1 枚のサイズ目安 KB（要 Pillow、0 で無制限）")
     args = ap.parse_args()
 
-    kernel_ref = args.ref or (parse_ref_from_url(args.url) if args.url else None)
-    if not kernel_ref:
-        print("ERROR: --url か --ref を指定してください。例: --ref asta5107/exercise-a-single-neuron", file=sys.stderr)
+    items = list(args.ref) + list(args.url)
+    if args.refs_file:
+        lines = pathlib.Path(args.refs_file).read_text(encoding="utf-8").splitlines()
+        items += [l.strip() for l in lines if l.strip() and not l.lstrip().startswith("#")]
+    refs = []
+    for it in items:
+        ref = parse_ref_from_url(it) if it.startswith("http") else it.strip("/")
+        if not ref or "/" not in ref:
+            print(f"ERROR: ノートを特定できません: {it}", file=sys.stderr)
+            sys.exit(1)
+        refs.append(ref)
+    for user in args.user:
+        refs += sorted(list_user_kernels(user))
+    refs = list(dict.fromkeys(refs))
+    if not refs:
+        print("ERROR: --url か --ref（または --user）を指定してください。例: --ref asta5107/exercise-a-single-neuron", file=sys.stderr)
         sys.exit(1)
 
-    outdir = pathlib.Path(args.out)
-    slug = kernel_ref.split("/", 1)[1]
-    out_md = outdir / f"{slug}.md"
-
-    with tempfile.TemporaryDirectory() as td:
-        tmpdir = pathlib.Path(td)
-        ipynb = kaggle_pull_ipynb(kernel_ref, tmpdir)
-        ipynb_to_markdown(ipynb, out_md, include_outputs=args.include_outputs)
-
-    print("Saved:", out_md)
+    failed = pull_many(refs, pathlib.Path(args.out), workers=args.workers, force=args.force,
+                       include_outputs=args.include_outputs,
+                       max_lines=args.max_output_lines, max_html_kb=args.max_html_kb,
+                       max_image_px=args.max_image_px, max_image_kb=args.max_image_kb)
+    sys.exit(1 if failed else 0)
 
 if __name__ == "__main__":
     main()
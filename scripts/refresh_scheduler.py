@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+out/ の定期更新デーモン（ローカルで完結）
+- 取得元ごとに TTL を持ち、期限が来たものだけ既存の取得処理で取り直す
+    comp:<slug>:<tab>         overview / data / rules（save_competition）
+    discussion:<slug>:hot     一覧 1 ページ目の差分アーカイブ（archive_discussions.archive）
+    discussion:<slug>:all     全ページの差分アーカイブ
+    kernels                   版が変わったノートだけ取得（pull_kernel_to_markdown.pull_many）
+- 取得前後で生成物索引（artifact_index）の内容ハッシュを比べ、変わった文書だけ翻訳キューへ
+- 出力先が同じジョブ（discussion の hot と all など）は同時に走らせない
+- 同時実行ジョブ数・Chrome セッション数・1 時間あたりの取得ジョブ数・1 日あたりの翻訳数に上限
+- 翻訳に MAX_TRANSLATE_ATTEMPTS 回続けて失敗した文書は翻訳待ちから外す（原文が再び変われば戻る）
+- 実行状況（各ジョブの最終実行時刻 / 消費量 / 翻訳待ち / 翻訳の失敗回数）は <out>/scheduler_state.json に保存し、再起動後も引き継ぐ
+Usage:
+  python3 refresh_scheduler.py --config schedule.json            # 常駐
+  python3 refresh_scheduler.py --config schedule.json --once     # 期限切れのジョブを 1 回だけ実行（cron 向け）
+  python3 refresh_scheduler.py --config schedule.json --status   # 各ジョブの次回実行予定を表示
+Config (JSON):
+  {"out": "out",
+   "competitions": ["titanic"], "discussions": ["titanic"],
+   "kernels": {"users": ["you"], "refs": []},
+   "ttl": {"rules": "1d", "discussion_hot": "1h", "kernels": "6h"},
+   "limits": {"jobs": 2, "browsers": 3, "fetch_jobs_per_hour": 60, "translations_per_day": 100},
+   "translate": true, "model": null}
+"""
+
+import argparse, json, re, sys, time, queue, pathlib, threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+
+import blob_store
+from artifact_index import get_index
+from fileio import write_text_atomic
+from kaggle_browser import DriverPool, log_timing, set_host_politeness
+
+STATE_NAME = "scheduler_state.json"
+
+DEFAULT_TTL = {
+    "overview": "1d",
+    "data": "1d",
+    "rules": "1d",
+    "discussion_hot": "1h",
+    "discussion_all": "1d",
+    "kernels": "6h",
+}
+DEFAULT_LIMITS = {
+    "jobs": 2,                    # 同時に走らせるジョブ数
+    "browsers": 3,                # Chrome セッション数（全ジョブで共有）
+    "min_interval": 1.0,          # 同一ホストへのページ読み込み間隔（秒）
+    "fetch_jobs_per_hour": 60,    # 1 時間に開始する取得ジョブ数
+    "translations_per_day": 100,  # 24 時間に翻訳する文書数（Gemini の利用量の上限）
+}
+IDLE_SLEEP_MAX = 300
+MAX_TRANSLATE_ATTEMPTS = 3  # 同じ文書の翻訳がこの回数続けて失敗したら翻訳待ちから外す
+
+
+def parse_ttl(v) -> float:
+    """'30m' / '1h' / '1d' / 秒数 → 秒"""
+    if isinstance(v, (int, float)):
+        return float(v)
+    m = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*", str(v))
+    if not m:
+        raise ValueError(f"invalid ttl: {v!r}")
+    return float(m.group(1)) * {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}[m.group(2)]
+
+
+# ---------- state ----------
+class State:
+    """
+    <out>/scheduler_state.json:
+      {"last_run": {job: ts}, "spend": {kind: [ts, ...]}, "pending": [path], "failures": {path: n}}
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            data = {}
+        self.last_run: Dict[str, float] = data.get("last_run", {})
+        self.spend: Dict[str, List[float]] = data.get("spend", {})
+        self.pending: List[str] = data.get("pending", [])
+        self.failures: Dict[str, int] = data.get("failures", {})
+
+    def save(self) -> None:
+        with self._lock:
+            data = {"last_run": self.last_run, "spend": self.spend, "pending": self.pending,
+                    "failures": self.failures}
+            write_text_atomic(self.path, json.dumps(data, ensure_ascii=False, indent=1))
+
+    def try_spend(self, kind: str, limit: int, window: float) -> bool:
+        """window 秒以内の消費が limit 未満なら 1 つ消費して True"""
+        now = time.time()
+        with self._lock:
+            recent = [t for t in self.spend.get(kind, []) if now - t < window]
+            if limit and len(recent) >= limit:
+                self.spend[kind] = recent
+                return False
+            self.spend[kind] = recent + [now]
+            return True
+
+
+# ---------- jobs ----------
+class Job:
+    def __init__(self, job_id: str, ttl: float, out_dir: pathlib.Path, run: Callable[[], None]):
+        self.id, self.ttl, self.out_dir, self.run = job_id, ttl, out_dir, run
+
+    def due_at(self, state: State) -> float:
+        return state.last_run.get(self.id, 0.0) + self.ttl
+
+
+def build_jobs(cfg: Dict, pool: DriverPool) -> List[Job]:
+    from save_kaggle_comp_markdown import comp_slug, comp_url, save_competition
+    from archive_discussions import archive
+
+    out = pathlib.Path(cfg.get("out", "out"))
+    ttl = {**DEFAULT_TTL, **cfg.get("ttl", {})}
+    jobs: List[Job] = []
+
+    for s in cfg.get("competitions", []):
+        slug = comp_slug(s)
+        for tab in ("overview", "data", "rules"):
+            jobs.append(Job(f"comp:{slug}:{tab}", parse_ttl(ttl[tab]), out / slug,
+                            lambda slug=slug, tab=tab: save_competition(pool, comp_url(slug), out / slug,
+                                                                        workers=1, tabs=[tab])))
+    for s in cfg.get("discussions", []):
+        slug = comp_slug(s)
+        d = out / slug / "discussion"
+        for name, pages in (("hot", 1), ("all", 200)):
+            jobs.append(Job(f"discussion:{slug}:{name}", parse_ttl(ttl[f"discussion_{name}"]), d,
+                            lambda slug=slug, d=d, pages=pages: _check_failed(
+                                archive(slug, d, workers=pool.size, max_pages=pages, pool=pool))))
+    k = cfg.get("kernels") or {}
+    if k.get("users") or k.get("refs"):
+        jobs.append(Job("kernels", parse_ttl(ttl["kernels"]), out / "kernel", lambda: _pull_kernels(k, out / "kernel")))
+    return jobs
+
+
+class JobFailed(RuntimeError):
+    """ジョブが失敗した。changed は失敗するまでに内容が変わった原文（翻訳には回す）"""
+
+    def __init__(self, error: BaseException, changed: List[str]):
+        super().__init__(repr(error))
+        self.changed = changed
+
+
+def _check_failed(failed: int) -> None:
+    if failed:
+        raise RuntimeError(f"{failed} item(s) failed")
+
+
+def _pull_kernels(k: Dict, out_dir: pathlib.Path) -> None:
+    from pull_kernel_to_markdown import list_user_kernels, pull_many
+
+    refs = list(k.get("refs", []))
+    for user in k.get("users", []):
+        refs += sorted(list_user_kernels(user))
+    _check_failed(pull_many(list(dict.fromkeys(refs)), out_dir, workers=k.get("workers", 4),
+                            include_outputs=k.get("include_outputs", True)))
+
+
+def snapshot(out_dir: pathlib.Path) -> Dict[str, str]:
+    """out_dir 以下の原文の {path: content_hash}（索引から。ファイルは読まない）"""
+    return {r["path"]: r["content_hash"] for r in get_index().list(under=out_dir, lang="en")}
+
+
+# ---------- translation ----------
+class Translator(threading.Thread):
+    """変更された文書を 1 件ずつ翻訳（1 日あたりの上限を超えた分は pending に残して次回へ）"""
+
+    def __init__(self, state: State, per_day: int, model_name: Optional[str]):
+        super().__init__(daemon=True)
+        self.state, self.per_day, self.model_name = state, per_day, model_name
+        self.q: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._model = None
+        self.failed = 0
+
+    def model(self):
+        if self._model is None:
+            import translate_markdown_with_gemini as tr
+            self._model = tr.configure_client(self.model_name or tr.DEFAULT_MODEL)
+        return self._model
+
+    def submit(self, path: str) -> None:
+        """原文が変わった文書を翻訳待ちに入れる（失敗回数は数え直す）"""
+        with self.state._lock:
+            self.state.failures.pop(path, None)
+            if path in self.state.pending:
+                return
+            self.state.pending.append(path)
+        self.q.put(path)
+
+    def run(self):
+        while True:
+            path = self.q.get()
+            if path is None:
+                break
+            if not get_index().translation_stale(path):
+                self._done(path)
+                continue
+            if not self.state.try_spend("translations", self.per_day, 86400):
+                print(f"[scheduler] translation budget exhausted; deferring {path}", file=sys.stderr)
+                continue  # pending に残る
+            try:
+                p = pathlib.Path(path)
+                if p.suffix == ".ipynb":
+                    from translate_notebook_with_gemini import translate_notebook
+                    translate_notebook(self.model(), p, include_outputs=True)
+                else:
+                    from translate_markdown_with_gemini import translate_file
+                    translate_file(self.model(), p)
+                self._done(path)
+            except Exception as e:
+                self.failed += 1
+                with self.state._lock:
+                    n = self.state.failures[path] = self.state.failures.get(path, 0) + 1
+                print(f"[scheduler] translate failed ({n}/{MAX_TRANSLATE_ATTEMPTS}): {path}: {e!r}",
+                      file=sys.stderr)
+                if n >= MAX_TRANSLATE_ATTEMPTS:
+                    # 毎回失敗する文書で 1 日の翻訳枠を使い切らないよう、原文が変わるまで外す
+                    print(f"[scheduler] giving up on {path} until it changes", file=sys.stderr)
+                    self._done(path, keep_failures=True)
+                else:
+                    self.state.save()
+
+    def _done(self, path: str, keep_failures: bool = False) -> None:
+        with self.state._lock:
+            if path in self.state.pending:
+                self.state.pending.remove(path)
+            if not keep_failures:
+                self.state.failures.pop(path, None)
+        self.state.save()
+
+    def close(self):
+        self.q.put(None)
+        self.join()
+
+
+def translatable(path: str) -> bool:
+    """翻訳対象の原文か（kernel は .ipynb 側を訳すので .md は除く）"""
+    p = pathlib.Path(path)
+    if p.name.endswith(".ja.md") or p.name.endswith(".ja.ipynb"):
+        return False
+    if p.suffix == ".md":
+        return not blob_store.exists(p.with_suffix(".ipynb"))
+    return p.suffix == ".ipynb"
+
+
+# ---------- scheduler ----------
+class Scheduler:
+    def __init__(self, cfg: Dict, headless: bool = True):
+        self.cfg = cfg
+        self.limits = {**DEFAULT_LIMITS, **cfg.get("limits", {})}
+        self.out = pathlib.Path(cfg.get("out", "out"))
+        self.out.mkdir(parents=True, exist_ok=True)
+        self.state = State(self.out / STATE_NAME)
+        set_host_politeness(min_interval=self.limits["min_interval"], max_concurrent=self.limits["browsers"])
+        self.pool = DriverPool(size=self.limits["browsers"], headless=headless)
+        self.jobs = build_jobs(cfg, self.pool)
+        self._dir_locks: Dict[pathlib.Path, threading.Lock] = {}
+        self._dir_locks_lock = threading.Lock()
+        self.translator = None
+        self.deferred = False
+        if cfg.get("translate"):
+            self.translator = Translator(self.state, self.limits["translations_per_day"], cfg.get("model"))
+            self.translator.start()
+
+    def run_job(self, job: Job) -> List[str]:
+        """
+        ジョブを 1 回実行し、内容が変わった原文のパスを返す
+        失敗しても次の実行は TTL 後なので、それまでに取れた分の差分を JobFailed に載せて上げる
+        同じ out_dir のジョブ（discussion の hot と all など）は索引ファイルを読み書きし合うので順に実行する
+        """
+        with self._dir_lock(job.out_dir):
+            return self._run_job(job)
+
+    def _dir_lock(self, out_dir: pathlib.Path) -> threading.Lock:
+        key = out_dir.resolve()
+        with self._dir_locks_lock:
+            return self._dir_locks.setdefault(key, threading.Lock())
+
+    def _run_job(self, job: Job) -> List[str]:
+        before = snapshot(job.out_dir)
+        t0 = time.perf_counter()
+        error = None
+        try:
+            job.run()
+        except Exception as e:
+            error = e
+        finally:
+            self.state.last_run[job.id] = time.time()
+            self.state.save()
+            log_timing(f"job {job.id}", time.perf_counter() - t0)
+        after = snapshot(job.out_dir)
+        changed = [p for p, h in after.items() if before.get(p) != h]
+        if error is not None:
+            raise JobFailed(error, changed) from error
+        return changed
+
+    def run_due(self) -> int:
+        """期限切れのジョブを上限内で実行し、実行したジョブ数を返す"""
+        if self.translator and self.translator.q.empty():
+            for path in list(self.state.pending):  # 上限で見送った翻訳待ちを再投入
+                self.translator.q.put(path)
+        now = time.time()
+        due = sorted((j for j in self.jobs if j.due_at(self.state) <= now), key=lambda j: j.due_at(self.state))
+        started = []
+        self.deferred = False
+        for j in due:
+            if not self.state.try_spend("fetch_jobs", self.limits["fetch_jobs_per_hour"], 3600):
+                print(f"[scheduler] fetch budget exhausted; {len(due) - len(started)} job(s) deferred", file=sys.stderr)
+                self.deferred = True
+                break
+            started.append(j)
+        if not started:
+            return 0
+        with ThreadPoolExecutor(max_workers=max(1, self.limits["jobs"])) as ex:
+            futs = {ex.submit(self.run_job, j): j for j in started}
+            for fut in as_completed(futs):
+                job = futs[fut]
+                try:
+                    changed = fut.result()
+                except JobFailed as e:
+                    changed = e.changed
+                    print(f"❌ {job.id}: {e} ({len(changed)} changed before the failure)", file=sys.stderr)
+                except Exception as e:
+                    print(f"❌ {job.id}: {e!r}", file=sys.stderr)
+                    continue
+                else:
+                    print(f"✅ {job.id}: {len(changed)} changed")
+                if self.translator:
+                    for path in changed:
+                        if translatable(path):
+                            self.translator.submit(path)
+        return len(started)
+
+    def next_wakeup(self) -> float:
+        if self.deferred:
+            return 60.0  # 取得の上限待ち。枠が空くまで少しずつ様子を見る
+        nxt = min((j.due_at(self.state) for j in self.jobs), default=time.time() + IDLE_SLEEP_MAX)
+        return max(1.0, min(IDLE_SLEEP_MAX, nxt - time.time()))
+
+    def status(self) -> None:
+        now = time.time()
+        for j in sorted(self.jobs, key=lambda j: j.due_at(self.state)):
+            last = self.state.last_run.get(j.id)
+            print(f"{j.id:40s} ttl={j.ttl / 3600:5.1f}h  last={'-' if not last else time.strftime('%m-%d %H:%M', time.localtime(last))}"
+                  f"  next_in={max(0, j.due_at(self.state) - now) / 60:6.0f}m")
+        print(f"pending translations: {len(self.state.pending)}")
+        given_up = [p for p, n in self.state.failures.items() if n >= MAX_TRANSLATE_ATTEMPTS]
+        if given_up:
+            print(f"given up after {MAX_TRANSLATE_ATTEMPTS} failures (until the source changes): {len(given_up)}")
+
+    def close(self) -> None:
+        if self.translator:
+            self.translator.close()
+        self.pool.close()
+        self.state.save()
+
+    def serve(self, once: bool = False) -> None:
+        try:
+            while True:
+                self.run_due()
+                if once:
+                    break
+                time.sleep(self.next_wakeup())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--config", required=True, help="スケジュール設定（JSON）")
+    ap.add_argument("--once", action="store_true", help="期限切れのジョブを 1 回実行して終了")
+    ap.add_argument("--status", action="store_true", help="各ジョブの最終実行と次回予定を表示して終了")
+    ap.add_argument("--no-headless", action="store_true")
+    args = ap.parse_args()
+
+    cfg = json.loads(pathlib.Path(args.config).read_text(encoding="utf-8"))
+    sched = Scheduler(cfg, headless=not args.no_headless)
+    if args.status:
+        sched.status()
+        sched.close()
+        return
+    sched.serve(once=args.once)
+    if args.once and sched.translator and sched.translator.failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,159 +2,293 @@
 # Usage:
 #   pip install selenium webdriver-manager markdownify
 #   python3 save_kaggle_comp_markdown.py --url https://www.kaggle.com/competitions/titanic/overview
+#   python3 save_kaggle_comp_markdown.py --slugs titanic house-prices-advanced-regression-techniques --translate
+#   python3 save_kaggle_comp_markdown.py --slugs-file comps.txt --concurrency 2 --browsers 4
 # 生成物:
-#   out/overview.md, out/data.md, out/rules.md
+#   --url   : out/overview.md, out/data.md, out/rules.md
+#   --slugs : out/<slug>/overview.md, out/<slug>/data.md, out/<slug>/rules.md
 
-import argparse, time, pathlib
+import argparse, re, sys, time, queue, pathlib, threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from urllib.parse import urlparse
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
-import markdownify
-
-# ---- 共通: 安定する driver 構成 ----
-def build_driver(headless=True):
-    opt = webdriver.ChromeOptions()
-    if headless:
-        opt.add_argument("--headless=new")
-    opt.add_argument("--no-sandbox")
-    opt.add_argument("--disable-dev-shm-usage")
-    opt.add_argument("--window-size=1920,1080")
-    opt.add_argument(
-        "--user-agent=Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
-        "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-    )
-    return webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=opt)
-
-def click_cookie_if_appears(driver):
-    # “OK, Got it.” / “Accept all” があれば押す（無ければスルー）
-    for xp in [
-        "//div[contains(., 'OK, Got it.') and contains(@class,'bxFwkO')]",
-        "//button[contains(., 'Accept all') or contains(., 'Accept All')]",
-    ]:
-        try:
-            WebDriverWait(driver, 3).until(EC.element_to_be_clickable((By.XPATH, xp))).click()
-            time.sleep(0.3)
-            break
-        except Exception:
-            pass
-
-def html2md(html: str) -> str:
-    return markdownify.markdownify(
-        html,
-        heading_style="ATX",
-        strip=["script", "style", "svg", "iframe"]
-    ).strip()
 
+# ---- 共通: 安定する driver 構成（軽量プロファイル） ----
+import blob_store
+from kaggle_browser import DriverPool, log_timing, open_page, set_host_politeness
+from artifact_index import get_index
+from fileio import write_text_atomic
+from html_to_markdown import html2md  # 共通の HTML→Markdown 変換
+
+
+RENDER_ROOT_CSS = "[data-testid='competition-detail-render-tid']"
 
 # ---- Overview タブ: セクションIDをピンポイント抽出 ----
+# 全セクションを 1 回の execute_script でまとめて回収する（要素ごとの WebDriver 往復をしない）
+_OVERVIEW_JS = """
+const [secIds, fallbackXp] = arguments;
+const xp = (q) => document.evaluate(
+  q, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+const chunks = [];
+for (const sid of secIds) {
+  // セクションが無い場合はスキップ（Overviewには全部ないこともある）
+  if (!document.getElementById(sid)) continue;
+  // 直後の“本文”コンテナ（.sc-eTCgfj）→ h2/p を含む最初の div の順にフォールバック
+  const el = xp(`//div[@id='${sid}']/following::div[contains(@class,'sc-eTCgfj')][1]`)
+          || xp(`//div[@id='${sid}']/following::div[.//h2 or .//p][1]`);
+  if (el) chunks.push(el.innerHTML);
+}
+if (!chunks.length) {
+  // まれに構造が変わった場合は中央カラム全体を最後の手段で取得
+  const el = xp(fallbackXp);
+  if (el) chunks.push(el.innerHTML);
+}
+return chunks;
+"""
+
+# Overview ページで本文に出てくる代表的なセクションID
+OVERVIEW_SECTION_IDS = ["abstract", "description", "evaluation", "frequently-asked-questions", "citation"]
+
+
 def fetch_overview(driver, url) -> str:
-    driver.get(url)
-    click_cookie_if_appears(driver)
-    # Overview ページで本文に出てくる代表的なセクションID
-    sec_ids = ["abstract", "description", "evaluation", "frequently-asked-questions", "citation"]
-    chunks = []
-    for sid in sec_ids:
-        try:
-            # 1) セクションの見出しブロック出現を待つ
-            WebDriverWait(driver, 15).until(EC.presence_of_element_located((By.ID, sid)))
-            # 2) 直後の“本文”コンテナ（debug.html で確認できる .sc-eTCgfj）を取る
-            #    先頭の1つでOK。見つからなければ、h2/p を含む最初の大きめのdivにフォールバック。
-            xpaths = [
-                f"//div[@id='{sid}']/following::div[contains(@class,'sc-eTCgfj')][1]",
-                f"//div[@id='{sid}']/following::div[.//h2 or .//p][1]"
-            ]
-            el = None
-            for xp in xpaths:
-                try:
-                    el = WebDriverWait(driver, 5).until(EC.presence_of_element_located((By.XPATH, xp)))
-                    break
-                except Exception:
-                    continue
-            if el:
-                chunks.append(el.get_attribute("innerHTML"))
-        except Exception:
-            # セクションが無い場合はスキップ（Overviewには全部ないこともある）
-            pass
+    # 本文が描画され DOM が落ち着くまで待つ（セクションごとの固定タイムアウト待ちはしない）
+    open_page(driver, url, css=RENDER_ROOT_CSS, timeout=15)
+    t0 = time.perf_counter()
+    chunks = driver.execute_script(
+        _OVERVIEW_JS,
+        OVERVIEW_SECTION_IDS,
+        "//div[@data-testid='competition-detail-render-tid']//div[.//h2 and (.//p or .//li)]",
+    ) or []
+    log_timing("extract overview", time.perf_counter() - t0, f"({len(chunks)} sections)")
     if not chunks:
-        # まれに構造が変わった場合は中央カラム全体を最後の手段で取得
-        try:
-            el = WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((
-                    By.XPATH,
-                    "//div[@data-testid='competition-detail-render-tid']//div[.//h2 and (.//p or .//li)]"
-                ))
-            )
-            chunks.append(el.get_attribute("innerHTML"))
-        except Exception:
-            # デバッグ用
-            pathlib.Path("debug_overview.html").write_text(driver.page_source, encoding="utf-8")
-            raise RuntimeError("Overviewの本文が見つかりませんでした（debug_overview.html を確認）")
+        # デバッグ用
+        pathlib.Path("debug_overview.html").write_text(driver.page_source, encoding="utf-8")
+        raise RuntimeError("Overviewの本文が見つかりませんでした（debug_overview.html を確認）")
     # HTML -> Markdown
     return "\n\n---\n\n".join(html2md(c) for c in chunks)
 
 # ---- Data / Rules はURLを変えて、中心カラムをまとめて抜く ----
+# 中央カラムの“本文に見える大きな塊”（h2/p/ol/ulを含む）を上から最大 limit 個、1 回で回収
+_GENERIC_TAB_JS = """
+const [q, limit] = arguments;
+const snap = document.evaluate(q, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+const out = [];
+for (let i = 0; i < snap.snapshotLength && out.length < limit; i++) {
+  out.push(snap.snapshotItem(i).innerHTML);
+}
+return out;
+"""
+
+
 def fetch_generic_tab(driver, tab_url) -> str:
-    driver.get(tab_url)
-    click_cookie_if_appears(driver)
-    # 中央カラムの“本文に見える最初の大きな塊”を拾う（h2/p/ol/ulを含む）
-    # 同様の塊が複数ある場合は上から2-3個を連結
-    els = WebDriverWait(driver, 15).until(
-        EC.presence_of_all_elements_located((
-            By.XPATH,
-            "//div[@data-testid='competition-detail-render-tid']"
-            "//div[.//h2 or .//h3][.//p or .//li][not(ancestor::nav)][not(ancestor::aside)]"
-        ))
-    )
+    open_page(driver, tab_url, css=RENDER_ROOT_CSS, timeout=15)
+    t0 = time.perf_counter()
     # 取りすぎ防止で上位3ブロックに制限
-    html_chunks = [e.get_attribute("innerHTML") for e in els[:3]]
+    html_chunks = driver.execute_script(
+        _GENERIC_TAB_JS,
+        "//div[@data-testid='competition-detail-render-tid']"
+        "//div[.//h2 or .//h3][.//p or .//li][not(ancestor::nav)][not(ancestor::aside)]",
+        3,
+    ) or []
+    log_timing("extract tab", time.perf_counter() - t0, f"({len(html_chunks)} blocks) {tab_url}")
     if not html_chunks:
         pathlib.Path("debug_tab.html").write_text(driver.page_source, encoding="utf-8")
         raise RuntimeError("タブ本文が見つかりませんでした（debug_tab.html を確認）")
     return "\n\n---\n\n".join(html2md(c) for c in html_chunks)
 
+
+def with_tab(base_url: str, tab: str) -> str:
+    """URL末尾をタブ名に差し替え"""
+    parts = urlparse(base_url.rstrip("/"))
+    path = parts.path.split("/")
+    if path[-1] in {"overview", "data", "rules"}:
+        path[-1] = tab
+    else:
+        path.append(tab)
+    return parts._replace(path="/".join(path)).geturl()
+
+
+TAB_FETCHERS = {
+    "overview": fetch_overview,     # セクションIDベースで精密取得
+    "data": fetch_generic_tab,      # 汎用抽出
+    "rules": fetch_generic_tab,     # 汎用抽出
+}
+
+
+def write_if_changed(path: pathlib.Path, text: str) -> bool:
+    """内容が変わったときだけ書き込む（未変更ファイルの mtime を保つ）。書いたら True"""
+    if blob_store.exists(path) and blob_store.read_text(path) == text:
+        return False
+    write_text_atomic(path, text)
+    return True
+
+
+def save_competition(pool: DriverPool, url: str, outdir: pathlib.Path, workers: int = 3, tabs=None,
+                     on_saved=None) -> dict:
+    """
+    overview / data / rules（tabs 指定時はその一部）を pool のセッションで並行取得して outdir に保存。
+    on_saved(tab, path, changed) は各タブの保存直後に（ドライバを返してから）呼ばれる。
+    戻り値: {tab: (保存パス, 内容が変わったか)}
+    """
+    outdir.mkdir(parents=True, exist_ok=True)
+
+    def run_tab(tab: str):
+        with pool.acquire() as d:
+            t0 = time.perf_counter()
+            md = TAB_FETCHERS[tab](d, with_tab(url, tab))
+        path = outdir / f"{tab}.md"
+        changed = write_if_changed(path, md)
+        get_index().record_fetch(path, with_tab(url, tab), kind=tab, text=md)
+        log_timing(f"tab {tab}", time.perf_counter() - t0)
+        if on_saved:
+            on_saved(tab, path, changed)
+        return path, changed
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        futs = {tab: ex.submit(run_tab, tab) for tab in (tabs or TAB_FETCHERS)}
+        return {tab: fut.result() for tab, fut in futs.items()}
+
+
+# ---- 複数コンペの一括取得 ----
+def comp_slug(s: str) -> str:
+    """slug でも URL でも受け付けて slug を返す"""
+    m = re.search(r"/competitions/([^/?#]+)", s)
+    return m.group(1) if m else s.strip().strip("/")
+
+
+def comp_url(slug: str) -> str:
+    return f"https://www.kaggle.com/competitions/{slug}"
+
+
+TRANSLATE_QUEUE_MAX = 8  # 翻訳待ちの上限。埋まると取得側が submit() で待つ
+
+
+class TranslationWorker(threading.Thread):
+    """
+    新規/変更された .md を受け取り、届いた順に Gemini 翻訳する（レート制限があるので 1 スレッド）。
+    キューは有界で、翻訳が追いつかないときは取得側を待たせる。
+    translate_markdown_with_gemini は翻訳を使うときだけ import する。
+    """
+
+    def __init__(self, model_name: str = None, maxsize: int = TRANSLATE_QUEUE_MAX):
+        super().__init__(daemon=True)
+        import translate_markdown_with_gemini as tr
+        self.tr = tr
+        self.model = tr.configure_client(model_name or tr.DEFAULT_MODEL)
+        self.q: "queue.Queue[pathlib.Path]" = queue.Queue(maxsize=max(0, maxsize))
+        self.translated = 0
+        self.skipped = 0
+        self.failed = 0
+        self.busy = 0.0           # 翻訳に使った秒数
+        self.last_done = None     # 最後の翻訳が終わった時刻（perf_counter）
+
+    def submit(self, path: pathlib.Path, force: bool = False) -> bool:
+        """翻訳が古い / 無いときだけキューに入れる（満杯なら空くまで待つ）"""
+        if not force and not get_index().translation_stale(path):
+            self.skipped += 1
+            return False
+        self.q.put(path)
+        return True
+
+    def run(self):
+        while True:
+            path = self.q.get()
+            if path is None:
+                break
+            t0 = time.perf_counter()
+            try:
+                print(f"Translating: {path}")
+                self.tr.translate_file(self.model, path)
+                self.translated += 1
+            except Exception as e:
+                self.failed += 1
+                print("ERROR translating:", path, repr(e), file=sys.stderr)
+            finally:
+                self.last_done = time.perf_counter()
+                self.busy += self.last_done - t0
+
+    def close(self):
+        self.q.put(None)
+        self.join()
+        self.tr.print_route_report(self.model)  # --model auto のときの振り分け結果
+
+
+def crawl_competitions(slugs: list, out_root: pathlib.Path, concurrency: int = 2, browsers: int = 3,
+                       headless: bool = True, translator: TranslationWorker = None) -> int:
+    """
+    slugs を最大 concurrency 件ずつ並行取得し out_root/<slug>/ に保存。
+    translator があれば、新規/変更（または未翻訳）の .md をタブの保存直後に翻訳キューへ渡す。
+    戻り値: 失敗したコンペ数
+    """
+    def on_saved(slug):
+        def _cb(tab, path, changed):
+            print(f"✅ {slug}/{tab}.md", "(updated)" if changed else "(unchanged)")
+            if translator:
+                translator.submit(path)
+        return _cb
+
+    failed = 0
+    with DriverPool(size=browsers, headless=headless) as pool, \
+            ThreadPoolExecutor(max_workers=max(1, concurrency)) as ex:
+        futs = {ex.submit(save_competition, pool, comp_url(s), out_root / s, on_saved=on_saved(s)): s
+                for s in slugs}
+        for fut in as_completed(futs):
+            try:
+                fut.result()
+            except Exception as e:
+                failed += 1
+                print(f"❌ {futs[fut]}: {e!r}", file=sys.stderr)
+    return failed
+
+
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--url", required=True, help="例: https://www.kaggle.com/competitions/titanic/overview")
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--url", help="例: https://www.kaggle.com/competitions/titanic/overview")
+    src.add_argument("--slugs", nargs="+", help="一括取得するコンペ slug（URL も可）。out/<slug>/ に保存")
+    src.add_argument("--slugs-file", help="slug を 1 行 1 件で書いたファイル（# はコメント）")
     ap.add_argument("--out", default="out", help="保存ディレクトリ")
     ap.add_argument("--no-headless", action="store_true")
+    ap.add_argument("--workers", type=int, default=3, help="タブの並行取得数（1 なら 1 セッションで順番に取得）")
+    ap.add_argument("--concurrency", type=int, default=2, help="一括取得時に同時に処理するコンペ数")
+    ap.add_argument("--browsers", type=int, default=3, help="一括取得時の Chrome セッション数の上限")
+    ap.add_argument("--min-interval", type=float, default=1.0, help="同一ホストへのページ読み込み間隔（秒）")
+    ap.add_argument("--per-host", type=int, default=3, help="同一ホストへの同時ページ読み込み数")
+    ap.add_argument("--translate", action="store_true", help="新規/変更ファイルをそのまま Gemini 翻訳に回す")
+    ap.add_argument("--model", default=None, help="翻訳に使う Gemini モデル名（既定: gemini-1.5-flash / $GEMINI_MODEL）。"
+                    "auto はチャンクごとに振り分け（gemini-1.5-pro も使うので費用が増える）")
     args = ap.parse_args()
 
-    base = args.url.rstrip("/")
-    # URL末尾をタブ名に差し替え
-    def with_tab(tab):
-        parts = urlparse(base)
-        path = parts.path.split("/")
-        if path[-1] in {"overview","data","rules"}:
-            path[-1] = tab
-        else:
-            path.append(tab)
-        return parts._replace(path="/".join(path)).geturl()
+    outdir = pathlib.Path(args.out)
+    t0 = time.perf_counter()
 
-    outdir = pathlib.Path(args.out); outdir.mkdir(parents=True, exist_ok=True)
+    if args.url:
+        with DriverPool(size=args.workers, headless=not args.no_headless) as pool:
+            saved = save_competition(pool, args.url, outdir, workers=args.workers)
+        for path, _ in saved.values():
+            print("✅ saved:", path)
+        log_timing("competition total", time.perf_counter() - t0)
+        return
 
-    driver = build_driver(headless=not args.no_headless)
-    try:
-        # Overview（セクションIDベースで精密取得）
-        md = fetch_overview(driver, with_tab("overview"))
-        (outdir / "overview.md").write_text(md, encoding="utf-8")
-        print("✅ saved:", outdir / "overview.md")
-
-        # Data（汎用抽出）
-        md = fetch_generic_tab(driver, with_tab("data"))
-        (outdir / "data.md").write_text(md, encoding="utf-8")
-        print("✅ saved:", outdir / "data.md")
-
-        # Rules（汎用抽出）
-        md = fetch_generic_tab(driver, with_tab("rules"))
-        (outdir / "rules.md").write_text(md, encoding="utf-8")
-        print("✅ saved:", outdir / "rules.md")
+    if args.slugs_file:
+        lines = pathlib.Path(args.slugs_file).read_text(encoding="utf-8").splitlines()
+        raw = [ln.strip() for ln in lines if ln.strip() and not ln.strip().startswith("#")]
+    else:
+        raw = args.slugs
+    slugs = list(dict.fromkeys(comp_slug(s) for s in raw))
 
+    set_host_politeness(min_interval=args.min_interval, max_concurrent=args.per_host)
+    translator = TranslationWorker(args.model) if args.translate else None
+    if translator:
+        translator.start()
+    try:
+        failed = crawl_competitions(slugs, outdir, concurrency=args.concurrency, browsers=args.browsers,
+                                    headless=not args.no_headless, translator=translator)
     finally:
-        driver.quit()
+        if translator:
+            translator.close()
+    log_timing(f"crawl total ({len(slugs)} competitions)", time.perf_counter() - t0)
+    if failed or (translator and translator.failed):
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -1,43 +1,23 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 # Save entire Kaggle Learn/Notebook page to Markdown by fetching the rendered iframe HTML.
+# iframe src はまず HTTP だけで解決し（共有 Session / keep-alive）、失敗時のみ Chrome を起動する。
 
-import re, time, sys, pathlib, requests
+import re, sys, json, time, html as htmllib, pathlib, threading, requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
-import markdownify
-
-# ---------- webdriver ----------
-def build_driver(headless: bool = True) -> webdriver.Chrome:
-    opt = webdriver.ChromeOptions()
-    if headless:
-        opt.add_argument("--headless=new")
-    opt.add_argument("--no-sandbox")
-    opt.add_argument("--disable-dev-shm-usage")
-    opt.add_argument("--window-size=1920,1080")
-    opt.add_argument("--disable-blink-features=AutomationControlled")
-    opt.add_argument("--disable-features=Translate,AutomationControlled")
-    opt.add_experimental_option("excludeSwitches", ["enable-automation"])
-    opt.add_experimental_option("useAutomationExtension", False)
-    opt.add_argument(
-        "--user-agent=Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
-        "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-    )
-    return webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=opt)
+
+# ---------- webdriver（軽量プロファイル） ----------
+from kaggle_browser import build_driver, log_timing, open_page, wait_ready
+from kaggle_http import get_text
+from artifact_index import get_index
+from fileio import write_text_atomic
 
 # ---------- html -> markdown ----------
-def html2md(html: str) -> str:
-    # ← convert パラメータを削除（strip だけにする）
-    return markdownify.markdownify(
-        html,
-        heading_style="ATX",
-        strip=["script", "style", "svg", "iframe"],
-    ).strip()
+from html_to_markdown import html2md
 
 def normalize_slug(url: str) -> str:
     slug = url.rstrip("/").split("/")[-1]
@@ -47,7 +27,7 @@ def normalize_slug(url: str) -> str:
 def fetch_iframe_src(page_url: str, timeout: int = 30) -> tuple[str, str]:
     d = build_driver(headless=True)
     try:
-        d.get(page_url)
+        open_page(d, page_url, css="iframe#rendered-kernel-content", timeout=timeout)
         page_title = d.title or ""
         iframe = WebDriverWait(d, timeout).until(
             EC.presence_of_element_located((By.CSS_SELECTOR, "iframe#rendered-kernel-content"))
@@ -59,10 +39,56 @@ def fetch_iframe_src(page_url: str, timeout: int = 30) -> tuple[str, str]:
     finally:
         d.quit()
 
+# ---------- HTTP fast path ----------
+_IFRAME_SRC_RES = [
+    re.compile(r'<iframe[^>]*id="rendered-kernel-content"[^>]*src="([^"]+)"'),
+    re.compile(r'<iframe[^>]*src="([^"]+)"[^>]*id="rendered-kernel-content"'),
+    re.compile(r'"renderedOutputUrl"\s*:\s*("(?:[^"\\]|\\.)+")'),
+    re.compile(r'(https://www\.kaggleusercontent\.com/kf/\d+/[^"\'\s<>\\]+)'),
+]
+_TITLE_RE = re.compile(r"<title[^>]*>(.*?)</title>", re.S | re.I)
+
+# 同一プロセス内で解決済みの page_url -> (src, title)
+_src_cache: dict[str, tuple[str, str]] = {}
+_src_lock = threading.Lock()
+
+
+def resolve_iframe_src_http(page_url: str, timeout: int = 30) -> tuple[str, str]:
+    """ノートブックページの HTML から rendered-kernel の URL を導出（見つからなければ LookupError）"""
+    html = get_text(page_url, timeout=timeout)
+    m = _TITLE_RE.search(html)
+    title = htmllib.unescape(m.group(1).strip()) if m else ""
+    for rx in _IFRAME_SRC_RES:
+        m = rx.search(html)
+        if not m:
+            continue
+        raw = m.group(1)
+        src = json.loads(raw) if raw.startswith('"') else htmllib.unescape(raw)
+        return src, title
+    raise LookupError("rendered-kernel iframe src not found in page HTML")
+
+
+def resolve_iframe_src(page_url: str, timeout: int = 30) -> tuple[str, str]:
+    """キャッシュ → HTTP → ブラウザ の順に iframe src を解決"""
+    with _src_lock:
+        if page_url in _src_cache:
+            return _src_cache[page_url]
+    t0 = time.perf_counter()
+    try:
+        res = resolve_iframe_src_http(page_url, timeout=timeout)
+        how = "http"
+    except (requests.RequestException, LookupError, ValueError):
+        res = fetch_iframe_src(page_url, timeout=timeout)
+        how = "browser"
+    log_timing(f"resolve iframe src ({how})", time.perf_counter() - t0, page_url)
+    with _src_lock:
+        _src_cache[page_url] = res
+    return res
+
+
 def fetch_rendered_html(iframe_src: str, timeout: int = 30) -> str:
-    r = requests.get(iframe_src, timeout=timeout)
-    r.raise_for_status()
-    return r.text
+    # 共有 Session + ディスクキャッシュ（ETag/Last-Modified で条件付き GET）
+    return get_text(iframe_src, timeout=timeout)
 
 def extract_notebook_inner(html: str) -> str:
     soup = BeautifulSoup(html, "html.parser")
@@ -81,20 +107,20 @@ def promote_first_heading_to_h1(md: str, fallback_title: str = "") -> str:
     return (f"# {fallback_title}\n\n{md}".strip()) if fallback_title else md
 
 def fetch_notebook_markdown(page_url: str) -> str:
-    iframe_src, page_title = fetch_iframe_src(page_url)
+    iframe_src, page_title = resolve_iframe_src(page_url)
     try:
         html = fetch_rendered_html(iframe_src)
     except requests.HTTPError:
         # フォールバック（めったに使われない想定）
         d = build_driver(headless=True)
         try:
-            d.get(page_url)
+            open_page(d, page_url, css="iframe#rendered-kernel-content", timeout=30)
             iframe = WebDriverWait(d, 30).until(
                 EC.presence_of_element_located((By.CSS_SELECTOR, "iframe#rendered-kernel-content"))
             )
             d.switch_to.frame(iframe)
             WebDriverWait(d, 30).until(EC.presence_of_element_located((By.CSS_SELECTOR, "#notebook")))
-            time.sleep(1.0)
+            wait_ready(d, css="#notebook", quiet_ms=500, timeout=10)
             root = d.find_element(By.CSS_SELECTOR, "#notebook")
             html = root.get_attribute("innerHTML") or ""
         finally:
@@ -110,18 +136,28 @@ def save_notebook_markdown(url: str, out_dir: str = "out/course") -> pathlib.Pat
     outp = pathlib.Path(out_dir); outp.mkdir(parents=True, exist_ok=True)
     md = fetch_notebook_markdown(url)
     path = outp / f"{normalize_slug(url)}.md"
-    path.write_text(md, encoding="utf-8")
+    write_text_atomic(path, md)
+    get_index().record_fetch(path, url, kind="course", text=md)
     return path
 
+def save_many(urls: list[str], out_dir: str = "out/course", workers: int = 4) -> int:
+    """複数ノートブックを並列取得（HTTP 経路なら Chrome を起動しない）。失敗件数を返す"""
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        futs = {ex.submit(save_notebook_markdown, u, out_dir): u for u in urls}
+        for fut in as_completed(futs):
+            try:
+                print("Saved:", fut.result())
+            except Exception as e:
+                failed += 1
+                print("ERROR:", futs[fut], repr(e), file=sys.stderr)
+    return failed
+
 if __name__ == "__main__":
     import argparse
     ap = argparse.ArgumentParser()
-    ap.add_argument("--url", required=True, help="Kaggle Notebook/Course URL")
+    ap.add_argument("--url", required=True, nargs="+", help="Kaggle Notebook/Course URL（複数可）")
     ap.add_argument("--out", default="out/course", help="Output directory")
+    ap.add_argument("--workers", type=int, default=4, help="複数 URL 指定時の並列数")
     args = ap.parse_args()
-    try:
-        p = save_notebook_markdown(args.url, out_dir=args.out)
-        print("Saved:", p)
-    except Exception as e:
-        print("ERROR:", repr(e), file=sys.stderr)
-        sys.exit(1)
+    sys.exit(1 if save_many(args.url, out_dir=args.out, workers=args.workers) else 0)
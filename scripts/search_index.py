@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+out/ 以下の .md / .ja.md の全文検索（SQLite FTS5）
+- 日本語（かな・漢字の連続）は文字 2-gram に分けて索引（分かち書き辞書は不要）。英語は unicode61 の単語単位
+- 検索語も同じ規則で分け、連続する 2-gram のフレーズとして照合するので、任意の部分文字列で当たる
+- 取得・翻訳で .md が書かれるたびに artifact_index から index_file() が呼ばれ、差分だけ更新される
+  （外で書き換えられたファイルは sync() が mtime / size を見て拾う）
+- スニペットは上位件数ぶんだけ原文から切り出して強調
+環境変数:
+  KAGGLE_SEARCH_DB  DB ファイル（既定: <project>/out/search.sqlite）
+Usage:
+  python3 search_index.py --sync out
+  python3 search_index.py --query "欠損値 補完" [--lang ja]
+  python3 search_index.py --bench 30000        # 合成文書で検索時間を計測
+"""
+
+import os, re, sys, html, time, random, sqlite3, pathlib, tempfile, threading
+from typing import Dict, List, Optional
+
+import blob_store
+
+DEFAULT_DB = pathlib.Path(__file__).resolve().parent.parent / "out" / "search.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    id     INTEGER PRIMARY KEY,
+    path   TEXT UNIQUE,
+    mtime  REAL,
+    size   INTEGER,
+    lang   TEXT,
+    kind   TEXT,
+    title  TEXT,
+    body   TEXT
+);
+-- lang / kind も FTS 側に持ち、絞り込みを MATCH の中で済ませる（docs との JOIN は上位件数ぶんだけ）
+CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(title, body, lang, kind, tokenize = "unicode61 remove_diacritics 2");
+"""
+# 並べ替えは FTS5 の rank（bm25、タイトルの一致を重く）。ORDER BY rank は関数呼び出しより速い
+RANK = "bm25(5.0, 1.0, 0.0, 0.0)"
+# bm25 は一致した全文書で計算されるため、ほぼ全文書に出る語では遅くなる。
+# 一致がこれより多ければ、新しい（rowid の大きい）方からこの件数の中だけで順位付けする
+RANK_MAX_CANDIDATES = 2000
+
+# かな・カナ・漢字（CJK 統合漢字 / 拡張 A / 互換）・半角カナ・々・ー
+_CJK_RUN = re.compile(r"[々぀-ヿ㐀-䶿一-鿿豈-﫿ｦ-ﾟ]+")
+_HEADING = re.compile(r"^#{1,6}\s+(.+?)\s*#*\s*$", re.M)
+
+
+def ngram(text: str, query: bool = False) -> str:
+    """
+    日本語の連続部分を 2-gram の並びに置き換える（それ以外はそのまま）
+    索引側は末尾の 1 文字も加える（1 文字の検索語を前方一致で拾うため）
+    """
+    def repl(m):
+        run = m.group(0)
+        grams = [run[i:i + 2] for i in range(len(run) - 1)] or [run]
+        if not query and len(run) > 1:
+            grams.append(run[-1])
+        return " " + " ".join(grams) + " "
+    return _CJK_RUN.sub(repl, text)
+
+
+def build_query(q: str) -> Optional[str]:
+    """空白区切りの検索語を AND で結ぶ FTS5 クエリに変換（各語はフレーズとして照合）"""
+    parts = []
+    for term in q.split():
+        if _CJK_RUN.fullmatch(term) and len(term) == 1:
+            parts.append(f'"{term}" *')
+            continue
+        phrase = ngram(term, query=True).strip().replace('"', '""')
+        if phrase and re.search(r"\w", phrase):
+            parts.append(f'"{phrase}"')
+    return " AND ".join(parts) or None
+
+
+def make_snippet(body: str, terms: List[str], width: int = 160) -> str:
+    """最初に当たった箇所の前後を切り出し、検索語を <mark> で囲む（HTML エスケープ済み）"""
+    flat = re.sub(r"\s+", " ", body)
+    low = flat.lower()
+    hits = [low.find(t.lower()) for t in terms if t]
+    hits = [h for h in hits if h >= 0]
+    start = max(0, min(hits) - width // 3) if hits else 0
+    piece = flat[start:start + width]
+    out = html.escape(piece)
+    for t in sorted({t for t in terms if t}, key=len, reverse=True):
+        out = re.sub(re.escape(html.escape(t)), lambda m: f"<mark>{m.group(0)}</mark>", out, flags=re.I)
+    return ("…" if start else "") + out + ("…" if start + width < len(flat) else "")
+
+
+def doc_title(path: pathlib.Path, text: str) -> str:
+    m = _HEADING.search(text)
+    return m.group(1).strip() if m else path.stem
+
+
+def doc_lang(path: pathlib.Path) -> str:
+    return "ja" if path.name.endswith(".ja.md") else "en"
+
+
+class SearchIndex:
+    def __init__(self, db_path=None):
+        self.db_path = pathlib.Path(db_path or os.getenv("KAGGLE_SEARCH_DB") or DEFAULT_DB)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._conn() as c:
+            c.executescript(SCHEMA)
+            c.execute("INSERT INTO docs_fts (docs_fts, rank) VALUES ('rank', ?)", (RANK,))
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # ---------- write ----------
+    def index_file(self, path, text: Optional[str] = None, kind: Optional[str] = None) -> None:
+        """1 ファイルを索引に入れる（既にあれば置き換え）"""
+        p = pathlib.Path(path).resolve()
+        store = blob_store.get_store()
+        if text is None:
+            text = store.read_text(p, errors="replace")
+        mtime, size = store.stat(p)
+        if kind is None:
+            from artifact_index import guess_kind
+            kind = guess_kind(pathlib.Path(p.name[: -len(".ja.md")] + ".md") if p.name.endswith(".ja.md") else p)
+        title = doc_title(p, text)
+        with self._conn() as c:
+            row = c.execute("SELECT id FROM docs WHERE path = ?", (str(p),)).fetchone()
+            if row:
+                c.execute("UPDATE docs SET mtime=?, size=?, lang=?, kind=?, title=?, body=? WHERE id=?",
+                          (mtime, size, doc_lang(p), kind, title, text, row["id"]))
+                c.execute("DELETE FROM docs_fts WHERE rowid = ?", (row["id"],))
+                doc_id = row["id"]
+            else:
+                doc_id = c.execute("INSERT INTO docs (path, mtime, size, lang, kind, title, body) VALUES (?,?,?,?,?,?,?)",
+                                   (str(p), mtime, size, doc_lang(p), kind, title, text)).lastrowid
+            c.execute("INSERT INTO docs_fts (rowid, title, body, lang, kind) VALUES (?, ?, ?, ?, ?)",
+                      (doc_id, ngram(title), ngram(text), doc_lang(p), kind or ""))
+
+    def remove(self, path) -> None:
+        with self._conn() as c:
+            row = c.execute("SELECT id FROM docs WHERE path = ?", (str(pathlib.Path(path).resolve()),)).fetchone()
+            if row:
+                c.execute("DELETE FROM docs_fts WHERE rowid = ?", (row["id"],))
+                c.execute("DELETE FROM docs WHERE id = ?", (row["id"],))
+
+    def sync(self, root) -> Dict[str, int]:
+        """root 以下の *.md と索引を突き合わせ、追加・更新・削除された分だけ反映"""
+        root = pathlib.Path(root).resolve()
+        known = {r["path"]: (r["mtime"], r["size"]) for r in self._conn().execute(
+            "SELECT path, mtime, size FROM docs WHERE path LIKE ?", (str(root).rstrip("/") + "/%",))}
+        stats = {"added": 0, "updated": 0, "removed": 0}
+        seen = set()
+        store = blob_store.get_store()
+        for p in store.glob(root, "*.md", recursive=True):
+            key = str(p.resolve())
+            seen.add(key)
+            mtime, size = store.stat(p)
+            old = known.get(key)
+            if old and old[0] == mtime and old[1] == size:
+                continue
+            self.index_file(p)
+            stats["updated" if old else "added"] += 1
+        for key in set(known) - seen:
+            self.remove(key)
+            stats["removed"] += 1
+        return stats
+
+    # ---------- read ----------
+    def search(self, q: str, limit: int = 20, lang: Optional[str] = None, kind: Optional[str] = None) -> List[Dict]:
+        """bm25 順（タイトルの一致を重く）に上位 limit 件を返す"""
+        fts_q = build_query(q)
+        if not fts_q:
+            return []
+        fts_q = "{title body} : (" + fts_q + ")"
+        if lang:
+            fts_q += f' AND lang : "{lang}"'
+        if kind:
+            fts_q += ' AND kind : "' + kind.replace('"', '""') + '"'
+        conn = self._conn()
+        try:
+            floor = conn.execute("SELECT rowid FROM docs_fts WHERE docs_fts MATCH ? ORDER BY rowid DESC "
+                                 "LIMIT 1 OFFSET ?", (fts_q, RANK_MAX_CANDIDATES - 1)).fetchone()
+            rows = conn.execute(
+                "SELECT d.id, d.path, d.title, d.lang, d.kind, hit.rank AS score FROM "
+                "(SELECT rowid, rank FROM docs_fts WHERE docs_fts MATCH ? AND rowid >= ? ORDER BY rank LIMIT ?) AS hit "
+                "JOIN docs d ON d.id = hit.rowid ORDER BY hit.rank",
+                (fts_q, floor[0] if floor else 0, limit)).fetchall()
+        except sqlite3.OperationalError:
+            return []  # 記号だけの検索語など
+        terms = q.split()
+        out = []
+        for r in rows:
+            body = conn.execute("SELECT body FROM docs WHERE id = ?", (r["id"],)).fetchone()["body"]
+            out.append({"path": r["path"], "title": r["title"], "lang": r["lang"], "kind": r["kind"],
+                        "score": r["score"], "snippet": make_snippet(body, terms)})
+        return out
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT count(*) FROM docs").fetchone()[0]
+
+
+_index: Optional[SearchIndex] = None
+_lock = threading.Lock()
+
+
+def get_search_index() -> SearchIndex:
+    global _index
+    with _lock:
+        if _index is None:
+            _index = SearchIndex()
+        return _index
+
+
+# ---------- benchmark ----------
+def _synthetic_vocab(rnd: random.Random, n: int, ja: bool) -> List[str]:
+    if ja:
+        kanji = [chr(c) for c in rnd.sample(range(0x4E00, 0x9FA0), 600)]
+        kana = [chr(c) for c in range(0x3041, 0x3094)]
+        return ["".join(rnd.choices(kanji, k=rnd.randint(2, 4))) + rnd.choice(kana) for _ in range(n)]
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rnd.choices(letters, k=rnd.randint(3, 10))) for _ in range(n)]
+
+
+def bench(n_docs: int, queries: int = 100, vocab: int = 5000) -> None:
+    """
+    合成文書（英語 / 日本語が半々、語の出現頻度は Zipf 分布）を n_docs 件入れ、検索の所要時間を計測
+    検索語も同じ分布から 2 語ずつ選ぶ
+    """
+    rnd = random.Random(0)
+    words = {False: _synthetic_vocab(rnd, vocab, False), True: _synthetic_vocab(rnd, vocab, True)}
+    weights = [1 / (r + 1) for r in range(vocab)]
+    with tempfile.TemporaryDirectory() as td:
+        root = pathlib.Path(td)
+        idx = SearchIndex(root / "bench.sqlite")
+        t0 = time.perf_counter()
+        for i in range(n_docs):
+            ja = bool(i % 2)
+            body = ("" if ja else " ").join(rnd.choices(words[ja], weights=weights, k=400))
+            text = "# " + " ".join(rnd.choices(words[ja], weights=weights, k=4)) + "\n\n" + body
+            p = root / f"doc{i}{'.ja' if ja else ''}.md"
+            p.write_text(text, encoding="utf-8")
+            idx.index_file(p, text=text, kind="bench")
+        print(f"indexed {n_docs} docs in {time.perf_counter() - t0:.1f}s")
+        ts = []
+        for _ in range(queries):
+            q = " ".join(rnd.choices(words[rnd.random() < 0.5], weights=weights, k=2))
+            t = time.perf_counter()
+            idx.search(q)
+            ts.append((time.perf_counter() - t) * 1000)
+        ts.sort()
+        print(f"query: p50={ts[len(ts) // 2]:.1f}ms p95={ts[int(len(ts) * 0.95)]:.1f}ms max={ts[-1]:.1f}ms")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--db", help="DB ファイル（既定: KAGGLE_SEARCH_DB または out/search.sqlite）")
+    ap.add_argument("--sync", help="このディレクトリ以下の .md を索引に反映")
+    ap.add_argument("--query", help="検索語（空白区切りで AND）")
+    ap.add_argument("--lang", choices=["en", "ja"])
+    ap.add_argument("--limit", type=int, default=20)
+    ap.add_argument("--bench", type=int, help="合成文書の件数を指定して検索時間を計測")
+    args = ap.parse_args()
+
+    if args.bench:
+        bench(args.bench)
+        sys.exit(0)
+    idx = SearchIndex(args.db)
+    if args.sync:
+        print(idx.sync(args.sync), f"({idx.count()} docs)")
+    if args.query:
+        t0 = time.perf_counter()
+        hits = idx.search(args.query, limit=args.limit, lang=args.lang)
+        for h in hits:
+            print(f"{h['score']:7.2f}  {h['lang']}  {h['title']}  ({h['path']})")
+            print("         " + re.sub(r"</?mark>", "*", html.unescape(h["snippet"])))
+        print(f"{len(hits)} hit(s) in {(time.perf_counter() - t0) * 1000:.1f}ms")
+    if not (args.sync or args.query):
+        ap.print_help()
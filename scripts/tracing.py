@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+軽量スパン計測（Chrome trace / Perfetto 形式の JSON を 1 実行につき 1 ファイル出力）
+- 計測したい区間を `with span("driver.get", url=url):` で囲むだけ。無効時は何もしない
+- 環境変数 KAGGLE_TRACE_DIR があるときだけ有効。子プロセスは環境変数を引き継ぎ、
+  同じ実行 ID（KAGGLE_TRACE_RUN）の断片を書き、最初のプロセスが終了時に 1 ファイルへまとめる
+- 時刻はプロセス間で揃うよう壁時計（µs）を使い、所要時間は perf_counter で測る
+- レーン（tid）はスレッドごと。asyncio のタスク内の span はタスクごとのレーンに置く
+  （cdp_tabs のタブは 1 スレッドで並行に動くので、スレッドで分けると重なった区間が入れ子に見える）
+- app.py のように常駐するプロセスからは TraceRun（trace_run()）で 1 操作 = 1 実行として記録する
+出力: <KAGGLE_TRACE_DIR>/<run_id>.json（chrome://tracing や https://ui.perfetto.dev で開ける）
+Usage:
+  KAGGLE_TRACE_DIR=out/traces python3 save_kaggle_comp_markdown.py --url ...
+  python3 tracing.py --list out/traces
+  python3 tracing.py --summary out/traces/<run_id>.json
+"""
+
+import os, sys, json, time, asyncio, atexit, argparse, pathlib, threading, subprocess
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+TRACE_DIR_ENV = "KAGGLE_TRACE_DIR"
+TRACE_RUN_ENV = "KAGGLE_TRACE_RUN"
+KEEP_RUNS = 50  # これより古い実行のトレースは消す
+PARTS_DIR = ".parts"
+
+
+def _now_us() -> int:
+    return time.time_ns() // 1000
+
+
+def new_run_id(label: str = "") -> str:
+    safe = "".join(c if c.isalnum() or c in "-_." else "-" for c in label)[:40]
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{time.perf_counter_ns() % 10**6:06d}" + (f"-{safe}" if safe else "")
+
+
+def _current_task() -> Optional["asyncio.Task"]:
+    try:
+        return asyncio.current_task()
+    except RuntimeError:  # イベントループの外
+        return None
+
+
+class Tracer:
+    """イベントをメモリに溜め、drain() で取り出して JSON に書き出す"""
+
+    def __init__(self, process_name: str):
+        self.pid = os.getpid()
+        self.process_name = process_name
+        self.start_us = _now_us()
+        self._events: List[Dict] = []
+        self._threads: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def _tid(self) -> int:
+        t = threading.current_thread()
+        task = _current_task()
+        if task is not None:
+            tid, name = id(task), f"{t.name} / {task.get_name()}"
+        else:
+            tid, name = t.ident, t.name
+        if tid not in self._threads:
+            self._threads[tid] = name
+        return tid
+
+    def add(self, name: str, start_us: int, dur_us: int, cat: str = "", **args) -> None:
+        ev = {"name": name, "cat": cat or "span", "ph": "X", "ts": start_us, "dur": max(0, dur_us),
+              "pid": self.pid, "tid": self._tid()}
+        if args:
+            ev["args"] = {k: (v if isinstance(v, (int, float, bool)) or v is None else str(v)) for k, v in args.items()}
+        with self._lock:
+            self._events.append(ev)
+
+    @contextmanager
+    def span(self, name: str, cat: str = "", **args) -> Iterator[Dict]:
+        """区間を計測する。yield した dict に入れた値は終了時に args に加わる"""
+        extra: Dict = {}
+        ts = _now_us()
+        t0 = time.perf_counter_ns()
+        try:
+            yield extra
+        except BaseException as e:
+            extra["error"] = e.__class__.__name__
+            raise
+        finally:
+            self.add(name, ts, (time.perf_counter_ns() - t0) // 1000, cat, **args, **extra)
+
+    def drain(self) -> List[Dict]:
+        """溜まったイベント（プロセス名・スレッド名・プロセス全体のスパン付き）を取り出す"""
+        with self._lock:
+            events, self._events = self._events, []
+        meta = [{"name": "process_name", "ph": "M", "pid": self.pid, "tid": 0, "args": {"name": self.process_name}}]
+        meta += [{"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": name}}
+                 for tid, name in self._threads.items()]
+        whole = {"name": self.process_name, "cat": "process", "ph": "X", "ts": self.start_us,
+                 "dur": _now_us() - self.start_us, "pid": self.pid, "tid": threading.main_thread().ident}
+        return meta + [whole] + events
+
+
+def _write_part(trace_dir: pathlib.Path, run_id: str, tracer: Tracer) -> None:
+    parts = trace_dir / PARTS_DIR / run_id
+    parts.mkdir(parents=True, exist_ok=True)
+    tmp = parts / f"{tracer.pid}.json.tmp"
+    tmp.write_text(json.dumps(tracer.drain(), ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, parts / f"{tracer.pid}.json")
+
+
+def merge_run(trace_dir, run_id: str, label: str = "") -> Optional[pathlib.Path]:
+    """断片をまとめて <trace_dir>/<run_id>.json を書き、断片を消す"""
+    trace_dir = pathlib.Path(trace_dir)
+    parts = trace_dir / PARTS_DIR / run_id
+    events: List[Dict] = []
+    for p in sorted(parts.glob("*.json")):
+        try:
+            events += json.loads(p.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue
+    if not events:
+        return None
+    out = trace_dir / f"{run_id}.json"
+    doc = {"traceEvents": events, "displayTimeUnit": "ms", "metadata": {"run_id": run_id, "label": label}}
+    tmp = out.with_suffix(".tmp")
+    tmp.write_text(json.dumps(doc, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, out)
+    for p in parts.glob("*.json"):
+        p.unlink(missing_ok=True)
+    try:
+        parts.rmdir()
+    except OSError:
+        pass
+    prune(trace_dir)
+    return out
+
+
+def prune(trace_dir, keep: int = KEEP_RUNS) -> None:
+    for p in list_runs(trace_dir)[keep:]:
+        p.unlink(missing_ok=True)
+
+
+# ---------------- プロセス単位（スクリプト） ----------------
+_dir = os.getenv(TRACE_DIR_ENV)
+_tracer: Optional[Tracer] = None
+_run_id: Optional[str] = None
+_root = False
+_active = threading.local()  # trace_run() 中のスレッドでは、そのスレッドの span をその実行に記録する
+
+if _dir:
+    _tracer = Tracer(pathlib.Path(sys.argv[0] or "python").name)
+    _run_id = os.getenv(TRACE_RUN_ENV)
+    if not _run_id:
+        # 最初のプロセス: 実行 ID を決め、子プロセスへ引き継ぐ
+        _root = True
+        _run_id = new_run_id(_tracer.process_name)
+        os.environ[TRACE_RUN_ENV] = _run_id
+
+    @atexit.register
+    def _flush_at_exit() -> None:
+        try:
+            _write_part(pathlib.Path(_dir), _run_id, _tracer)
+            if _root:
+                out = merge_run(_dir, _run_id, label=" ".join(sys.argv))
+                if out:
+                    print(f"[trace] {out}", file=sys.stderr)
+        except OSError as e:
+            print(f"[trace] failed to write trace: {e!r}", file=sys.stderr)
+
+
+def enabled() -> bool:
+    return _tracer is not None or getattr(_active, "tracer", None) is not None
+
+
+@contextmanager
+def span(name: str, cat: str = "", **args) -> Iterator[Dict]:
+    """KAGGLE_TRACE_DIR も trace_run() も無ければ何もしない（計測コストはほぼゼロ）"""
+    tracer = getattr(_active, "tracer", None) or _tracer
+    if tracer is None:
+        yield {}
+        return
+    with tracer.span(name, cat, **args) as extra:
+        yield extra
+
+
+# ---------------- 常駐プロセス（app.py）から 1 操作ぶんを記録 ----------------
+class TraceRun:
+    """1 回の操作（ボタン押下など）。子プロセスには env で実行 ID を渡す"""
+
+    def __init__(self, label: str, trace_dir):
+        self.label = label
+        self.trace_dir = pathlib.Path(trace_dir)
+        self.run_id = new_run_id(label)
+        self.tracer = Tracer(label)
+        self.env = dict(os.environ, **{TRACE_DIR_ENV: str(self.trace_dir), TRACE_RUN_ENV: self.run_id})
+        self.path: Optional[pathlib.Path] = None
+
+    def span(self, name: str, cat: str = "", **args):
+        return self.tracer.span(name, cat, **args)
+
+    def run(self, cmd: List[str], **kwargs) -> subprocess.CompletedProcess:
+        """subprocess.run と同じ。子プロセスのトレースもこの実行にまとまる"""
+        kwargs.setdefault("env", self.env)
+        with self.span(pathlib.Path(cmd[1]).name if len(cmd) > 1 else cmd[0], "subprocess"):
+            return subprocess.run(cmd, **kwargs)
+
+    def finish(self) -> Optional[pathlib.Path]:
+        _write_part(self.trace_dir, self.run_id, self.tracer)
+        self.path = merge_run(self.trace_dir, self.run_id, label=self.label)
+        return self.path
+
+
+@contextmanager
+def trace_run(label: str, trace_dir) -> Iterator[TraceRun]:
+    """with の中では、このスレッドの span()（scripts の関数を直接呼んだ分）もこの実行に記録する"""
+    run = TraceRun(label, trace_dir)
+    prev = getattr(_active, "tracer", None)
+    _active.tracer = run.tracer
+    try:
+        yield run
+    finally:
+        _active.tracer = prev
+        try:
+            run.finish()
+        except OSError as e:
+            print(f"[trace] failed to write trace: {e!r}", file=sys.stderr)
+
+
+# ---------------- 読み出し ----------------
+def list_runs(trace_dir) -> List[pathlib.Path]:
+    """新しい順"""
+    d = pathlib.Path(trace_dir)
+    if not d.is_dir():
+        return []
+    return sorted(d.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+
+
+def load_run(path) -> Dict:
+    return json.loads(pathlib.Path(path).read_text(encoding="utf-8"))
+
+
+def summarize(doc: Dict) -> Dict:
+    """
+    スパン名ごとの回数・合計・最大（ms）と、実行全体の所要時間を返す
+    入れ子の区間はそれぞれ数えるので、合計は全体時間を超えることがある
+    """
+    spans = [e for e in doc.get("traceEvents", []) if e.get("ph") == "X"]
+    if not spans:
+        return {"wall_ms": 0.0, "rows": []}
+    t0 = min(e["ts"] for e in spans)
+    t1 = max(e["ts"] + e["dur"] for e in spans)
+    agg: Dict[tuple, Dict] = {}
+    for e in spans:
+        key = (e["name"], e.get("cat", ""))
+        a = agg.setdefault(key, {"name": key[0], "cat": key[1], "count": 0, "total_ms": 0.0, "max_ms": 0.0})
+        ms = e["dur"] / 1000
+        a["count"] += 1
+        a["total_ms"] += ms
+        a["max_ms"] = max(a["max_ms"], ms)
+    rows = sorted(agg.values(), key=lambda a: a["total_ms"], reverse=True)
+    for r in rows:
+        r["total_ms"] = round(r["total_ms"], 1)
+        r["max_ms"] = round(r["max_ms"], 1)
+    return {"wall_ms": round((t1 - t0) / 1000, 1), "rows": rows}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Inspect span traces written with KAGGLE_TRACE_DIR")
+    ap.add_argument("--list", metavar="DIR", help="List recorded runs (newest first)")
+    ap.add_argument("--summary", metavar="TRACE_JSON", help="Per-span totals for one run")
+    ap.add_argument("--top", type=int, default=20)
+    args = ap.parse_args()
+
+    if args.list:
+        for p in list_runs(args.list):
+            s = summarize(load_run(p))
+            print(f"{p.name}\t{s['wall_ms'] / 1000:.1f}s")
+    elif args.summary:
+        s = summarize(load_run(args.summary))
+        print(f"wall: {s['wall_ms'] / 1000:.2f}s")
+        print(f"{'span':<40} {'cat':<10} {'n':>5} {'total ms':>10} {'max ms':>9}")
+        for r in s["rows"][: args.top]:
+            print(f"{r['name'][:40]:<40} {r['cat'][:10]:<10} {r['count']:>5} {r['total_ms']:>10.1f} {r['max_ms']:>9.1f}")
+    else:
+        ap.print_help()
+
+
+if __name__ == "__main__":
+    main()
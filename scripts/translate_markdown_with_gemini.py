@@ -11,16 +11,37 @@ Usage:
   python3 translate_markdown_with_gemini.py --in out --glob "*.md" --model gemini-1.5-flash
 Outputs:
   <name>.ja.md next to each source file
+  Translations are recorded in the artifact index (artifact_index.py); files whose source has not
+  changed since the last translation are skipped unless --force is given
+  Discussion threads saved with <name>.posts.jsonl are translated post by post; <name>.ja.posts.json
+  caches each post's translation, so only new or edited posts are sent
+Model routing (opt-in: --model auto or GEMINI_MODEL=auto; the default is gemini-1.5-flash):
+  Each chunk is classified by size, structure and math/code density and sent to the fast, standard
+  or strong model (ROUTES). If the output fails structural checks (code blocks, headings, tables,
+  links, math, segment markers) or the request fails (model unavailable, quota, blocked response),
+  the chunk is retried on the next stronger model. Per-route latency, tokens, cost, escalation rate
+  and errors are printed at the end. Use --show-routes to see the routing
+  without calling the API. Strong chunks go to gemini-1.5-pro, so routing can cost more than the
+  fixed default.
 """
 
-import os, sys, argparse, glob, re, time, pathlib, random, hashlib
-from typing import List
+import os, sys, json, argparse, glob, re, time, pathlib, random, hashlib, threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
 
 import google.generativeai as genai
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 
+import blob_store
+from artifact_index import get_index, text_hash
+from fileio import write_text_atomic
+from tracing import span
+
 # ---------------- Configurable defaults ----------------
-DEFAULT_MODEL = "gemini-1.5-flash"   # 品質優先なら "gemini-1.5-pro"
+# 品質優先なら "gemini-1.5-pro"。"auto"（チャンクごとに ROUTES へ振り分け、strong は gemini-1.5-pro）は
+# 費用が変わるので --model auto か GEMINI_MODEL=auto を指定したときだけ使う
+DEFAULT_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+ROUTER_MODEL = "auto"
 # 1 リクエスト最大トークン（入力+出力）。安全側にやや小さめを選ぶ:
 MAX_TOKENS_PER_REQ = 40_000
 # 出力に使うトークン余白（日本語化で膨らむことがあるため）
@@ -31,6 +52,7 @@ PROMPT_BUFFER_TOKENS = 500
 SLEEP_BETWEEN_CHUNKS_SEC = (0.9, 1.6)  # min,max の範囲からランダム
 
 JOIN_SEP = "\n\n"                    # チャンク結合時の区切り
+POSTS_CACHE_SUFFIX = ".ja.posts.json"  # Discussion の投稿ハッシュ → 訳文
 
 PROMPT_PREFIX = """You are a professional technical translator.
 Translate the following Markdown from English to Japanese.
@@ -56,17 +78,21 @@ def apply_glossary_jp(text: str) -> str:
 
 # ---------------- Gemini client ----------------
 def configure_client(model_name: str):
+    """model_name が "auto" なら ModelRouter（チャンクごとにモデルを選ぶ）を返す"""
     api_key = os.getenv("GOOGLE_API_KEY")
     if not api_key:
         print("ERROR: set GOOGLE_API_KEY env var", file=sys.stderr)
         sys.exit(1)
     genai.configure(api_key=api_key)
+    if model_name == ROUTER_MODEL:
+        return ModelRouter()
     return genai.GenerativeModel(model_name)
 
 # 安全にトークン数を数える
 def count_tokens(model, text: str) -> int:
     try:
-        return model.count_tokens(text).total_tokens
+        with span("count_tokens", "gemini", chars=len(text)):
+            return model.count_tokens(text).total_tokens
     except Exception:
         # 万一失敗したら概算（かなり保守的）にフォールバック
         # 英文: 1 token ≈ 4 chars 目安 → 日本語増大も考慮して 1 token ≈ 3 chars とする
@@ -144,10 +170,12 @@ class RateLimitError(Exception):
     wait=wait_exponential(multiplier=1, min=2, max=20),
     retry=retry_if_exception_type((RateLimitError, OSError))
 )
-def translate_chunk(model, text: str) -> str:
-    prompt = PROMPT_PREFIX + "\n\n" + text
+def generate(model, text: str, prefix: str = PROMPT_PREFIX, usage: Optional[Dict] = None) -> str:
+    """1 モデルへの 1 リクエスト。usage を渡すと入出力トークン数を入れて返す"""
+    prompt = prefix + "\n\n" + text
     try:
-        resp = model.generate_content(prompt)
+        with span("gemini.generate", "gemini", chars=len(prompt), model=getattr(model, "model_name", None)):
+            resp = model.generate_content(prompt)
     except Exception as e:
         msg = str(e).lower()
         # 429 / quota / temporarily / rate limit の気配があればリトライ
@@ -155,8 +183,262 @@ def translate_chunk(model, text: str) -> str:
             raise RateLimitError(e)
         raise
     out = (resp.text or "").strip()
+    if usage is not None:
+        meta = getattr(resp, "usage_metadata", None)
+        usage["input_tokens"] = getattr(meta, "prompt_token_count", 0) or len(prompt) // 3
+        usage["output_tokens"] = getattr(meta, "candidates_token_count", 0) or len(out) // 3
     return out
 
+
+def translate_chunk(model, text: str, prefix: str = PROMPT_PREFIX) -> str:
+    """model が ModelRouter ならチャンクに合うモデルで訳し、構造チェックに落ちたら上位のモデルで訳し直す"""
+    if isinstance(model, ModelRouter):
+        return model.translate(text, prefix)
+    return generate(model, text, prefix)
+
+
+# ---------------- Model routing ----------------
+# 安い順。price は USD / 1M tokens（入力, 出力）の概算。料金やモデルが変わったらここを直す
+ROUTES: Dict[str, Dict] = {
+    "fast":     {"model": os.getenv("GEMINI_MODEL_FAST", "gemini-1.5-flash-8b"), "price": (0.0375, 0.15)},
+    "standard": {"model": os.getenv("GEMINI_MODEL_STANDARD", "gemini-1.5-flash"), "price": (0.075, 0.30)},
+    "strong":   {"model": os.getenv("GEMINI_MODEL_STRONG", "gemini-1.5-pro"), "price": (1.25, 5.00)},
+}
+ROUTE_ORDER = list(ROUTES)
+
+EASY_MAX_CHARS = 1_500      # これ以下で数式・表・コードがほぼ無ければ fast
+HARD_MIN_MATH = 4           # 数式がこれ以上（または表と数式が同居）なら strong
+HARD_CODE_DENSITY = 12.0    # 1000 文字あたりのインラインコード数がこれ以上なら strong
+
+_FENCE_RE = re.compile(r"^(```|~~~).*?^\1[ \t]*$", re.M | re.S)
+_MATH_RE = re.compile(r"\$\$.+?\$\$|\$[^$\n]+\$|\\begin\{|\\(?:frac|sum|prod|sqrt|log|exp|mathrm|mathbb|left|right"
+                      r"|cdot|hat|bar|int|partial|alpha|beta|sigma|theta|lambda)\b", re.S)
+_INLINE_CODE_RE = re.compile(r"`[^`\n]+`")
+_LINK_TARGET_RE = re.compile(r"\]\(([^)\s]+)")
+_HEADING_RE = re.compile(r"^(#{1,6})\s", re.M)
+_TABLE_ROW_RE = re.compile(r"^\s*\|.*\|\s*$", re.M)
+_JA_RE = re.compile(r"[\u3040-\u30ff\u4e00-\u9fff]")
+_MARKER_RE = re.compile(r"^<<<SEG (\d+)>>>", re.M)  # "(code comment)" 付きも数える
+
+
+def chunk_features(text: str) -> Dict:
+    fences = _FENCE_RE.findall(text)
+    code_chars = sum(len(m.group(0)) for m in _FENCE_RE.finditer(text))
+    prose = _FENCE_RE.sub("", text)
+    chars = max(1, len(text))
+    return {
+        "chars": len(text),
+        "fences": len(fences),
+        "code_ratio": code_chars / chars,
+        "math": len(_MATH_RE.findall(prose)),
+        "inline_code": len(_INLINE_CODE_RE.findall(prose)),
+        "table_rows": len(_TABLE_ROW_RE.findall(prose)),
+        "headings": len(_HEADING_RE.findall(prose)),
+        "links": len(_LINK_TARGET_RE.findall(prose)),
+    }
+
+
+def classify_chunk(text: str) -> str:
+    """チャンクの難しさ → ROUTES のキー（fast / standard / strong）"""
+    f = chunk_features(text)
+    code_density = f["inline_code"] * 1000 / max(1, f["chars"])
+    if f["math"] >= HARD_MIN_MATH or (f["math"] and f["table_rows"]) or code_density >= HARD_CODE_DENSITY:
+        return "strong"
+    if (f["chars"] <= EASY_MAX_CHARS and not f["math"] and not f["table_rows"]
+            and f["code_ratio"] < 0.3 and f["inline_code"] <= 3):
+        return "fast"
+    return "standard"
+
+
+def _structure(text: str) -> Dict:
+    prose = _FENCE_RE.sub("", text)
+    return {
+        "code blocks": [m.group(0).strip() for m in _FENCE_RE.finditer(text)],
+        "headings": [len(h) for h in _HEADING_RE.findall(prose)],
+        "table rows": len(_TABLE_ROW_RE.findall(prose)),
+        "link targets": Counter(_LINK_TARGET_RE.findall(prose)),
+        "math": len(_MATH_RE.findall(prose)),
+        "segment markers": _MARKER_RE.findall(text),
+    }
+
+
+def check_structure(src: str, out: str) -> List[str]:
+    """訳文が原文の構造を保っているか。崩れていた項目名のリスト（空なら OK）"""
+    if not out.strip():
+        return ["empty output"]
+    a, b = _structure(src), _structure(out)
+    problems = [k for k in a if a[k] != b[k]]
+    missing = [c for c in _INLINE_CODE_RE.findall(_FENCE_RE.sub("", src)) if c not in out]
+    if missing:
+        problems.append("inline code")
+    prose = re.sub(r"`[^`\n]*`|\]\([^)]*\)|https?://\S+", "", _FENCE_RE.sub("", src))
+    if len(re.findall(r"[A-Za-z]{3,}", prose)) >= 8 and not _JA_RE.search(out):
+        problems.append("not translated")
+    if len(out) < len(src) * 0.15:  # 日本語は英語より文字数が少ないので緩めに
+        problems.append("truncated")
+    return problems
+
+
+class ModelRouter:
+    """
+    チャンクを classify_chunk() で振り分けて訳すモデルの代わり（translate_chunk / count_tokens に渡せる）
+    構造チェックに落ちた訳や API エラーになったチャンクは ROUTE_ORDER の次のモデルで訳し直す。
+    最上位の結果は問題があっても採用する（最上位の API エラーはそのまま上げる）
+    """
+
+    model_name = ROUTER_MODEL
+
+    def __init__(self, routes: Optional[Dict[str, Dict]] = None):
+        self.routes = routes or ROUTES
+        self.order = [r for r in ROUTE_ORDER if r in self.routes]
+        self._models: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Counter] = {r: Counter() for r in self.order}
+
+    def model(self, route: str):
+        with self._lock:
+            if route not in self._models:
+                self._models[route] = genai.GenerativeModel(self.routes[route]["model"])
+            return self._models[route]
+
+    def count_tokens(self, text: str):
+        return self.model("standard" if "standard" in self.routes else self.order[0]).count_tokens(text)
+
+    def translate(self, text: str, prefix: str = PROMPT_PREFIX) -> str:
+        first = classify_chunk(text)
+        chain = self.order[self.order.index(first):] if first in self.order else self.order
+        self._add(chain[0], routed=1)
+        for i, route in enumerate(chain):
+            usage: Dict = {}
+            t0 = time.perf_counter()
+            try:
+                with span("route", "translate", route=route) as sp:
+                    out = generate(self.model(route), text, prefix, usage)
+                    problems = check_structure(text, out)
+                    sp["problems"] = ",".join(problems)
+            except Exception as e:
+                # モデルが使えない / 枠切れ / 応答がブロックされた等。最上位で失敗したときだけ上げる
+                self._add(route, calls=1, errors=1, ms=int((time.perf_counter() - t0) * 1000))
+                if i == len(chain) - 1:
+                    raise
+                self._add(route, escalated=1)
+                print(f"    [{route}] request failed ({e!r}); escalating to {chain[i + 1]}")
+                continue
+            self._add(route, calls=1, ms=int((time.perf_counter() - t0) * 1000), **usage)
+            if not problems:
+                return out
+            if i == len(chain) - 1:
+                self._add(route, accepted_with_issues=1)
+                print(f"    [{route}] structure check failed ({', '.join(problems)}); keeping the output")
+                return out
+            self._add(route, escalated=1)
+            print(f"    [{route}] structure check failed ({', '.join(problems)}); escalating to {chain[i + 1]}")
+        return out
+
+    def _add(self, route: str, **counts) -> None:
+        with self._lock:
+            self.stats[route].update(counts)
+
+    def report(self) -> List[Dict]:
+        """ルートごとの件数・平均レイテンシ・トークン・費用（USD 概算）・エスカレーション率"""
+        rows = []
+        with self._lock:
+            for r in self.order:
+                st, (pin, pout) = self.stats[r], self.routes[r]["price"]
+                calls = st["calls"]
+                rows.append({
+                    "route": r, "model": self.routes[r]["model"], "routed": st["routed"], "calls": calls,
+                    "avg_s": st["ms"] / 1000 / calls if calls else 0.0,
+                    "input_tokens": st["input_tokens"], "output_tokens": st["output_tokens"],
+                    "cost_usd": (st["input_tokens"] * pin + st["output_tokens"] * pout) / 1e6,
+                    "escalation_rate": st["escalated"] / calls if calls else 0.0,
+                    "errors": st["errors"],
+                    "accepted_with_issues": st["accepted_with_issues"],
+                })
+        return rows
+
+
+def print_route_report(model) -> None:
+    """ModelRouter なら振り分け結果の表を出す（単一モデルなら何もしない）"""
+    if not isinstance(model, ModelRouter):
+        return
+    rows = model.report()
+    if not any(r["calls"] for r in rows):
+        return
+    print(f"{'route':9s} {'model':22s} {'routed':>6s} {'calls':>5s} {'avg s':>6s} {'in tok':>8s} "
+          f"{'out tok':>8s} {'cost $':>8s} {'escalated':>9s} {'errors':>6s}")
+    for r in rows:
+        print(f"{r['route']:9s} {r['model'][:22]:22s} {r['routed']:6d} {r['calls']:5d} {r['avg_s']:6.2f} "
+              f"{r['input_tokens']:8d} {r['output_tokens']:8d} {r['cost_usd']:8.4f} {r['escalation_rate']:9.0%} "
+              f"{r['errors']:6d}")
+    print(f"total cost ≈ ${sum(r['cost_usd'] for r in rows):.4f} "
+          f"({sum(r['routed'] for r in rows)} chunk(s), {sum(r['calls'] for r in rows)} call(s))")
+
+# ---------------- Batched segments (notebook cells / discussion posts) ----------------
+# 1 リクエストにまとめるセグメントの上限（文字数）。入力と訳文で上限を分け合うので半分、1 token ≈ 3 chars で概算
+BATCH_MAX_CHARS = (MAX_TOKENS_PER_REQ - OUTPUT_BUFFER_TOKENS - PROMPT_BUFFER_TOKENS) * 3 // 2
+SEG_MARKER = "<<<SEG {}>>>"
+_SEG_RE = re.compile(r"^<<<SEG (\d+)>>>[ \t]*$", re.M)
+
+BATCH_PROMPT = PROMPT_PREFIX + """
+The input is split into segments by marker lines of the form <<<SEG n>>>.
+- Keep every marker line exactly as is, in the same order, each on its own line.
+- Translate only the text between markers; never merge or drop segments.
+- Segments marked as code comments are single lines: keep them on one line.
+"""
+
+
+def batch_segments(items: List[Tuple[str, str, str]], by_route: bool = False) -> List[List[Tuple[str, str, str]]]:
+    """by_route なら同じルートに振り分けられるセグメント同士でまとめる（易しい投稿を難しい投稿の巻き添えにしない）"""
+    if by_route:
+        groups: Dict[str, List] = {}
+        for it in items:
+            groups.setdefault(classify_chunk(it[2]), []).append(it)
+        return [b for r in ROUTE_ORDER for b in batch_segments(groups.get(r, []))]
+    out, buf, size = [], [], 0
+    for it in items:
+        n = len(it[2]) + 20
+        if buf and size + n > BATCH_MAX_CHARS:
+            out.append(buf)
+            buf, size = [], 0
+        buf.append(it)
+        size += n
+    if buf:
+        out.append(buf)
+    return out
+
+
+def translate_batch(model, batch: List[Tuple[str, str, str]]) -> Dict[str, str]:
+    """[(key, kind, text)] をまとめて 1 リクエストで訳す。マーカーが崩れたら 1 件ずつ訳し直す"""
+    if len(batch) == 1:
+        key, _, text = batch[0]
+        return {key: translate_chunk(model, text)}
+    body = "\n".join(
+        SEG_MARKER.format(i) + ("  (code comment)" if kind == "comment" else "") + "\n" + text.strip()
+        for i, (_, kind, text) in enumerate(batch)
+    )
+    # "(code comment)" 付きのマーカーも数字で照合できるよう正規化してから分割
+    out = translate_chunk(model, body, prefix=BATCH_PROMPT)
+    out = re.sub(r"^(<<<SEG \d+>>>).*$", r"\1", out, flags=re.M)
+    parts = _SEG_RE.split(out)
+    got = {int(parts[i]): parts[i + 1].strip() for i in range(1, len(parts) - 1, 2)}
+    if sorted(got) != list(range(len(batch))):
+        print(f"    marker mismatch ({len(got)}/{len(batch)} segments); retrying one by one")
+        return {key: translate_chunk(model, text) for key, _, text in batch}
+    return {batch[i][0]: got[i] for i in range(len(batch))}
+
+
+def load_cache(path: pathlib.Path) -> Dict[str, str]:
+    try:
+        return json.loads(blob_store.read_text(path))
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(path: pathlib.Path, cache: Dict[str, str]) -> None:
+    write_text_atomic(path, json.dumps(cache, ensure_ascii=False, indent=1))
+
+
 # ---------------- File-level translate ----------------
 def file_sha256(path: pathlib.Path) -> str:
     h = hashlib.sha256()
@@ -165,44 +447,130 @@ def file_sha256(path: pathlib.Path) -> str:
             h.update(chunk)
     return h.hexdigest()
 
-def translate_file(model, src_path: pathlib.Path, out_suffix: str = ".ja.md"):
-    src = src_path.read_text(encoding="utf-8")
-    chunks = split_markdown_token_aware(model, src)
+def translate_file(model, src_path: pathlib.Path, out_suffix: str = ".ja.md", reuse: bool = True):
+    src = blob_store.read_text(src_path)
+    dst = src_path.with_suffix(out_suffix)
+    idx = get_index()
+    model_name = getattr(model, "model_name", None)
+
+    # 同じ内容の原文を既に訳していれば API を呼ばずに流用（コンペ間で共通の rules など）
+    prev = idx.find_translation_by_hash(text_hash(src), model_name) if reuse else None
+    if prev and pathlib.Path(prev["path"]) != dst.resolve():
+        write_text_atomic(dst, blob_store.read_text(prev["path"]))
+        idx.record_translation(src_path, dst, prev["model"])
+        print(f"✅ wrote {dst} (reused {prev['path']})")
+        return
+
+    try:
+        with span("translate_file", "translate", path=src_path.name):
+            if not (out_suffix == ".ja.md" and _translate_posts(model, src_path, src, dst, use_cache=reuse)):
+                _translate_to(model, src, dst)
+    except Exception as e:
+        idx.record_translation(src_path, dst, model_name, status="failed", error=repr(e))
+        raise
+    idx.record_translation(src_path, dst, model_name)
+
+def translate_text(model, src: str) -> str:
+    with span("split_markdown", "translate", chars=len(src)):
+        chunks = split_markdown_token_aware(model, src)
     print(f"Split into {len(chunks)} chunk(s).")
 
     out_parts = []
     for i, ch in enumerate(chunks, 1):
         print(f"  - translating chunk {i}/{len(chunks)} (~{count_tokens(model, ch)} tokens input)")
         out_parts.append(translate_chunk(model, ch))
-        time.sleep(random.uniform(*SLEEP_BETWEEN_CHUNKS_SEC))  # レート緩和
+        with span("rate-limit sleep", "translate"):
+            time.sleep(random.uniform(*SLEEP_BETWEEN_CHUNKS_SEC))  # レート緩和
 
     out_text = JOIN_SEP.join(out_parts)
-    out_text = apply_glossary_jp(out_text)
+    return apply_glossary_jp(out_text)
 
-    dst = src_path.with_suffix(out_suffix)
-    dst.write_text(out_text, encoding="utf-8")
+def _translate_to(model, src: str, dst: pathlib.Path):
+    write_text_atomic(dst, translate_text(model, src))
+    print(f"✅ wrote {dst}")
+
+def _translate_posts(model, src_path: pathlib.Path, src: str, dst: pathlib.Path, use_cache: bool = True) -> bool:
+    """
+    Discussion スレッドを投稿単位で訳し、キャッシュ済みの訳文と合わせて .ja.md を組み立てる。
+    投稿記録（.posts.jsonl）が無い / 1 投稿だけ / .md と食い違う場合は False（ファイル全体を訳す）
+    """
+    from discussion_posts import assemble_thread_md, load_posts, posts_path, sha
+    posts = load_posts(posts_path(src_path))
+    if len(posts) < 2 or assemble_thread_md(posts) != src.strip():
+        return False
+    cache_path = src_path.with_name(src_path.name.rsplit(".", 1)[0] + POSTS_CACHE_SUFFIX)
+    cache = load_cache(cache_path) if use_cache else {}
+    keys = {p["id"]: sha(p["md"]) for p in posts if p.get("md", "").strip()}
+    todo = {k: p["md"] for p in posts for k in [keys.get(p["id"])] if k and k not in cache}
+    print(f"{len(posts)} post(s), {len(keys) - len(todo)} cached, {len(todo)} to translate")
+
+    # 長い投稿は単独でトークン数を見て分割、残りはマーカー区切りでまとめて送る
+    long = {k: t for k, t in todo.items() if len(t) > BATCH_MAX_CHARS}
+    batches = batch_segments([(k, "markdown", t) for k, t in todo.items() if k not in long],
+                             by_route=isinstance(model, ModelRouter))
+    try:
+        for k, text in long.items():
+            cache[k] = translate_text(model, text)
+        for i, batch in enumerate(batches, 1):
+            print(f"  - translating batch {i}/{len(batches)} ({len(batch)} post(s))")
+            for k, v in translate_batch(model, batch).items():
+                cache[k] = apply_glossary_jp(v)
+            with span("rate-limit sleep", "translate"):
+                time.sleep(random.uniform(*SLEEP_BETWEEN_CHUNKS_SEC))
+    finally:
+        # 途中で失敗しても訳せた分は残す（消えた投稿の訳は捨てる）
+        save_cache(cache_path, {k: v for k, v in cache.items() if k in keys.values()})
+
+    write_text_atomic(dst, assemble_thread_md(posts, {pid: cache[k] for pid, k in keys.items()}))
     print(f"✅ wrote {dst}")
+    return True
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--in", dest="in_dir", required=True, help="Input dir containing .md files")
     ap.add_argument("--glob", default="*.md", help="Glob pattern (default: *.md)")
-    ap.add_argument("--model", default=DEFAULT_MODEL, help="Gemini model name")
+    ap.add_argument("--model", default=DEFAULT_MODEL,
+                    help="Gemini model name (default: gemini-1.5-flash or $GEMINI_MODEL); "
+                         "'auto' routes per chunk and may use gemini-1.5-pro at higher cost")
+    ap.add_argument("--force", action="store_true", help="Translate even if the translation is up to date")
+    ap.add_argument("--show-routes", action="store_true",
+                    help="Print the route chosen for each chunk and exit (no API calls)")
     args = ap.parse_args()
 
-    model = configure_client(args.model)
-    paths = sorted(pathlib.Path(args.in_dir).glob(args.glob))
+    paths = blob_store.glob(args.in_dir, args.glob)
     if not paths:
         print("No files matched. Check --in and --glob.")
         sys.exit(0)
+    if args.show_routes:
+        show_routes(p for p in paths if not p.name.endswith(".ja.md"))
+        return
 
+    model = configure_client(args.model)
+
+    idx = get_index()
     for p in paths:
         # 既に .ja.md のものはスキップ
         if p.suffix == ".md" and not p.name.endswith(".ja.md"):
+            if not args.force and not idx.translation_stale(p):
+                print(f"Up to date: {p}")
+                continue
             print(f"Translating: {p}")
-            translate_file(model, p)
+            translate_file(model, p, reuse=not args.force)
         else:
             print(f"Skip: {p} (already ja or not .md)")
+    print_route_report(model)
+
+def show_routes(paths) -> None:
+    """API を呼ばずに、各ファイルのチャンク分割と振り分け先を表示（閾値の調整用）"""
+    total = Counter()
+    for p in paths:
+        chunks = split_markdown_token_aware(None, blob_store.read_text(p))  # トークン数は概算
+        for i, ch in enumerate(chunks, 1):
+            route, f = classify_chunk(ch), chunk_features(ch)
+            total[route] += 1
+            print(f"{p.name} #{i}: {route:8s} chars={f['chars']} math={f['math']} tables={f['table_rows']} "
+                  f"inline_code={f['inline_code']} code_ratio={f['code_ratio']:.2f}")
+    print("routes: " + ", ".join(f"{r}={total[r]}" for r in ROUTE_ORDER))
 
 if __name__ == "__main__":
     main()
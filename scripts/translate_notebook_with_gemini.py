@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Translate Jupyter notebooks (EN -> JA) cell by cell using Gemini API
+- Sends only markdown cells (and optionally code comments); code and outputs are never sent
+- Batches many cells into one request, separated by marker lines
+- Caches translations by cell hash: after editing one cell, only that cell is re-translated
+Usage:
+  export GOOGLE_API_KEY=xxx
+  python3 translate_notebook_with_gemini.py --in out/kernel --glob "*.ipynb" [--comments] [--include-outputs]
+Outputs:
+  <name>.ja.ipynb and <name>.ja.md next to each source notebook (images shared with <name>_files/)
+  <name>.ja.cells.json  cell-hash -> translation cache
+"""
+
+import sys, io, re, json, argparse, hashlib, pathlib, tokenize
+from typing import Dict, List, Tuple
+
+import nbformat
+
+from translate_markdown_with_gemini import (
+    DEFAULT_MODEL, ModelRouter, apply_glossary_jp, batch_segments, configure_client, load_cache, print_route_report,
+    save_cache, translate_batch,
+)
+import blob_store
+from artifact_index import get_index
+from fileio import write_text_atomic
+from pull_kernel_to_markdown import ipynb_to_markdown
+from tracing import span
+
+CACHE_SUFFIX = ".ja.cells.json"
+
+
+# ---------------- segments ----------------
+def cell_key(kind: str, text: str) -> str:
+    return hashlib.sha256(f"{kind}\0{text}".encode("utf-8")).hexdigest()[:24]
+
+
+def code_comments(source: str) -> List[Tuple[int, int, str]]:
+    """
+    Python のコメントトークンを (行番号, 桁, コメント本体) で返す
+    文字列中の # は拾わない。英字を含まないコメントや IPython のマジック行・壊れたコードは対象外
+    """
+    try:
+        toks = list(tokenize.generate_tokens(io.StringIO(source).readline))
+    except Exception:  # マジック行などで字句解析できないセルは対象外
+        return []
+    out = []
+    for t in toks:
+        if t.type != tokenize.COMMENT:
+            continue
+        body = t.string.lstrip("#").strip()
+        if body and re.search(r"[A-Za-z]{2}", body) and not body.startswith("!"):
+            out.append((t.start[0], t.start[1], body))
+    return out
+
+
+def collect_segments(nb, comments: bool) -> Dict[str, Tuple[str, str]]:
+    """翻訳対象を key -> (kind, text) で集める（同じ内容は 1 つにまとまる）"""
+    segs: Dict[str, Tuple[str, str]] = {}
+    for cell in nb.cells:
+        if cell.cell_type == "markdown" and cell.source.strip():
+            segs[cell_key("markdown", cell.source)] = ("markdown", cell.source)
+        elif comments and cell.cell_type == "code":
+            for _, _, body in code_comments(cell.source):
+                segs[cell_key("comment", body)] = ("comment", body)
+    return segs
+
+
+# ---------------- translate ----------------
+def apply_translations(nb, tr: Dict[str, str], comments: bool):
+    """翻訳済みのノート（コピー）を返す"""
+    ja = nbformat.from_dict(json.loads(json.dumps(nb)))
+    for cell in ja.cells:
+        if cell.cell_type == "markdown" and cell.source.strip():
+            cell.source = tr.get(cell_key("markdown", cell.source), cell.source)
+        elif comments and cell.cell_type == "code":
+            lines = cell.source.splitlines(keepends=True)
+            # 後ろから置き換えて桁位置がずれないようにする
+            for row, col, body in reversed(code_comments(cell.source)):
+                ja_body = tr.get(cell_key("comment", body))
+                if not ja_body:
+                    continue
+                line = lines[row - 1]
+                nl = "\n" if line.endswith("\n") else ""
+                lines[row - 1] = line[:col] + "# " + " ".join(ja_body.split()) + nl
+            cell.source = "".join(lines)
+    ja.metadata["translation"] = {"lang": "ja", "comments": comments}
+    return ja
+
+
+def translate_notebook(model, src: pathlib.Path, comments: bool = False, include_outputs: bool = False,
+                       force: bool = False) -> Tuple[pathlib.Path, pathlib.Path]:
+    """src.ipynb → src.ja.ipynb / src.ja.md。未キャッシュのセルだけ API に送る"""
+    nb = nbformat.reads(blob_store.read_text(src), as_version=4)
+    stem = src.name[: -len(".ipynb")]
+    cache_path = src.parent / (stem + CACHE_SUFFIX)
+    cache = {} if force else load_cache(cache_path)
+
+    segs = collect_segments(nb, comments)
+    todo = [(k, kind, text) for k, (kind, text) in segs.items() if k not in cache]
+    print(f"{len(segs)} segment(s), {len(segs) - len(todo)} cached, {len(todo)} to translate")
+
+    batches = batch_segments(todo, by_route=isinstance(model, ModelRouter))
+    dst_nb = src.parent / (stem + ".ja.ipynb")
+    dst_md = src.parent / (stem + ".ja.md")
+    model_name = getattr(model, "model_name", None)
+    try:
+        try:
+            for i, batch in enumerate(batches, 1):
+                print(f"  - translating batch {i}/{len(batches)} ({len(batch)} segment(s))")
+                with span("translate_batch", "translate", segments=len(batch)):
+                    for k, v in translate_batch(model, batch).items():
+                        cache[k] = apply_glossary_jp(v)
+        finally:
+            # 途中で失敗しても訳せた分は残す（使われなくなったセルの訳は捨てる）
+            save_cache(cache_path, {k: v for k, v in cache.items() if k in segs})
+
+        ja = apply_translations(nb, cache, comments)
+        write_text_atomic(dst_nb, nbformat.writes(ja))
+        ipynb_to_markdown(ja, dst_md, include_outputs=include_outputs, files_dir=stem + "_files")
+    except Exception as e:
+        get_index().record_translation(src, dst_md, model_name, status="failed", error=repr(e))
+        raise
+    get_index().record_translation(src, dst_md, model_name)
+    print(f"✅ wrote {dst_nb} / {dst_md}")
+    return dst_nb, dst_md
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--in", dest="in_dir", required=True, help="Input dir containing .ipynb files")
+    ap.add_argument("--glob", default="*.ipynb", help="Glob pattern (default: *.ipynb)")
+    ap.add_argument("--model", default=DEFAULT_MODEL,
+                    help="Gemini model name (default: gemini-1.5-flash or $GEMINI_MODEL); "
+                         "'auto' routes per batch and may use gemini-1.5-pro at higher cost")
+    ap.add_argument("--comments", action="store_true", help="Also translate comments in code cells")
+    ap.add_argument("--include-outputs", action="store_true", help="Include cell outputs in the .ja.md")
+    ap.add_argument("--force", action="store_true", help="Ignore the cell cache and translate everything")
+    args = ap.parse_args()
+
+    model = configure_client(args.model)
+    paths = [p for p in blob_store.glob(args.in_dir, args.glob) if not p.name.endswith(".ja.ipynb")]
+    if not paths:
+        print("No notebooks matched. Check --in and --glob.")
+        sys.exit(0)
+    for p in paths:
+        print(f"Translating: {p}")
+        translate_notebook(model, p, comments=args.comments, include_outputs=args.include_outputs,
+                           force=args.force)
+    print_route_report(model)
+
+
+if __name__ == "__main__":
+    main()